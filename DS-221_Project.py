@@ -1,27 +1,158 @@
 import pandas as pd                 # Data manipulation and analysis library
 import os                           # A way to interact with the os
 import numpy as np                  # Numerical computations and array handling
-from scipy.stats import skew        # Adavanced statistical calculations
-from scipy.stats import norm
-import scipy.stats as stats
 from termcolor import colored       # For coloured text printing
-import matplotlib.pyplot as plt     # For data visualisation
-import seaborn as sns               # Statistical visualisation
 import time                         # To wait create a delay when restarting system
+import sys                          # Command line arguments and exit codes
+import json                         # Reading batch grading config files
+import argparse                     # Command line parsing for batch grading
+import glob                         # Finding score files in directories for the multi-course pipeline
+import re                           # Cleaning up log lines of failed courses
+import io                           # Capturing the output of courses graded in worker processes
+import contextlib
+import concurrent.futures           # Process pool for grading many courses in parallel
+import hashlib                      # Content hashes for the score cache
+import shutil                       # Removing old score cache entries
+import importlib.util               # Checking for optional export packages
+import asyncio                      # Event loop of the grading service
+import urllib.parse                 # Query strings of service requests
+import signal                       # Stopping the grading service cleanly
+import collections                  # Ordered cache of score summaries
+import functools                    # Wrapping traced functions
+import tracemalloc                  # Peak memory of traced stages
+import math                         # Normal distribution for the curve optimizer
+import fractions                    # Exact score sums of incremental grading
+import bisect                       # Rank order of incremental grading
+import itertools
+import tempfile                     # Work files of out-of-core relative grading
+import warnings                     # Quiet all-NaN warnings of bootstrap intervals
 
 # f-string used is printing for direct insertion of variables into the string
 # .strip() is used in input validation to remove any leading or trailing white spaces
 # Lambda functions are used to create functions without requiring a def block
 # The code is structured in a way that the user can easily navigate through parts of the programSD
 
+# Headless mode is switched on by batch grading
+# No terminal clearing, no pauses and no plot windows so the program can run from cron or a job runner
+HEADLESS = False
+
+# How plots are produced
+# "show" opens a window for each plot, "file" saves them to PLOT_DIR, "none" skips plotting
+PLOT_MODE = "show"
+PLOT_DIR = "plots"
+PLOT_FORMAT = "png"                                                 # png or svg
+PLOT_PREFIX = ""                                                    # Added to every plot filename, e.g. the course name
+PLOT_POOL = None                                                    # Process pool rendering plot files off the grading path
+PLOT_JOBS = []                                                      # Plots waiting in the pool
+
+# matplotlib and seaborn are loaded by load_plotting() the first time a plot is drawn
+# so runs that skip plotting never pay for importing them
+plt = None                                                          # For data visualisation
+sns = None                                                          # Statistical visualisation
+
+# scipy.stats is loaded by load_scipy_stats() only when a distribution is needed
+stats = None                                                        # Adavanced statistical calculations
+
+# TRACING
+# Records the wall time, CPU time and peak memory of every stage of a run (reading, grading, printing, plotting, saving)
+# Switched on by the DS221_TRACE environment variable or the --trace option, both name the trace file to write
+# The trace is in Chrome's trace event format (open it in chrome://tracing or https://ui.perfetto.dev)
+# and a per-stage table is printed when the run ends
+# When tracing is off a traced function only checks TRACE_FILE before running
+# Stages that wait for the user (enter_to_continue) include the wait in their wall time but not in their CPU time
+# Peak memory comes from tracemalloc, which slows down code that allocates a lot (imports, plotting),
+# set DS221_TRACE_MEMORY=0 for timings without it
+# Courses graded by pipeline workers are traced in the workers, their events come back with each course and are
+# written to the same trace, one process (pid) per worker
+TRACE_FILE = os.environ.get('DS221_TRACE') or None
+TRACE_MEMORY = os.environ.get('DS221_TRACE_MEMORY', '1') != '0'
+TRACE_EVENTS = []                                                   # Finished stages as trace events
+TRACE_STACK = []                                                    # Peak memory of the stages still running
+
+# Time one stage of the run, details are added to the trace event
+@contextlib.contextmanager
+def trace_stage(name, **details):
+
+    if TRACE_FILE is None:
+        yield
+        return
+
+    if TRACE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    # The peak so far belongs to the enclosing stage, then the peak is measured again for this stage
+    start_memory, peak_memory = tracemalloc.get_traced_memory()
+    if TRACE_STACK:
+        TRACE_STACK[-1] = max(TRACE_STACK[-1], peak_memory)
+    tracemalloc.reset_peak()
+    TRACE_STACK.append(start_memory)
+
+    start_wall, start_cpu = time.perf_counter_ns(), time.process_time_ns()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter_ns() - start_wall, time.process_time_ns() - start_cpu
+        peak_memory = max(TRACE_STACK.pop(), tracemalloc.get_traced_memory()[1])
+        if TRACE_STACK:
+            TRACE_STACK[-1] = max(TRACE_STACK[-1], peak_memory)
+
+        TRACE_EVENTS.append({
+            'name': name,
+            'ph': 'X',                                              # A complete event with a duration
+            'ts': start_wall / 1000,
+            'dur': wall / 1000,
+            'pid': os.getpid(),
+            'tid': 0,
+            'args': {'cpu_ms': cpu / 1e6, 'peak_memory_kb': (peak_memory - start_memory) / 1024 if TRACE_MEMORY else None, **details}
+        })
+
+# Decorator tracing every call of a function as a stage named after the function
+def traced(function):
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if TRACE_FILE is None:
+            return function(*args, **kwargs)
+        with trace_stage(function.__name__):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+# Print the per-stage table and write the trace file
+def save_trace():
+
+    if TRACE_FILE is None or not TRACE_EVENTS:
+        return
+
+    with open(TRACE_FILE, 'w') as file:
+        json.dump({'traceEvents': TRACE_EVENTS, 'displayTimeUnit': 'ms'}, file)
+
+    stages = pd.DataFrame({
+        'stage': [event['name'] for event in TRACE_EVENTS],
+        'wall_ms': [event['dur'] / 1000 for event in TRACE_EVENTS],
+        'cpu_ms': [event['args']['cpu_ms'] for event in TRACE_EVENTS],
+        'peak_memory_kb': [event['args']['peak_memory_kb'] for event in TRACE_EVENTS]
+    })
+    report = stages.groupby('stage', sort=False).agg(
+        calls=('wall_ms', 'size'), wall_ms=('wall_ms', 'sum'), cpu_ms=('cpu_ms', 'sum'), peak_memory_kb=('peak_memory_kb', 'max')
+    ).sort_values('wall_ms', ascending=False)
+
+    print_coloured_line("Stage Timings", "yellow")
+    print(report.round(2).to_string())
+    print(colored(f"\nTrace saved to {TRACE_FILE}.", "green"))
+
 # Clear the terminal screen
 # nt for windows , clear for linux based systems
 def clear_terminal():
+    if HEADLESS:
+        return
     os.system('cls' if os.name == 'nt' else 'clear')       
 
 
 # Prompt the user to press enter
 def enter_to_continue():
+    if HEADLESS:
+        return
     print(colored("Press Enter to continue...", "green"))           # Print the message in green
     input()                                                         # Wait for user input
 
@@ -42,15 +173,63 @@ def print_coloured_line(text, color):
     print(colored(line, color))
     print()
 
-
-
-
+# Student names and scores kept in arrays instead of one dictionary per student
+# Names are interned, scores live in one contiguous float array that grows by doubling,
+# and a dictionary from name to row makes uniqueness checks and lookups O(1)
+# The grading functions accept a store directly and turn it into their Name and Score table in memory,
+# so entered scores never go through a CSV file and back
+class StudentScoreStore:
+
+    def __init__(self, capacity=64):
+        self.names = []
+        self.score_array = np.empty(capacity, dtype=np.float64)
+        self.index = {}                                             # Name -> row
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    # Scores of every student in row order, a view of the filled part of the array
+    @property
+    def scores(self):
+        return self.score_array[:len(self.names)]
+
+    # Add a student, names must be unique
+    def add(self, name, score):
+
+        if name in self.index:
+            raise ValueError(f"'{name}' has already been entered.")
+
+        row = len(self.names)
+        if row == len(self.score_array):
+            grown = np.empty(max(2 * row, 1), dtype=np.float64)
+            grown[:row] = self.score_array
+            self.score_array = grown
+
+        name = sys.intern(name)
+        self.score_array[row] = score
+        self.names.append(name)
+        self.index[name] = row
+
+    # The Name and Score table the grading functions work on
+    def to_frame(self):
+        return pd.DataFrame({'Name': self.names, 'Score': self.scores.copy()})
+
+    def save_csv(self, filename):
+        self.to_frame().to_csv(filename, index=False)
+
+# Grading functions take either a DataFrame or a StudentScoreStore
+def student_frame(student_data):
+    if isinstance(student_data, StudentScoreStore):
+        return student_data.to_frame()
+    return student_data
 
 # Create a new file from user input and store them in a csv
 def create_student_scores():
 
-    students = []                                                   # Stores student data in dictionary
-    student_names = set()                                           # Ensure name uniqueness
+    students = StudentScoreStore()                                  # Stores student names and scores, names are unique
     student_count = 0   
 
     # Outer loop to repeat until user is done entering student data
@@ -74,7 +253,7 @@ def create_student_scores():
                 clear_terminal()
                 continue 
 
-            if name in student_names:
+            if name in students:
                 print(colored("Name must be unique. This name has already been entered." , "red"))
                 enter_to_continue()
                 clear_terminal()
@@ -94,8 +273,7 @@ def create_student_scores():
 
             # Ensure the score is within the range 0-100
             if 0 <= score <= 100:
-                students.append({"Name": name, "Score": score})
-                student_names.add(name)                             # Add name to the set of unique names
+                students.add(name, score)
 
                 student_count += 1
 
@@ -116,25 +294,25 @@ def create_student_scores():
             enter_to_continue()
             clear_terminal()
 
-    if not students:
+    if len(students) == 0:
         clear_terminal()
         print_coloured_line("Student Scores Input", "green")
         print("No student data provided.")
         enter_to_continue();
         return None
     
-    # Create a new file with the student data
+    # Create a new file with the student data, grading continues from the store without reading it back
     filename = "student_scores.csv"
-    df = pd.DataFrame(students)
-    df.to_csv(filename , index=False)                   # Index false ensures no row indexs are written to the file
+    students.save_csv(filename)
 
     clear_terminal()
     print_coloured_line("Student Scores Saved", "green")
     print(f"Student scores saved to {filename}.")
     enter_to_continue()
-    return filename
+    return students
 
 # Read a file 
+@traced
 def read_file(filename):
 
     # Check if the file exists
@@ -147,13 +325,14 @@ def read_file(filename):
 
     # Attempt to read the file based on its extension
     try:
+        # Files read before are loaded from the score cache instead of being parsed again
         if filename.endswith('.csv'):
-            data = pd.read_csv(filename)
+            data = load_score_file(filename)
             print(f"Successfully read the CSV file: {filename}")
             enter_to_continue()
 
         elif filename.endswith(('.xls', '.xlsx')):
-            data = pd.read_excel(filename)
+            data = load_score_file(filename)
             print(f"Successfully read the Excel file: {filename}")
             enter_to_continue()
 
@@ -177,27 +356,750 @@ def read_file(filename):
         return data
 
     except Exception as e:
-        print(colored(f"An error occurred while reading the file: {e}" < "red"))
+        print(colored(f"An error occurred while reading the file: {e}" , "red"))
         return None
 
+# Columns needed for grading and the types used when streaming large files
+# Scores are read at full precision so streamed grades and output match grading in memory, names use the pandas
+# string type (Arrow backed when pyarrow is installed)
+SCORE_COLUMNS = ['Name', 'Score']
+SCORE_DTYPES = {'Name': 'str', 'Score': 'float64'}
+
+# Number of rows read at a time when streaming a file
+DEFAULT_CHUNKSIZE = 1_000_000
+
+# Read a file in chunks of rows so files larger than memory can be graded
+# Only the Name and Score columns are read, nothing is printed and no preview is shown
+def read_file_chunks(filename, chunksize=DEFAULT_CHUNKSIZE):
+
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"The file '{filename}' does not exist.")
+
+    if filename.endswith('.csv'):
+        yield from pd.read_csv(filename, usecols=SCORE_COLUMNS, dtype=SCORE_DTYPES, chunksize=chunksize)
+
+    elif filename.endswith(('.xls', '.xlsx')):
+        # Excel files cannot be read in chunks, so the sheet is read once and handed out in slices
+        data = pd.read_excel(filename, usecols=SCORE_COLUMNS, dtype=SCORE_DTYPES)
+        for start in range(0, len(data), chunksize):
+            yield data.iloc[start:start + chunksize]
+
+    else:
+        raise ValueError("Unsupported file format. Please provide a CSV or Excel file.")
+
+# Descriptive statistics of scores collected in a single pass
+# Count, mean, variance, skewness, kurtosis, min and max are updated from central moments (Welford / Pebay updates)
+# Two accumulators can be merged, so chunks of a file or results from different processes combine into one
+class RunningStats:
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0                                                   # Sums of powers of deviations from the mean
+        self.m3 = 0.0
+        self.m4 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    # Add an array of scores, missing scores are skipped like pandas does
+    def update(self, values):
+
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+
+        # Moments of this chunk around its own mean, then merged into the running totals
+        chunk = RunningStats()
+        chunk.count = len(values)
+        chunk.mean = values.mean()
+        deviations = values - chunk.mean
+        squared = deviations * deviations
+        chunk.m2 = squared.sum()
+        chunk.m3 = (squared * deviations).sum()
+        chunk.m4 = (squared * squared).sum()
+        chunk.min = values.min()
+        chunk.max = values.max()
+
+        return self.merge(chunk)
+
+    # Add a single score
+    def add(self, value):
+        return self.update([value])
+
+    # Take a single score back out, the merge formulas solved for the remaining scores
+    # min and max cannot be recovered this way and keep their old values
+    def remove(self, value):
+
+        if np.isnan(value):
+            return self
+        if self.count <= 1:
+            self.__init__()
+            return self
+
+        count = self.count
+        rest = count - 1
+        rest_mean = (count * self.mean - value) / rest
+        delta = value - rest_mean
+
+        m2 = self.m2 - delta ** 2 * rest / count
+        m3 = self.m3 - delta ** 3 * rest * (rest - 1) / count ** 2 + 3 * delta * m2 / count
+        m4 = (self.m4 - delta ** 4 * rest * (rest ** 2 - rest + 1) / count ** 3
+              - 6 * delta ** 2 * m2 / count ** 2 + 4 * delta * m3 / count)
+
+        self.count, self.mean = rest, rest_mean
+        self.m2, self.m3, self.m4 = max(m2, 0.0), m3, max(m4, 0.0)
+
+        return self
+
+    # Combine another accumulator into this one
+    def merge(self, other):
+
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.__dict__.update(other.__dict__)
+            return self
+
+        count_a, count_b = self.count, other.count
+        count = count_a + count_b
+        delta = other.mean - self.mean
+
+        m2 = self.m2 + other.m2 + delta ** 2 * count_a * count_b / count
+        m3 = (self.m3 + other.m3
+              + delta ** 3 * count_a * count_b * (count_a - count_b) / count ** 2
+              + 3 * delta * (count_a * other.m2 - count_b * self.m2) / count)
+        m4 = (self.m4 + other.m4
+              + delta ** 4 * count_a * count_b * (count_a ** 2 - count_a * count_b + count_b ** 2) / count ** 3
+              + 6 * delta ** 2 * (count_a ** 2 * other.m2 + count_b ** 2 * self.m2) / count ** 2
+              + 4 * delta * (count_a * other.m3 - count_b * self.m3) / count)
+
+        self.mean += delta * count_b / count
+        self.m2, self.m3, self.m4 = m2, m3, m4
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+        return self
+
+    # ddof=0 matches np.var, ddof=1 matches pandas
+    def variance(self, ddof=0):
+        if self.count - ddof <= 0:
+            return np.nan
+        return self.m2 / (self.count - ddof)
+
+    def std(self, ddof=0):
+        return np.sqrt(self.variance(ddof))
+
+    # Same as scipy.stats.skew with its default bias=True
+    def skewness(self):
+        if self.count == 0 or self.m2 == 0:
+            return np.nan
+        return np.sqrt(self.count) * self.m3 / self.m2 ** 1.5
+
+    # Excess kurtosis, same as scipy.stats.kurtosis with its defaults
+    def kurtosis(self):
+        if self.count == 0 or self.m2 == 0:
+            return np.nan
+        return self.count * self.m4 / self.m2 ** 2 - 3
+
+    def as_dict(self, ddof=1):
+        return {
+            "count": self.count,
+            "mean": self.mean if self.count else np.nan,
+            "variance": self.variance(ddof),
+            "std_dev": self.std(ddof),
+            "skewness": self.skewness(),
+            "kurtosis": self.kurtosis(),
+            "min": self.min if self.count else np.nan,
+            "max": self.max if self.count else np.nan
+        }
+
+# Streaming quantiles of scores with a fixed error bound
+# Scores are counted in bins of width `error` between low and high, so any quantile is off by at most error / 2
+# Memory depends only on the error bound, and sketches with the same settings merge by adding their counts
+# Scores outside [low, high] are counted in the first or last bin
+class QuantileSketch:
+
+    def __init__(self, error=0.01, low=0.0, high=100.0):
+        self.error = error
+        self.low = low
+        self.high = high
+        self.counts = np.zeros(max(int(np.ceil((high - low) / error)), 1), dtype=np.int64)
+
+    def update(self, values):
+
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        bins = np.clip(((values - self.low) / self.error).astype(np.int64), 0, len(self.counts) - 1)
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+
+        return self
+
+    def merge(self, other):
+
+        if (other.error, other.low, other.high) != (self.error, self.low, self.high):
+            raise ValueError("Only sketches with the same error bound and range can be merged.")
+        self.counts += other.counts
+
+        return self
+
+    # The q-th quantile (0 <= q <= 1) interpolated linearly between the two scores around it like np.quantile,
+    # each score taken as the midpoint of its bin
+    def quantile(self, q):
+
+        total = self.counts.sum()
+        if total == 0:
+            return np.nan
+
+        rank = q * (total - 1)
+        lower_rank, upper_rank = np.floor(rank), np.ceil(rank)
+        lower_bin, upper_bin = np.searchsorted(np.cumsum(self.counts), [lower_rank, upper_rank], side='right')
+        lower, upper = self.low + (lower_bin + 0.5) * self.error, self.low + (upper_bin + 0.5) * self.error
+
+        return lower + (rank - lower_rank) * (upper - lower)
+
+    def median(self):
+        return self.quantile(0.5)
+
+# SCORE CACHE
+# Parsed score files are kept on disk as one NumPy array per column, so a file read before is memory-mapped instead of parsed
+# The mapping is copy-on-write, so the returned frame can be changed like a parsed one without touching the cache
+# Every column comes back with the type it was parsed with, text columns with missing values or other objects are pickled
+# and loaded whole because they cannot be memory-mapped
+# Entries are stored under a hash of the file content so a touched or copied file with the same content reuses the same arrays,
+# and a record per file path keeps the size, modification time and content hash so an unchanged file is not hashed again
+# Records and entries are separate files, so processes reading files at the same time never overwrite each other's entries
+# The modification time of an entry is its last use, the least recently used entries are removed when the cache grows over
+# SCORE_CACHE_BUDGET bytes
+# Set SCORE_CACHE_DIR to None to turn the cache off
+
+SCORE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ds221_score_cache')
+SCORE_CACHE_BUDGET = 1024 ** 3                                      # 1 GB
+
+# Hash of the file content, read in blocks so large files are not loaded into memory
+def file_content_hash(filename):
+
+    digest = hashlib.blake2b(digest_size=16)
+
+    with open(filename, 'rb') as score_file:
+        for block in iter(lambda: score_file.read(1 << 20), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+# Record of a file path, named after a hash of the path
+def cache_record_filename(path):
+    path_hash = hashlib.blake2b(os.fsencode(path), digest_size=16).hexdigest()
+    return os.path.join(SCORE_CACHE_DIR, 'files', f"{path_hash}.json")
+
+# Content hash of a file, taken from its record when the file has the same size and modification time as last time
+def cached_content_hash(path):
+
+    file_stat = os.stat(path)
+    record_filename = cache_record_filename(path)
+
+    try:
+        with open(record_filename) as record_file:
+            record = json.load(record_file)
+        if record["size"] == file_stat.st_size and record["mtime_ns"] == file_stat.st_mtime_ns:
+            return record["hash"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass                                                        # Not read before, or the record is unreadable
+
+    content_hash = file_content_hash(path)
+
+    # Write the record to a temporary file first so a crash never leaves half a record behind
+    os.makedirs(os.path.dirname(record_filename), exist_ok=True)
+    temporary_filename = f"{record_filename}.{os.getpid()}.tmp"
+    with open(temporary_filename, 'w') as record_file:
+        json.dump({"path": path, "size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns, "hash": content_hash}, record_file)
+    os.replace(temporary_filename, record_filename)
+
+    return content_hash
+
+# Parse a CSV or Excel file
+@traced
+def parse_score_file(filename):
+
+    if filename.endswith('.csv'):
+        return pd.read_csv(filename)
+
+    return pd.read_excel(filename)
+
+# Objects in a one-dimensional object array, so lists of names or types are not turned into a table
+def object_array(values):
+
+    array = np.empty(len(values), dtype=object)
+    array[:] = list(values)
+
+    return array
+
+# Array a column is cached as, numbers and dates as they are and text without missing values as fixed width text,
+# so both can be memory-mapped, anything else as objects
+def cache_column_array(column):
+
+    if isinstance(column.dtype, np.dtype) and column.dtype.kind in 'biufcmM':
+        return column.to_numpy()
+
+    values = column.to_numpy(dtype=object)
+    if len(values) and pd.api.types.infer_dtype(values, skipna=False) == 'string':
+        return values.astype(str)
+
+    return values
+
+# Memory-map the cached columns of an entry, raises OSError when there is no such entry
+def open_cache_entry(content_hash):
+
+    entry_dir = os.path.join(SCORE_CACHE_DIR, content_hash)
+    column_names = np.load(os.path.join(entry_dir, 'columns.npy'), allow_pickle=True)
+    column_types = np.load(os.path.join(entry_dir, 'dtypes.npy'), allow_pickle=True)
+
+    columns = {}
+    for position, column_name in enumerate(column_names):
+        column_filename = os.path.join(entry_dir, f"column_{position}.npy")
+        try:
+            columns[column_name] = np.load(column_filename, mmap_mode='c').view(np.ndarray)       # Copy-on-write, writes stay in memory
+        except ValueError:
+            columns[column_name] = np.load(column_filename, allow_pickle=True)        # Objects cannot be memory-mapped
+    os.utime(entry_dir)                                                             # Marks the entry as recently used
+
+    # Columns read back in another type (text as objects) get the parsed type again
+    data = pd.DataFrame(columns, columns=list(column_names), copy=False)
+    for column_name, column_type in zip(column_names, column_types):
+        if data[column_name].dtype != column_type:
+            data[column_name] = data[column_name].astype(column_type)
+
+    return data
+
+# Save every column of parsed data as a new cache entry
+# Raises ValueError or TypeError when a column cannot be saved
+def write_cache_entry(content_hash, data):
+
+    entry_dir = os.path.join(SCORE_CACHE_DIR, content_hash)
+    temporary_dir = f"{entry_dir}.{os.getpid()}.tmp"
+    os.makedirs(temporary_dir, exist_ok=True)
+
+    try:
+        np.save(os.path.join(temporary_dir, 'columns.npy'), object_array(data.columns), allow_pickle=True)
+        np.save(os.path.join(temporary_dir, 'dtypes.npy'), object_array(data.dtypes), allow_pickle=True)
+        for position in range(data.shape[1]):
+            np.save(os.path.join(temporary_dir, f"column_{position}.npy"), cache_column_array(data.iloc[:, position]), allow_pickle=True)
+    except Exception:
+        shutil.rmtree(temporary_dir, ignore_errors=True)
+        raise
+
+    # Another process may have cached the same content in the meantime, its copy is kept unless it is not a complete entry
+    try:
+        os.rename(temporary_dir, entry_dir)
+    except OSError:
+        if not os.path.exists(os.path.join(entry_dir, 'dtypes.npy')):
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.rename(temporary_dir, entry_dir)
+        else:
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+
+# Remove least recently used entries until the cache fits its budget, the entry in use is kept
+# Every directory in the cache counts, so entries written by any process are removed in time
+def evict_cache_entries(keep_hash):
+
+    entries = []
+    for entry in os.scandir(SCORE_CACHE_DIR):
+        if entry.name == 'files' or not entry.is_dir():
+            continue
+        try:
+            entry_bytes = sum(item.stat().st_size for item in os.scandir(entry.path))
+            entries.append((entry.stat().st_mtime, entry.name, entry_bytes))
+        except OSError:
+            continue                                                # Removed by another process in the meantime
+
+    total_bytes = sum(entry_bytes for _, _, entry_bytes in entries)
+    removed = False
+
+    for _, content_hash, entry_bytes in sorted(entries):
+        if total_bytes <= SCORE_CACHE_BUDGET:
+            break
+        if content_hash == keep_hash:
+            continue
+
+        shutil.rmtree(os.path.join(SCORE_CACHE_DIR, content_hash), ignore_errors=True)
+        total_bytes -= entry_bytes
+        removed = True
+
+    if not removed:
+        return
+
+    # Forget file paths whose entry was removed
+    for record in os.scandir(os.path.join(SCORE_CACHE_DIR, 'files')):
+        try:
+            with open(record.path) as record_file:
+                content_hash = json.load(record_file)["hash"]
+            if not os.path.isdir(os.path.join(SCORE_CACHE_DIR, content_hash)):
+                os.remove(record.path)
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+
+# Read a score file through the cache, the data is the same as parsing the file
+@traced
+def load_score_file(filename):
+
+    if SCORE_CACHE_DIR is None:
+        return parse_score_file(filename)
+
+    try:
+        os.makedirs(SCORE_CACHE_DIR, exist_ok=True)
+        content_hash = cached_content_hash(os.path.abspath(filename))
+    except OSError as e:
+        # A cache that cannot be written should never stop a file from being read
+        print(colored(f"Score cache unavailable ({e}), reading the file directly.", "yellow"))
+        return parse_score_file(filename)
+
+    try:
+        return open_cache_entry(content_hash)
+    except (OSError, ValueError, EOFError):
+        pass                                                        # Not cached, or removed by another process
+
+    data = parse_score_file(filename)
+
+    try:
+        write_cache_entry(content_hash, data)
+        evict_cache_entries(content_hash)
+    except OSError as e:
+        print(colored(f"Score cache unavailable ({e}), the file is not cached.", "yellow"))
+    except (ValueError, TypeError):
+        pass                                                        # Files with columns that cannot be saved are parsed every time
+
+    return data
+
 # Save grades to CSV
+@traced
 def save_grades_to_csv(student_data, filename="graded_students.csv"):
 
     try:
-        save_data = student_data[['Name', 'Score', 'Grade']]                        # Save only the relevant columns
-        save_data.to_csv(filename, index=False)                                     # Save the data to a CSV file
+        # Picking the columns inside to_csv avoids copying them into a new frame first
+        student_data.to_csv(filename, columns=['Name', 'Score', 'Grade'], index=False)   # Save only the relevant columns
         print(colored(f"Graded student data saved to {filename}.", "green"))
         
     except Exception as e:
         print(colored(f"Error saving file: {e}", "red"))
 
+# EXPORT
+# Graded data can be written as CSV (plain, gzip or zstd compressed), Parquet or Feather
+# The format comes from the file extension, grades are written as categorical (dictionary encoded) columns
+# Parquet and Feather need the optional pyarrow package, zstd compressed CSV needs zstandard
+
+# Extension, pandas CSV compression and optional package for every export format
+EXPORT_FORMATS = {
+    'csv': ('.csv', None, None),
+    'csv.gz': ('.csv.gz', 'gzip', None),
+    'csv.zst': ('.csv.zst', 'zstd', 'zstandard'),
+    'parquet': ('.parquet', None, 'pyarrow'),
+    'feather': ('.feather', None, 'pyarrow')
+}
+
+# Export format of a filename, e.g. "grades.csv.gz" is "csv.gz"
+def export_format_from_filename(filename):
+
+    # Longest extensions first so ".csv.gz" is not taken for ".gz"
+    for file_format, (extension, _, _) in sorted(EXPORT_FORMATS.items(), key=lambda item: -len(item[1][0])):
+        if filename.endswith(extension):
+            return file_format
+
+    raise ValueError(f"Unsupported export format for '{filename}', use one of: {', '.join(EXPORT_FORMATS)}")
+
+# Write a frame of columns in the given format
+# The frame is built from the existing columns without copying them
+def write_export_frame(columns, filename, file_format):
+
+    _, compression, required_package = EXPORT_FORMATS[file_format]
+
+    if required_package and importlib.util.find_spec(required_package) is None:
+        raise ImportError(f"Writing {file_format} files needs the '{required_package}' package.")
+
+    export_data = pd.DataFrame(columns, copy=False)
+
+    if file_format == 'parquet':
+        export_data.to_parquet(filename, index=False)
+    elif file_format == 'feather':
+        export_data.to_feather(filename)
+    else:
+        export_data.to_csv(filename, index=False, compression=compression)
+
+# Grades as a categorical column, categorical grades are used as they are
+def categorical_grades(grades):
+
+    if isinstance(grades.dtype, pd.CategoricalDtype):
+        return grades
+
+    return grades.astype('category')
+
+# Save the Name, Score and Grade columns in the format given by the file extension
+@traced
+def export_grades(student_data, filename):
+
+    write_export_frame({
+        'Name': student_data['Name'],
+        'Score': student_data['Score'],
+        'Grade': categorical_grades(student_data['Grade'])
+    }, filename, export_format_from_filename(filename))
+
+    print(colored(f"Graded student data saved to {filename}.", "green"))
+
+# Save several gradings of the same students in one file with a single write
+# variants maps a name to a grade column, e.g. {'Relative': ..., 'Z-Score': ...}, which becomes "Grade (Relative)"
+@traced
+def export_grade_variants(student_data, variants, filename):
+
+    columns = {'Name': student_data['Name'], 'Score': student_data['Score']}
+    for variant, grades in variants.items():
+        columns[f"Grade ({variant})"] = categorical_grades(grades)
+
+    write_export_frame(columns, filename, export_format_from_filename(filename))
+
+    print(colored(f"Graded student data saved to {filename}.", "green"))
+
+# Import matplotlib and seaborn on first use
+# Anything other than interactive windows uses the Agg backend, which renders files without a display
+def load_plotting():
+
+    global plt, sns
+
+    if plt is None:
+        import matplotlib
+
+        if PLOT_MODE != "show" or HEADLESS:
+            matplotlib.use('Agg')
+
+        import matplotlib.pyplot as pyplot
+        import seaborn
+
+        plt, sns = pyplot, seaborn
+
+    return plt
+
+# Import scipy.stats on first use
+def load_scipy_stats():
+
+    global stats
+
+    if stats is None:
+        import scipy.stats
+
+        stats = scipy.stats
+
+    return stats
+
+# Whether plots should be drawn at all
+def plots_enabled():
+    return PLOT_MODE == "file" or (PLOT_MODE == "show" and not HEADLESS)
+
+# Start drawing a plot on its own reusable figure
+# Each plot name keeps one figure, which is cleared and drawn again instead of creating a new figure every run
+def start_figure(plot_name):
+
+    load_plotting()
+    figure = plt.figure(num=plot_name, figsize=(8, 6))
+    figure.clf()
+
+    return figure
+
+# Show the finished plot, or save it to PLOT_DIR when rendering to files
+@traced
+def finish_figure(plot_name):
+
+    if PLOT_MODE == "file":
+        os.makedirs(PLOT_DIR, exist_ok=True)
+        plot_filename = os.path.join(PLOT_DIR, f"{PLOT_PREFIX}{plot_name}.{PLOT_FORMAT}")
+        plt.savefig(plot_filename, format=PLOT_FORMAT)
+        remember_figure(plot_name, plot_filename)
+    else:
+        plt.show()
+
+# Hand a plot to the render pool when one is running
+# Only what the plot draws is sent to the worker (the grade column or the score summary), returns True if the plot was queued
+def queue_plot(plot_function, plot_data):
+
+    if PLOT_POOL is None:
+        return False
+
+    PLOT_JOBS.append(PLOT_POOL.submit(render_plot_job, plot_function.__name__, plot_data, PLOT_DIR, PLOT_FORMAT, PLOT_PREFIX,
+                                      FIGURE_MEMO_KEY))
+
+    return True
+
+# Runs in a render pool worker, draws one plot to a file
+def render_plot_job(plot_name, plot_data, plot_dir, plot_format, plot_prefix, figure_key=None):
+
+    global PLOT_MODE, PLOT_DIR, PLOT_FORMAT, PLOT_PREFIX, HEADLESS, PLOT_POOL, FIGURE_MEMO_KEY
+    PLOT_MODE, PLOT_DIR, PLOT_FORMAT, PLOT_PREFIX, HEADLESS = "file", plot_dir, plot_format, plot_prefix, True
+    FIGURE_MEMO_KEY = figure_key                                        # Plots of a remembered grading are remembered with it
+    PLOT_POOL = None                                                    # A forked worker must draw the plot itself, not queue it again
+
+    globals()[plot_name](plot_data)
+
+# Start a pool of worker processes that render plot files while grading carries on
+def start_plot_pool(workers=None):
+
+    global PLOT_POOL
+    PLOT_POOL = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+
+# Wait for every queued plot and shut the render pool down
+# Returns the number of plots that failed to render
+def wait_for_plots():
+
+    global PLOT_POOL
+
+    failed = 0
+    for job in concurrent.futures.as_completed(PLOT_JOBS):
+        if job.exception() is not None:
+            print(colored(f"Error rendering plot: {job.exception()}", "red"))
+            failed += 1
+    PLOT_JOBS.clear()
+
+    if PLOT_POOL is not None:
+        PLOT_POOL.shutdown()
+        PLOT_POOL = None
+
+    return failed
+
+# PLOT SUMMARIES
+# The score plots draw from a summary computed once per set of scores instead of from every student,
+# so drawing costs the same for 30 or 3 million students
+#   histogram  30 equal bins between the lowest and highest score, added up to the 10 or 15 bins a plot shows
+#   box        quartiles, whiskers at 1.5 IQR and the scores outside them (matplotlib's boxplot rules)
+#   kde        Gaussian KDE with Scott's bandwidth, the scores binned on a grid and smoothed with an FFT
+# Summaries are cached by a fingerprint of the scores, so the relative and z-score plots share one summary
+
+SUMMARY_HISTOGRAM_BINS = 30                                         # Divisible by the 10 and 15 bins of the plots
+KDE_GRID_SIZE = 1024                                                # Grid the scores are binned on for the KDE
+KDE_POINTS = 200                                                    # Points of the drawn KDE line, like seaborn
+SUMMARY_FLIER_LIMIT = 500                                           # Most outliers drawn on a boxplot
+SUMMARY_CACHE_SIZE = 16
+SUMMARY_CACHE = collections.OrderedDict()                           # Fingerprint -> summary, least recently used first
+
+# Fingerprint of a set of scores, equal scores in the same order give the same fingerprint
+def score_fingerprint(scores):
+    scores = np.ascontiguousarray(scores, dtype=np.float64)
+    return hashlib.blake2b(scores.tobytes(), digest_size=16).hexdigest()
+
+# Gaussian KDE evaluated on KDE_POINTS points between the lowest and highest score
+# Scores are binned on a grid that reaches 3 bandwidths past both ends and convolved with the kernel through an FFT,
+# so the cost depends on the grid and not on scores x points
+def binned_kde(scores, bandwidth):
+
+    low, high = scores.min() - 3 * bandwidth, scores.max() + 3 * bandwidth
+    grid_counts, grid_edges = np.histogram(scores, bins=KDE_GRID_SIZE, range=(low, high))
+    grid = (grid_edges[:-1] + grid_edges[1:]) / 2
+    spacing = grid[1] - grid[0]
+
+    # Kernel on every grid offset, zero padded so the circular convolution does not wrap around
+    offsets = np.arange(-KDE_GRID_SIZE + 1, KDE_GRID_SIZE) * spacing
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    size = 4 * KDE_GRID_SIZE
+    smoothed = np.fft.irfft(np.fft.rfft(grid_counts, size) * np.fft.rfft(kernel, size), size)
+    density = np.maximum(smoothed[KDE_GRID_SIZE - 1:2 * KDE_GRID_SIZE - 1], 0) / len(scores)
+
+    points = np.linspace(scores.min(), scores.max(), KDE_POINTS)
+    return points, np.interp(points, grid, density)
+
+# Box statistics in the form matplotlib's bxp draws
+def box_statistics(scores):
+
+    q1, median, q3 = np.percentile(scores, [25, 50, 75])
+    reach = 1.5 * (q3 - q1)
+    inside = scores[(scores >= q1 - reach) & (scores <= q3 + reach)]
+    fliers = np.unique(scores[(scores < q1 - reach) | (scores > q3 + reach)])
+
+    # Keep an even spread of the distinct outliers when there are too many to draw
+    if len(fliers) > SUMMARY_FLIER_LIMIT:
+        fliers = fliers[np.linspace(0, len(fliers) - 1, SUMMARY_FLIER_LIMIT).astype(int)]
+
+    return {
+        'med': median, 'q1': q1, 'q3': q3,
+        'whislo': inside.min(), 'whishi': inside.max(),
+        'fliers': fliers, 'label': ''
+    }
+
+# Summary of a column of scores, missing scores are left out
+# Returns None when there are no scores
+@traced
+def score_summary(scores):
+
+    scores = np.asarray(scores, dtype=np.float64)
+    fingerprint = score_fingerprint(scores)
+
+    if fingerprint in SUMMARY_CACHE:
+        SUMMARY_CACHE.move_to_end(fingerprint)
+        return SUMMARY_CACHE[fingerprint]
+
+    scores = scores[~np.isnan(scores)]
+    if len(scores) == 0:
+        return None
+
+    bin_counts, bin_edges = np.histogram(scores, bins=SUMMARY_HISTOGRAM_BINS)
+    score_stats = RunningStats().update(scores)
+
+    # Scott's rule like scipy.stats.gaussian_kde, a single repeated score gets a nominal bandwidth
+    sample_std = score_stats.std(ddof=1)
+    bandwidth = sample_std * len(scores) ** (-1 / 5) if sample_std > 0 else 1.0
+
+    kde_points, kde_density = binned_kde(scores, bandwidth)
+
+    summary = {
+        'count': len(scores),
+        'mean': score_stats.mean,
+        'std_dev': score_stats.std(),                               # Population standard deviation like np.std
+        'bin_counts': bin_counts,
+        'bin_edges': bin_edges,
+        'box': box_statistics(scores),
+        'kde_points': kde_points,
+        'kde_density': kde_density
+    }
+
+    SUMMARY_CACHE[fingerprint] = summary
+    if len(SUMMARY_CACHE) > SUMMARY_CACHE_SIZE:
+        SUMMARY_CACHE.popitem(last=False)
+
+    return summary
+
+# Histogram of a summary with fewer bins, bins must divide SUMMARY_HISTOGRAM_BINS
+def summary_histogram(summary, bins):
+
+    width = SUMMARY_HISTOGRAM_BINS // bins
+    return summary['bin_edges'][::width], summary['bin_counts'].reshape(bins, width).sum(axis=1)
+
+# Summary a score plot draws from, plots drawn in a render worker are given the summary itself
+# Prints an error and returns None when there are no scores to plot
+def plot_summary(student_data):
+
+    if isinstance(student_data, dict):
+        return student_data
+
+    # Ensure the 'Score' column exists in the dataset
+    if 'Score' not in student_data.columns:
+        print(colored("Error: No 'Score' column in the dataset.", "red"))
+        return None
+
+    summary = score_summary(student_data['Score'])
+
+    # Check if there are scores available
+    if summary is None:
+        print(colored("Error: No scores available to plot.", "red"))
+
+    return summary
+
 # Plot grade distribution
+@traced
 def plot_grade_distribution(student_data):
 
+    if not plots_enabled() or replay_figure('grade_distribution') or queue_plot(plot_grade_distribution, student_data[['Grade']]):
+        return
+
     grade_counts = student_data['Grade'].value_counts()                             # Count the occurences of each grade
+    grade_counts = grade_counts[grade_counts > 0]                                   # Categorical grades also count unused grades
     total_students = len(student_data)                                              # Total number of students
 
-    plt.figure(figsize=(8, 6))                                                      # Set the figure size
+    start_figure('grade_distribution')                                              # Reused figure, 8 x 6 inches
 
     # If there are fewer than 30 students, show a pie chart
     if total_students < 30:
@@ -209,7 +1111,7 @@ def plot_grade_distribution(student_data):
 
     else:
         # Otherwise, show a bar chart
-        plt.bar(grade_counts.index, grade_counts.values, color='skyblue')           # Create a bar chart with grades on x-axis and their count on y-axis
+        plt.bar(grade_counts.index.astype(str), grade_counts.values, color='skyblue')  # Create a bar chart with grades on x-axis and their count on y-axis
         plt.title('Grade Distribution (Bar Chart)', fontsize=16)                    # Title
         plt.xlabel('Grades', fontsize=14)                                           # X-axis title
         plt.ylabel('Number of Students', fontsize=14)                               # Y-axis title
@@ -217,26 +1119,26 @@ def plot_grade_distribution(student_data):
         plt.yticks(fontsize=12)                                                     # Adjust y-axis font size
         plt.grid(axis='y', linestyle='--', alpha=0.7)                               # Add gridlines for better readability on y-axis
 
-    plt.show()
+    finish_figure('grade_distribution')
 
 # Show score histogram with a normal line to show how well the dataset follows a normal distribution
+@traced
 def plot_normal_curve(student_data):
-    # Ensure the 'Score' column exists in the dataset
-    if 'Score' not in student_data.columns:
-        print(colored("Error: No 'Score' column in the dataset.", "red"))
+    if not plots_enabled() or replay_figure('normal_curve'):
         return
 
-    # Extract the 'Score' column from the student_data DataFrame
-    student_scores = student_data['Score'].values
-
-    # Check if there are scores available
-    if len(student_scores) == 0:
-        print(colored("Error: No scores available to plot.", "red"))
+    # Scores are summarised once and the summary is drawn, with the normality diagnostics of the scores
+    summary = plot_summary(student_data)
+    if summary is None:
+        return
+    if 'diagnostics' not in summary:
+        summary = {**summary, 'diagnostics': score_diagnostics(student_data['Score'])}
+    if queue_plot(plot_normal_curve, summary):
         return
 
-    # Calculate mean and standard deviation of the scores using numpy
-    mean_score = np.mean(student_scores)
-    std_deviation = np.std(student_scores)
+    # Mean and standard deviation of the scores
+    mean_score = summary['mean']
+    std_deviation = summary['std_dev']
 
     # Generate a range of values for the x-axis (scores range)
     # The range is set to 4 standard deviations from the mean
@@ -244,14 +1146,29 @@ def plot_normal_curve(student_data):
     x = np.linspace(mean_score - 4*std_deviation, mean_score + 4*std_deviation, 1000)
 
     # Generate normal distribution based on mean and standard deviation using scipy.stats
-    y = norm.pdf(x, mean_score, std_deviation)
+    y = load_scipy_stats().norm.pdf(x, mean_score, std_deviation)
 
     # Plotting the normal curve
-    plt.figure(figsize=(8, 6))
+    start_figure('normal_curve')
     plt.plot(x, y, label='Normal Distribution', color='blue')
 
     # Plotting the histogram of the students' scores
-    plt.hist(student_scores, bins=15, density=True, alpha=0.6, color='green', edgecolor='black', label='Student Scores')
+    bin_edges, bin_counts = summary_histogram(summary, 15)
+    plt.hist(bin_edges[:-1], bins=bin_edges, weights=bin_counts, density=True, alpha=0.6, color='green', edgecolor='black', label='Student Scores')
+
+    # A clearly closer fit is drawn next to the normal curve, and the test results are shown in the corner
+    diagnostics = summary['diagnostics']
+    if diagnostics is not None:
+        best_fit = diagnostics['fits'][diagnostics['best_fit']]
+        if diagnostics['best_fit'] != 'normal':
+            fitted = getattr(load_scipy_stats(), best_fit['distribution'])(*best_fit['parameters'])
+            plt.plot(x, fitted.pdf(x), label=f"Closest fit ({diagnostics['best_fit']})", color='darkorange', linestyle='--')
+
+        tests = diagnostics['tests']
+        plt.gca().text(0.02, 0.97, f"Shapiro-Wilk p = {tests['shapiro']['p_value']:.3g}\n"
+                                   f"Anderson-Darling p = {tests['anderson']['p_value']:.3g}\n"
+                                   f"KS D = {tests['ks']['statistic']:.3f}",
+                       transform=plt.gca().transAxes, va='top', fontsize=10, bbox={'facecolor': 'white', 'alpha': 0.8})
 
     # Adding titles and labels
     plt.title('Normal Curve of Student Scores', fontsize=16)
@@ -261,27 +1178,24 @@ def plot_normal_curve(student_data):
 
     # Show the plot
     plt.grid(True, linestyle='--', alpha=0.7)
-    plt.show()
+    finish_figure('normal_curve')
 
 # Plot boxplot of student scores
+@traced
 def plot_boxplot(student_data):
 
-    # Ensure the 'Score' column exists in the dataset
-    if 'Score' not in student_data.columns:
-        print(colored("Error: No 'Score' column in the dataset.", "red"))
+    if not plots_enabled() or replay_figure('boxplot'):
         return
 
-    # Extract the 'Score' column from the student_data DataFrame
-    student_scores = student_data['Score']
-
-    # Check if there are scores available
-    if len(student_scores) == 0:
-        print(colored("Error: No scores available to plot.", "red"))
+    summary = plot_summary(student_data)
+    if summary is None or queue_plot(plot_boxplot, summary):
         return
 
-    # Create the boxplot using Seaborn
-    plt.figure(figsize=(8, 6))
-    sns.boxplot(x=student_scores, color='skyblue')
+    # Draw the boxplot from the precomputed box statistics
+    start_figure('boxplot')
+    plt.gca().bxp([summary['box']], orientation='horizontal', patch_artist=True, widths=0.8,
+                  boxprops={'facecolor': 'skyblue'}, medianprops={'color': 'black'})
+    plt.yticks([])
 
     # Adding titles and labels
     plt.title('Boxplot of Student Scores', fontsize=16)
@@ -289,525 +1203,3394 @@ def plot_boxplot(student_data):
     
     # Show the plot
     plt.grid(True, linestyle='--', alpha=0.7)
-    plt.show()
+    finish_figure('boxplot')
 
 # Plot score distribution
+@traced
 def plot_score_distribution(student_data):
-    plt.figure(figsize=(8, 6))
-    plt.hist(student_data['Score'], bins=10, color='lightcoral', edgecolor='black')         # Create a histogram with 10 bars
+    if not plots_enabled() or replay_figure('score_distribution'):
+        return
+
+    summary = plot_summary(student_data)
+    if summary is None or queue_plot(plot_score_distribution, summary):
+        return
+
+    start_figure('score_distribution')
+    bin_edges, bin_counts = summary_histogram(summary, 10)
+    plt.hist(bin_edges[:-1], bins=bin_edges, weights=bin_counts, color='lightcoral', edgecolor='black')  # Create a histogram with 10 bars
     plt.title('Score Distribution', fontsize=16)
     plt.xlabel('Scores', fontsize=14)
     plt.ylabel('Number of Students', fontsize=14)
     plt.xticks(fontsize=12)
     plt.yticks(fontsize=12)
     plt.grid(axis='y', linestyle='--', alpha=0.7)
-    plt.show()
+    finish_figure('score_distribution')
 
+# Score histogram with a density line, shown after z-score grading
+# The density line is scaled to student counts per bin like seaborn's histplot(kde=True)
+@traced
+def plot_z_score_distribution(student_data):
+    if not plots_enabled() or replay_figure('z_score_distribution'):
+        return
 
-# Calculate absolute grades
-def calculate_absolute_grades(student_data, grade_percentages):
+    summary = plot_summary(student_data)
+    if summary is None or queue_plot(plot_z_score_distribution, summary):
+        return
 
-    try:
-        # Ensure required columns are present
-        if 'Name' not in student_data.columns or 'Score' not in student_data.columns:
-            print(colored("Error: The dataset must contain 'Name' and 'Score' columns.", "red"))
-            enter_to_continue()
-            return student_data                                                                     # Returning the original data as a fallback
+    start_figure('z_score_distribution')
+    bin_edges = summary['bin_edges']
+    plt.hist(bin_edges[:-1], bins=bin_edges, weights=summary['bin_counts'], color=sns.color_palette()[0], alpha=0.75, edgecolor='white')
+    plt.plot(summary['kde_points'], summary['kde_density'] * summary['count'] * (bin_edges[1] - bin_edges[0]), color=sns.color_palette()[0])
+    plt.title("Adjusted Distribution After Z-Score Grading")
+    plt.xlabel('Score')
+    plt.ylabel('Frequency')
+    finish_figure('z_score_distribution')
+
+
+# DISTRIBUTION DIAGNOSTICS
+# How well the scores follow a normal distribution, checked before z-score grading puts them on a normal curve
+#   tests  Kolmogorov-Smirnov and Anderson-Darling against the fitted normal, Shapiro-Wilk on a sample of at most
+#          DIAGNOSTICS_SAMPLE scores (its p-value is only accurate up to 5000)
+#   normal the decision for --method auto, from the skewness and kurtosis, and the Shapiro-Wilk test as well for
+#          cohorts of up to NORMALITY_TEST_LIMIT students
+#          The tests reject whole-number scores more often the more students share a score, so larger cohorts
+#          are judged by their shape alone, and the decision does not flip at some cohort size
+#   qq     sample quantiles against normal quantiles at QQ_POINTS plotting positions
+#   fits   normal, skew-normal and beta on [0, 100], fitted by their moments and compared by their KS distance
+# The scores are sorted once and every CDF is evaluated on the distinct scores only, with each score weighted by
+# how many students have it, so rounded scores of a large cohort cost about as much as a small one
+# The KS p-value takes the normal parameters as known, so it is conservative (Lilliefors would reject more often)
+# Diagnostics are cached by the score fingerprint like the plot summaries
+
+DIAGNOSTICS_SAMPLE = 5000
+DIAGNOSTICS_SEED = 221
+QQ_POINTS = 200
+CDF_GRID_SIZE = 1024                                                # More distinct scores than this use an interpolated CDF
+NORMALITY_ALPHA = 0.05                                              # Shapiro-Wilk rejecting at this level fails small cohorts
+NORMALITY_TEST_LIMIT = 100                                          # Largest cohort the Shapiro-Wilk test decides for
+NORMALITY_MAX_SKEW = 0.5                                            # Shape limits, widened to two standard errors
+NORMALITY_MAX_KURTOSIS = 1.0                                        # of the sample skewness and kurtosis for small cohorts
+FIT_MARGIN = 0.9                                                    # An alternative fit must cut the KS distance by 10%
+DIAGNOSTICS_CACHE = collections.OrderedDict()                       # Fingerprint -> diagnostics, least recently used first
+
+# KS distance between the scores and a CDF evaluated at the distinct scores
+# below and reached are the shares of students under and up to each distinct score
+def ks_distance(cdf, below, reached):
+    return float(max(np.max(reached - cdf), np.max(cdf - below)))
+
+# CDF of a fitted distribution at the distinct scores
+# With many distinct scores it is evaluated on CDF_GRID_SIZE points and interpolated, which stays within about 1e-5
+# of the exact CDF and keeps slow CDFs like the skew-normal's from being evaluated for every score
+def fitted_cdf(distribution, parameters, distinct):
+
+    if len(distinct) <= CDF_GRID_SIZE:
+        return distribution.cdf(distinct, *parameters)
+
+    grid = np.linspace(distinct[0], distinct[-1], CDF_GRID_SIZE)
+    return np.interp(distinct, grid, distribution.cdf(grid, *parameters))
+
+# Anderson-Darling statistic of the distinct scores against a normal distribution
+# The sum over students is grouped by distinct score: students first..last of a score add up (2i - 1) and (2n + 1 - 2i)
+def anderson_darling(z, first, last, total):
+
+    norm = load_scipy_stats().norm
+    lower_weights = last ** 2 - (first - 1) ** 2
+    upper_weights = (last - first + 1) * (2 * total + 1) - (last * (last + 1) - (first - 1) * first)
+
+    return float(-total - (lower_weights @ norm.logcdf(z) + upper_weights @ norm.logsf(z)) / total)
+
+# p-value of the Anderson-Darling statistic for a normal with estimated mean and standard deviation (D'Agostino and Stephens)
+def anderson_p_value(statistic, total):
+
+    adjusted = statistic * (1 + 0.75 / total + 2.25 / total ** 2)
+
+    # The fitted curve turns up again past its minimum at 153, by then the p-value is 0 in any float
+    if adjusted >= 153:
+        return 0.0
+    if adjusted >= 0.6:
+        return float(np.exp(1.2937 - 5.709 * adjusted + 0.0186 * adjusted ** 2))
+    if adjusted >= 0.34:
+        return float(np.exp(0.9177 - 4.279 * adjusted - 1.38 * adjusted ** 2))
+    if adjusted >= 0.2:
+        return float(1 - np.exp(-8.318 + 42.796 * adjusted - 59.938 * adjusted ** 2))
+
+    return float(1 - np.exp(-13.436 + 101.14 * adjusted - 223.73 * adjusted ** 2))
+
+# Normal, skew-normal and beta distributions with the mean, standard deviation and skewness of the scores
+# Returns {name: (scipy distribution, parameters)}, beta is left out when a score is outside [0, 100]
+def moment_fits(mean, std_dev, skewness, low, high):
+
+    fits = {'normal': ('norm', (mean, std_dev))}
+
+    # Skew-normal shape from the skewness, which a skew-normal keeps below 0.995
+    skew = float(np.clip(skewness, -0.99, 0.99))
+    power = abs(skew) ** (2 / 3)
+    delta = np.sign(skew) * np.sqrt(np.pi / 2 * power / (power + ((4 - np.pi) / 2) ** (2 / 3)))
+    scale = std_dev / np.sqrt(1 - 2 * delta ** 2 / np.pi)
+    fits['skew-normal'] = ('skewnorm', (delta / np.sqrt(1 - delta ** 2), mean - scale * delta * np.sqrt(2 / np.pi), scale))
+
+    # Beta on [0, 100] with the same mean and variance
+    share_mean, share_variance = mean / 100, (std_dev / 100) ** 2
+    if 0 <= low and high <= 100 and 0 < share_variance < share_mean * (1 - share_mean):
+        common = share_mean * (1 - share_mean) / share_variance - 1
+        fits['beta'] = ('beta', (share_mean * common, (1 - share_mean) * common, 0, 100))
+
+    return fits
+
+# Normality tests, QQ quantiles and distribution fits of a column of scores, missing scores are left out
+# Returns None when there are fewer than 3 scores or they are all equal
+@traced
+def score_diagnostics(scores):
+
+    scores = np.asarray(scores, dtype=np.float64)
+    fingerprint = score_fingerprint(scores)
+
+    if fingerprint in DIAGNOSTICS_CACHE:
+        DIAGNOSTICS_CACHE.move_to_end(fingerprint)
+        return DIAGNOSTICS_CACHE[fingerprint]
+
+    stats = load_scipy_stats()
+    sorted_scores = SortedScoreIndex(scores).sorted_scores
+    total = len(sorted_scores)
+    if total < 3 or sorted_scores[0] == sorted_scores[-1]:
+        return None
 
-        # Sort grades in descending order of percentages for comparison
-        sorted_grades = sorted(grade_percentages.items(), key=lambda x: x[1], reverse=True)         # Lambda creates function without requiring a def block
+    score_stats = RunningStats().update(sorted_scores)
+    mean, std_dev = score_stats.mean, score_stats.std()
+
+    # Distinct scores with the positions of their first and last student, counted from 1
+    starts = np.flatnonzero(np.r_[True, sorted_scores[1:] != sorted_scores[:-1]])
+    distinct = sorted_scores[starts]
+    first, last = starts + 1, np.r_[starts[1:], total]
+    below, reached = (first - 1) / total, last / total
+
+    # Every fit is judged by its KS distance, the normal fit also gives the KS and Anderson-Darling tests
+    fits = {}
+    for name, (distribution, parameters) in moment_fits(mean, std_dev, score_stats.skewness(), distinct[0], distinct[-1]).items():
+        cdf = fitted_cdf(getattr(stats, distribution), parameters, distinct)
+        fits[name] = {'distribution': distribution, 'parameters': [float(value) for value in parameters],
+                      'ks': ks_distance(cdf, below, reached)}
+
+    ks = fits['normal']['ks']
+    anderson = anderson_darling((distinct - mean) / std_dev, first, last, total)
+
+    # Shapiro-Wilk on a random sample of the scores when there are too many
+    sample = sorted_scores
+    if total > DIAGNOSTICS_SAMPLE:
+        sample = np.random.default_rng(DIAGNOSTICS_SEED).choice(sorted_scores, DIAGNOSTICS_SAMPLE, replace=False)
+    shapiro = stats.shapiro(sample)
+
+    # Sample quantiles at Blom's plotting positions against the normal quantiles of the fitted normal
+    positions = (np.arange(1, min(total, QQ_POINTS) + 1) - 0.375) / (min(total, QQ_POINTS) + 0.25)
+    qq_sample = np.interp(positions * (total - 1), np.arange(total), sorted_scores)
+    qq_theoretical = stats.norm.ppf(positions, mean, std_dev)
+
+    # The normal curve is kept unless another fit is clearly closer
+    best_fit = min(fits, key=lambda name: fits[name]['ks'])
+    if fits[best_fit]['ks'] > FIT_MARGIN * ks:
+        best_fit = 'normal'
+
+    tests = {
+        'shapiro': {'statistic': float(shapiro.statistic), 'p_value': float(shapiro.pvalue), 'sample': len(sample)},
+        'anderson': {'statistic': anderson, 'p_value': anderson_p_value(anderson, total)},
+        'ks': {'statistic': ks, 'p_value': float(stats.kstwo.sf(ks, total))}
+    }
 
-        # Assign grades to students
-        # Lambda function takes score as argument, iterates over the score and assign a grade depending on the grade thereshold defined by user
-        student_data['Grade'] = student_data['Score'].apply(
-            lambda score: next((grade for grade, threshold in sorted_grades if score >= threshold), 'F')
-        )
+    # Every cohort must have a shape close to normal, small cohorts must pass the Shapiro-Wilk test as well
+    max_skew = max(NORMALITY_MAX_SKEW, 2 * np.sqrt(6 / total))
+    max_kurtosis = max(NORMALITY_MAX_KURTOSIS, 2 * np.sqrt(24 / total))
+    shape_normal = abs(score_stats.skewness()) <= max_skew and abs(score_stats.kurtosis()) <= max_kurtosis
+    tests_normal = total > NORMALITY_TEST_LIMIT or tests['shapiro']['p_value'] >= NORMALITY_ALPHA
+
+    diagnostics = {
+        'count': total,
+        'mean': float(mean),
+        'std_dev': float(std_dev),
+        'skewness': float(score_stats.skewness()),
+        'kurtosis': float(score_stats.kurtosis()),
+        'tests': tests,
+        'qq': {'theoretical': qq_theoretical, 'sample': qq_sample},
+        'fits': fits,
+        'best_fit': best_fit,
+        'normal': bool(shape_normal and tests_normal)
+    }
 
-        # Calculate grade distribution and show it
-        grade_counts = student_data['Grade'].value_counts()
-        total_students = len(student_data)
+    DIAGNOSTICS_CACHE[fingerprint] = diagnostics
+    if len(DIAGNOSTICS_CACHE) > SUMMARY_CACHE_SIZE:
+        DIAGNOSTICS_CACHE.popitem(last=False)
 
-        clear_terminal()
-        print_coloured_line("Absolute Grading Results", "magenta")
+    return diagnostics
 
-        # Overall occurences of each grade
-        print("Grade Distribution:")
-        for grade, count in grade_counts.items():
-            percentage = (count / total_students) * 100
-            print(f"Grade {grade}: {count} students ({percentage:.2f}%)")
+def print_diagnostics(diagnostics):
 
-        # Each individual students grades
-        print("\nStudent Grades:")
-        for _, row in student_data.iterrows():
-            print(f"{row['Name']}: {row['Score']} -> Grade {row['Grade']}")
+    print("\nNormality Diagnostics:")
+    print(f"Skewness: {diagnostics['skewness']:.2f}, excess kurtosis: {diagnostics['kurtosis']:.2f}")
 
-        # Plot grade distribution and score distribution
-        plot_grade_distribution(student_data)
-        plot_score_distribution(student_data)
-        plot_boxplot(student_data)
+    for name, label in [('shapiro', 'Shapiro-Wilk'), ('anderson', 'Anderson-Darling'), ('ks', 'Kolmogorov-Smirnov')]:
+        test = diagnostics['tests'][name]
+        print(f"{label}: {test['statistic']:.4f} (p = {test['p_value']:.4f})")
 
-        enter_to_continue()
+    print("Fits (KS distance): " + ", ".join(f"{name} {fit['ks']:.4f}" for name, fit in diagnostics['fits'].items()))
+    print(f"Closest fit: {diagnostics['best_fit']}, scores {'look' if diagnostics['normal'] else 'do not look'} normal")
 
-        # Returning the updated dataframe with grades
-        return student_data
+# Grading method for --method auto, z-score grading for scores that look normal and relative grading otherwise
+def choose_grading_method(scores):
 
-    except Exception as e:
-        print(colored(f"An error occurred while calculating grades: {e}", "red"))
-        enter_to_continue()
-        return student_data                                                                               # Returning the original data as a fallback
+    diagnostics = score_diagnostics(scores)
+    if diagnostics is None:
+        print(colored("Too few distinct scores to check for normality, using relative grading.", "yellow"))
+        return 'relative'
 
-# Relative grading
-def calculate_relative_grades(student_data, grade_percentages):
-    try:
-        # Ensure required columns are present
-        if 'Name' not in student_data.columns or 'Score' not in student_data.columns:
-            print(colored("Error: The dataset must contain 'Name' and 'Score' columns.", "red"))
-            enter_to_continue()
-            return
-        
-        # Sort students by scores in descending order
-        student_data = student_data.sort_values(by='Score', ascending=False).reset_index(drop=True)        # Reset Index removes old indexes
+    print_diagnostics(diagnostics)
+    method = 'z-score' if diagnostics['normal'] else 'relative'
+    print(colored(f"Automatic method: {method} grading.", "cyan"))
 
-        # Calculate the number of students per grade based on percentages
-        total_students = len(student_data)                                                                 # Get number of students
-        cumulative_students = 0                                                                            # Track cumulative students assigned a grade
-        grade_assignments = []                                                                             # Stores each students grade according to index
+    return method
 
-        print_coloured_line("Relative Grading Results", "cyan")
-        
-        # Assigns a grade to each student depending on the thereshold defined by the user
-        for grade, percentage in grade_percentages.items():
-            num_students_for_grade = round(percentage / 100 * total_students)                              # Calculate number of students for the grade
-            start_idx = cumulative_students                                                                # Start index for the grade
-            end_idx = min(cumulative_students + num_students_for_grade, total_students)                    # End index for the grade
-
-            # Ensure that last grade covers any remaining students (due to rounding)
-            grade_assignments += [grade] * (end_idx - start_idx)
-            cumulative_students += num_students_for_grade
-
-        # Handle any remaining students due to rounding
-        # Automatically assigned a F due to descending order of scores
-        if len(grade_assignments) < total_students:
-            remaining_students = total_students - len(grade_assignments)
-            grade_assignments += [list(grade_percentages.keys())[-1]] * remaining_students
-
-        # Assign grades back to the dataframe
-        student_data['Grade'] = grade_assignments
-
-        # Reorder the grades to ensure top scores get "A"
-        # Helps avoid situations where some students get a grade that is not part of the predefined grades
-        student_data['Grade'] = student_data['Grade'].apply(
-            lambda grade: list(grade_percentages.keys())[-1] if grade == "F" else grade
-        )
+# GRADE MEMO
+# A grading is remembered under a key made of the score fingerprint, the grading method and a canonical form of the scale,
+# so grading the same scores with the same scale again (another run of main() on the same file, or a batch run again)
+# reuses the grades, the statistics and the saved plots instead of grading and drawing everything again
+# The last GRADE_MEMO_SIZE gradings are kept in memory, and on disk in GRADE_MEMO_DIR until it grows over GRADE_MEMO_BUDGET bytes,
+# least recently used gradings are removed first
+# Only plots saved to files are remembered, plot windows are always drawn again
+# Set GRADE_MEMO_DIR to None to remember gradings in memory only, and GRADE_MEMO_SIZE to 0 as well to turn the memo off
 
-        # Calculate grade distribution
-        grade_counts = student_data['Grade'].value_counts()
-        print("Grade Distribution:")
-        for grade, count in grade_counts.items():
-            print(f"Grade {grade}: {count} students")
+GRADE_MEMO_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ds221_grade_memo')
+GRADE_MEMO_BUDGET = 256 * 1024 ** 2                                 # 256 MB
+GRADE_MEMO_SIZE = 8
+GRADE_MEMO = collections.OrderedDict()                              # Key -> grading, least recently used first
+FIGURE_MEMO_KEY = None                                              # Grading the plots being drawn belong to
 
-        # Calculate descriptive statistics using numpy and scipy
-        mean_score = np.mean(student_data['Score'])
-        variance_score = np.var(student_data['Score'])
-        standard_deviation_score = np.std(student_data['Score'])
-        skewness_score = skew(student_data['Score'])
+# The scale in a fixed form, the grades keep their order because relative grading depends on it
+# Z-score grading is keyed by the z-score policy in use
+def canonical_grade_scale(method, grade_percentages):
 
-        print(f"\nDescriptive Statistics for Scores:")
-        print(f"Mean: {mean_score:.2f}")
-        print(f"Variance: {variance_score:.2f}")
-        print(f"Standard Deviation: {standard_deviation_score:.2f}")
-        print(f"Skewness: {skewness_score:.2f}")
+    if method == 'z-score':
+        grade_percentages = z_score_policy()
 
-        # Display the students' grades
-        print("\nStudent Grades:")
-        for _, row in student_data.iterrows():
-            print(f"{row['Name']}: {row['Score']} -> Grade {row['Grade']}")
+    if isinstance(grade_percentages, GradingPolicy):
+        return {
+            'scale': grade_percentages.scale,
+            'grades': [[grade, float(value)] for grade, value in grade_percentages.grades.items()],
+            'default': grade_percentages.default
+        }
 
-        # Plot grade distribution and scores
-        plot_normal_curve(student_data)
-        plot_grade_distribution(student_data)
-        plot_score_distribution(student_data)
-        plot_boxplot(student_data)
+    return {'grades': [[grade, float(value)] for grade, value in grade_percentages.items()]}
 
-        enter_to_continue()
+def grade_memo_key(scores, method, grade_percentages):
 
-        # Return updated data frame with assigned grades
-        return student_data
+    scale = json.dumps(canonical_grade_scale(method, grade_percentages), sort_keys=True)
+    key = f"{method}\n{scale}\n{score_fingerprint(scores)}"
 
-    except Exception as e:
-        print(colored(f"An error occurred while calculating relative grades: {e}", "red"))
-        enter_to_continue()
-        return None
-    
-# Calculate z-scores and applu updated grades
-def apply_z_score_grading(student_data):
-    # Ensure the 'Score' column exists in the dataset
-    if 'Score' not in student_data.columns:
-        print("Error: No 'Score' column in the dataset.")
-        return
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
 
-    # Calculate mean and standard deviation of scores
-    mean_score = student_data['Score'].mean()
-    std_dev = student_data['Score'].std()
+# A remembered grading from memory or disk, None when the grading is not known
+def load_grade_memo(key):
 
-    # Calculate z-scores for each student
-    student_data['z_score'] = (student_data['Score'] - mean_score) / std_dev
+    if key in GRADE_MEMO:
+        GRADE_MEMO.move_to_end(key)
+        return GRADE_MEMO[key]
 
-    # Assign letter grades based on z-scores
-    # Grades are assigned by how much the z-score deviates from the mean
-    def assign_grade(z):
-        if z >= 1.0:
-            return 'A'
-        elif z >= 0.0:
-            return 'B'
-        elif z >= -1.0:
-            return 'C'
-        else:
-            return 'D'
-    
-    # Apply grade assignment function
-    student_data['Relative Grade'] = student_data['z_score'].apply(assign_grade)
-    
-    # Calculate how many students moved and track grade shifts
-    before_grades = student_data['Grade'].copy()                                                # Original grades
-    moved_students = {}                                                                         # Store students who moved grades
-
-    # Store moved students
-    for index, row in student_data.iterrows():
-        original_grade = row['Grade']
-        new_grade = row['Relative Grade']
-        if original_grade != new_grade:
-            moved_students[row['Name']] = {'from': original_grade, 'to': new_grade}
-
-    # Print out grade movements
-    if moved_students:
-        print(f"Grade Changes (students who were moved):")
-        for student, grades in moved_students.items():
-            print(f"{student} moved from {grades['from']} to {grades['to']}")
-    
-    # Generate new statistics after grading adjustment
-    new_statistics = {
-        "mean": student_data['Score'].mean(),
-        "std_dev": student_data['Score'].std(),
-        "median": student_data['Score'].median(),
-        "min": student_data['Score'].min(),
-        "max": student_data['Score'].max()
-    }
+    if GRADE_MEMO_DIR is None:
+        return None
 
-    # Print new statistics
-    print("\nNew Statistics after Z-Score Adjustment:")
-    for stat, value in new_statistics.items():
-        print(f"{stat.capitalize()}: {value:.2f}")
+    entry_dir = os.path.join(GRADE_MEMO_DIR, key)
+    try:
+        with np.load(os.path.join(entry_dir, 'grades.npz'), allow_pickle=False) as arrays:
+            grading = {
+                'codes': arrays['codes'],
+                'categories': arrays['categories'].tolist(),
+                'statistics': json.loads(str(arrays['statistics']))
+            }
+        os.utime(entry_dir)                                         # Marks the grading as recently used
+    except (OSError, KeyError, ValueError):
+        return None
 
-    # Grade column after applying Z-score grading
-    student_data['Grade'] = student_data['Relative Grade']
+    grading['figures'] = {}
+    remember_grading(key, grading)
+
+    return grading
+
+def remember_grading(key, grading):
+
+    if GRADE_MEMO_SIZE <= 0:
+        return
+
+    GRADE_MEMO[key] = grading
+    GRADE_MEMO.move_to_end(key)
+    if len(GRADE_MEMO) > GRADE_MEMO_SIZE:
+        GRADE_MEMO.popitem(last=False)
+
+# Write a file of a grading to disk, through a temporary file so a crash never leaves half a file behind
+def write_grade_memo_file(key, filename, write):
+
+    entry_dir = os.path.join(GRADE_MEMO_DIR, key)
+    os.makedirs(entry_dir, exist_ok=True)
+
+    temporary_filename = os.path.join(entry_dir, f"{os.getpid()}.tmp.{filename}")
+    write(temporary_filename)
+    os.replace(temporary_filename, os.path.join(entry_dir, filename))
+
+# Remove least recently used gradings until the memo fits its budget, the grading in use is kept
+def evict_grade_memo(keep_key):
+
+    entries = []
+    for entry in os.scandir(GRADE_MEMO_DIR):
+        try:
+            entry_bytes = sum(item.stat().st_size for item in os.scandir(entry.path))
+            entries.append((entry.stat().st_mtime, entry.name, entry_bytes))
+        except OSError:
+            continue                                                # Removed by another process in the meantime
+
+    total_bytes = sum(entry_bytes for _, _, entry_bytes in entries)
+
+    for _, key, entry_bytes in sorted(entries):
+        if total_bytes <= GRADE_MEMO_BUDGET:
+            break
+        if key == keep_key:
+            continue
+
+        shutil.rmtree(os.path.join(GRADE_MEMO_DIR, key), ignore_errors=True)
+        total_bytes -= entry_bytes
+
+def save_grade_memo(key, grading):
+
+    remember_grading(key, grading)
+
+    if GRADE_MEMO_DIR is None:
+        return
+
+    try:
+        write_grade_memo_file(key, 'grades.npz', lambda filename: np.savez(
+            filename,
+            codes=grading['codes'],
+            categories=np.array(grading['categories'], dtype=str),
+            statistics=np.array(json.dumps(grading['statistics']))
+        ))
+        evict_grade_memo(key)
+
+    except OSError as e:
+        # A memo that cannot be written should never stop the grading
+        print(colored(f"Grade memo unavailable ({e}), the grading is not saved.", "yellow"))
+
+# Grading of the scores from the memo, grade() is called when the grading is not known
+# grade() returns {'codes', 'categories', 'statistics'}, the statistics must be plain numbers
+# Returns the memo key (None with the memo turned off) and the grading
+def memoized_grading(scores, method, grade_percentages, grade):
+
+    if GRADE_MEMO_SIZE <= 0 and GRADE_MEMO_DIR is None:
+        return None, grade()
+
+    key = grade_memo_key(scores, method, grade_percentages)
+    grading = load_grade_memo(key)
+
+    if grading is None:
+        grading = grade()
+        grading['figures'] = {}
+        save_grade_memo(key, grading)
+
+    return key, grading
+
+# Grade column of a remembered grading, the codes are copied so the memo never changes with the data frame
+def memo_grades(grading, index):
+
+    grades = pd.Categorical.from_codes(grading['codes'].copy(), categories=grading['categories'])
+    return pd.Series(grades, index=index, name='Grade')
+
+# Plots drawn inside the block are remembered with the grading of the key
+@contextlib.contextmanager
+def figure_memo(key):
+
+    global FIGURE_MEMO_KEY
+    previous_key, FIGURE_MEMO_KEY = FIGURE_MEMO_KEY, key
+
+    try:
+        yield
+    finally:
+        FIGURE_MEMO_KEY = previous_key
+
+# Save a remembered plot to PLOT_DIR instead of drawing it, returns True if the plot was remembered
+def replay_figure(plot_name):
+
+    if FIGURE_MEMO_KEY is None or PLOT_MODE != "file":
+        return False
+
+    filename = f"{plot_name}.{PLOT_FORMAT}"
+    grading = GRADE_MEMO.get(FIGURE_MEMO_KEY)
+    figure = grading['figures'].get(filename) if grading else None
+
+    if figure is None and GRADE_MEMO_DIR is not None:
+        try:
+            with open(os.path.join(GRADE_MEMO_DIR, FIGURE_MEMO_KEY, filename), 'rb') as figure_file:
+                figure = figure_file.read()
+        except OSError:
+            return False
+
+    if figure is None:
+        return False
+
+    os.makedirs(PLOT_DIR, exist_ok=True)
+    with open(os.path.join(PLOT_DIR, f"{PLOT_PREFIX}{filename}"), 'wb') as plot_file:
+        plot_file.write(figure)
+
+    return True
+
+# Remember a plot file that was just saved with the grading it belongs to
+def remember_figure(plot_name, plot_filename):
+
+    if FIGURE_MEMO_KEY is None:
+        return
+
+    filename = f"{plot_name}.{PLOT_FORMAT}"
+    with open(plot_filename, 'rb') as plot_file:
+        figure = plot_file.read()
+
+    grading = GRADE_MEMO.get(FIGURE_MEMO_KEY)
+    if grading is not None:
+        grading['figures'][filename] = figure
+
+    if GRADE_MEMO_DIR is not None:
+        try:
+            write_grade_memo_file(FIGURE_MEMO_KEY, filename, lambda temporary_filename: shutil.copyfile(plot_filename, temporary_filename))
+        except OSError:
+            pass                                                    # The plot is drawn again next time
+
+# STUDENT REPORTS
+# Per-student lines are formatted in one list and written with a single write
+# REPORT_MODE decides how many students are listed:
+#   "full"    every student
+#   "summary" no per-student lines, only the distribution and statistics
+#   "top"     the REPORT_TOP_N highest scores
+#   "page"    page REPORT_PAGE of REPORT_TOP_N students in file order
+# Reports go to stdout, or are appended to REPORT_FILE when it is set
+REPORT_MODES = ['full', 'summary', 'top', 'page']
+REPORT_MODE = "full"
+REPORT_TOP_N = 20
+REPORT_PAGE = 1
+REPORT_FILE = None
+
+# Rows of a table to list in the report, or None in summary mode
+# sort_column picks the rows with the highest values in top mode, otherwise the first rows are taken
+def select_report_rows(table, sort_column=None):
+
+    if REPORT_MODE == "summary":
+        return None
+
+    if REPORT_MODE == "top":
+        if sort_column is not None:
+            return table.nlargest(REPORT_TOP_N, sort_column)                       # Partial sort, only the top rows are ordered
+        return table.head(REPORT_TOP_N)
+
+    if REPORT_MODE == "page":
+        start = (REPORT_PAGE - 1) * REPORT_TOP_N
+        return table.iloc[start:start + REPORT_TOP_N]
+
+    return table
+
+# Write a finished report in one go
+def write_report(text):
+
+    if REPORT_FILE is None:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+    else:
+        with open(REPORT_FILE, 'a') as report_file:
+            report_file.write(text)
+
+# Heading, lines and a note about students left out of the listing
+def format_report(title, lines, total_rows):
+
+    if lines is None:
+        return f"\n{title}: {total_rows} rows, listing skipped in summary mode\n"
+
+    text = f"\n{title}:\n" + "\n".join(lines) + "\n"
+    if len(lines) < total_rows:
+        text += f"... {len(lines)} of {total_rows} shown ({REPORT_MODE} mode)\n"
+
+    return text
+
+# List each student's score and grade
+@traced
+def print_student_grades(student_data):
+
+    rows = select_report_rows(student_data, 'Score')
+
+    lines = None
+    if rows is not None:
+        # Lines are formatted from plain lists, so a missing name, score or grade prints as nan like any other value
+        lines = [f"{name}: {score} -> Grade {grade}"
+                 for name, score, grade in zip(rows['Name'].tolist(), rows['Score'].tolist(), rows['Grade'].tolist())]
+
+    write_report(format_report("Student Grades", lines, len(student_data)))
+
+# List the students who moved grade
+@traced
+def print_grade_movements(movements):
+
+    rows = select_report_rows(movements)
+
+    lines = None
+    if rows is not None:
+        lines = [f"{name} moved from {before} to {after}"
+                 for name, before, after in zip(rows['Name'].tolist(), rows['From'].tolist(), rows['To'].tolist())]
+
+    write_report(format_report("Moved Students", lines, len(movements)))
+
+# GRADING POLICIES
+# A policy lists its grades with the lowest value that earns each one, and the grade for anything below them
+# The scale is "score" for grading scores directly or "z-score" for grading by standard deviations from the mean
+#
+#   {"name": "plus-minus", "scale": "score", "grades": {"A+": 97, "A": 93, "A-": 90, ...}, "default": "F"}
+#
+# Policies are declared in JSON (or YAML when PyYAML is installed) or picked from BUILTIN_POLICIES by name
+# Each policy is compiled once into ascending thresholds and a table of grade codes,
+# and grading with any policy is the same binary search however many grades it has
+
+POLICY_SCALES = ['score', 'z-score']
+
+BUILTIN_POLICIES = {
+    'letters': {'scale': 'score', 'grades': {'A': 80, 'B': 70, 'C': 60, 'D': 50}, 'default': 'F'},
+    'plus-minus': {'scale': 'score', 'grades': {'A+': 97, 'A': 93, 'A-': 90, 'B+': 87, 'B': 83, 'B-': 80, 'C+': 77, 'C': 73,
+                                                'C-': 70, 'D+': 67, 'D': 63, 'D-': 60}, 'default': 'F'},
+    'pass-fail': {'scale': 'score', 'grades': {'P': 50}, 'default': 'F'},
+    'z-letters': {'scale': 'z-score', 'grades': {'A': 1.0, 'B': 0.0, 'C': -1.0}, 'default': 'D'}
+}
+
+# Policy of z-score grading, a built-in policy name or a policy file
+Z_SCORE_POLICY = 'z-letters'
+
+# A grading policy compiled for the threshold kernel
+class GradingPolicy:
+
+    def __init__(self, name, scale, grades, default):
+
+        self.name = name
+        self.scale = scale
+        self.default = default
+
+        # Sort grades in descending order of thresholds for comparison
+        sorted_grades = sorted(grades.items(), key=lambda x: x[1], reverse=True)                   # Lambda creates function without requiring a def block
+        self.grades = dict(sorted_grades)
+        self.categories = list(dict.fromkeys([grade for grade, _ in sorted_grades] + [default]))  # Highest grade first, no duplicates
+
+        # Ascending thresholds for the binary search, the last of equal thresholds is the grade entered first
+        ascending_grades = sorted_grades[::-1]
+        self.thresholds = np.array([threshold for _, threshold in ascending_grades], dtype=np.float64)
+
+        # Grade code for each threshold, the extra code at the end is picked by position -1 (below every threshold)
+        self.threshold_codes = np.array([self.categories.index(grade) for grade, _ in ascending_grades]
+                                        + [self.categories.index(default)], dtype=np.int16)
+
+    # Map every score to a grade code in one pass
+    # Each score is placed with a binary search (np.searchsorted) over the thresholds
+    # Gives the same grade as checking the thresholds from highest to lowest and taking the first one the score reaches
+    # Scores below every threshold (or missing) get the default grade
+    def grade_codes(self, scores):
+
+        scores = np.asarray(scores, dtype=np.float64)
+        positions = np.searchsorted(self.thresholds, scores, side='right') - 1                   # Index of the highest threshold reached
+        positions[np.isnan(scores)] = -1                                                          # NaN never reaches a threshold
+
+        return self.threshold_codes[positions]
+
+# Check a policy declaration and compile it, raises ValueError if it is not a valid policy
+def compile_policy(definition, name='custom'):
+
+    if not isinstance(definition, dict) or not isinstance(definition.get('grades'), dict) or not definition['grades']:
+        raise ValueError(f"Policy '{name}' needs a 'grades' mapping of grade to minimum value.")
+
+    scale = definition.get('scale', 'score')
+    if scale not in POLICY_SCALES:
+        raise ValueError(f"Policy '{name}' has an unknown scale '{scale}', use one of: {', '.join(POLICY_SCALES)}")
+
+    grades = {}
+    for grade, threshold in definition['grades'].items():
+        if isinstance(threshold, bool) or not isinstance(threshold, (int, float)):
+            raise ValueError(f"Policy '{name}' needs a number for grade {grade}.")
+        if scale == 'score' and not 0 <= threshold <= 100:
+            raise ValueError(f"Value for grade {grade} must be between 0 and 100.")
+        grades[str(grade)] = float(threshold)
+
+    return GradingPolicy(definition.get('name', name), scale, grades, str(definition.get('default', 'F')))
+
+# Load a policy by built-in name or from a JSON or YAML file
+# Policies are compiled once and reused by every grading run, a policy file is read once per run
+@functools.lru_cache(maxsize=None)
+def load_policy(policy):
+
+    if policy in BUILTIN_POLICIES:
+        return compile_policy(BUILTIN_POLICIES[policy], policy)
+
+    if policy.endswith(('.yaml', '.yml')):
+        if importlib.util.find_spec('yaml') is None:
+            raise ImportError("Reading YAML policies needs the 'pyyaml' package.")
+        import yaml
+        with open(policy) as policy_file:
+            definition = yaml.safe_load(policy_file)
+
+    elif policy.endswith('.json'):
+        with open(policy) as policy_file:
+            definition = json.load(policy_file)
+
+    else:
+        raise ValueError(f"Unknown policy '{policy}', use one of {', '.join(BUILTIN_POLICIES)} or a .json or .yaml file.")
+
+    return compile_policy(definition, os.path.splitext(os.path.basename(policy))[0])
+
+# The compiled policy of a grading scale typed in or given on the command line, the same scale compiles once
+@functools.lru_cache(maxsize=64)
+def compile_grade_scale(grade_items, default_grade):
+    return GradingPolicy('custom', 'score', dict(grade_items), default_grade)
+
+# Policy used by z-score grading
+def z_score_policy():
+    return load_policy(Z_SCORE_POLICY)
+
+# Map every score to a grade code in one pass with a grading policy or a {grade: minimum score} scale
+# Equal thresholds go to the grade entered first, scores below every threshold (or missing) get the default grade
+def absolute_grade_codes(scores, grade_percentages, default_grade='F'):
+
+    policy = grade_percentages
+    if not isinstance(policy, GradingPolicy):
+        policy = compile_grade_scale(tuple(grade_percentages.items()), default_grade)
+
+    return policy.grade_codes(scores), list(policy.categories)
+
+# Absolute grades as a categorical column, highest grade first
+@traced
+def absolute_grades(scores, grade_percentages, default_grade='F'):
+
+    codes, categories = absolute_grade_codes(scores, grade_percentages, default_grade)
+    grades = pd.Categorical.from_codes(codes, categories=categories)
+
+    # Keep the index of a Series so the grades line up with the rows they came from
+    if isinstance(scores, pd.Series):
+        return pd.Series(grades, index=scores.index, name='Grade')
+
+    return grades
+
+# Absolute grading of a column of scores in the form the grade memo keeps
+def absolute_grading(scores, grade_percentages):
+
+    codes, categories = absolute_grade_codes(scores, grade_percentages)
+    return {'codes': codes, 'categories': categories, 'statistics': {}}
+
+# Calculate absolute grades
+@traced
+def calculate_absolute_grades(student_data, grade_percentages):
+
+    try:
+        student_data = student_frame(student_data)
+
+        # Ensure required columns are present
+        if 'Name' not in student_data.columns or 'Score' not in student_data.columns:
+            print(colored("Error: The dataset must contain 'Name' and 'Score' columns.", "red"))
+            enter_to_continue()
+            return student_data                                                                     # Returning the original data as a fallback
+
+        # Assign grades to all students at once with a binary search over the grade thresholds, or reuse a remembered grading
+        memo_key, grading = memoized_grading(student_data['Score'], 'absolute', grade_percentages,
+                                             lambda: absolute_grading(student_data['Score'], grade_percentages))
+        student_data['Grade'] = memo_grades(grading, student_data.index)
+
+        # Calculate grade distribution and show it
+        grade_counts = student_data['Grade'].value_counts()
+        grade_counts = grade_counts[grade_counts > 0]                                               # Categorical counts include unused grades
+        total_students = len(student_data)
+
+        clear_terminal()
+        print_coloured_line("Absolute Grading Results", "magenta")
+
+        # Overall occurences of each grade
+        print("Grade Distribution:")
+        for grade, count in grade_counts.items():
+            percentage = (count / total_students) * 100
+            print(f"Grade {grade}: {count} students ({percentage:.2f}%)")
+
+        # Each individual students grades
+        print_student_grades(student_data)
+
+        # Plot grade distribution and score distribution
+        with figure_memo(memo_key):
+            plot_grade_distribution(student_data)
+            plot_score_distribution(student_data)
+            plot_boxplot(student_data)
+
+        enter_to_continue()
+
+        # Returning the updated dataframe with grades
+        return student_data
+
+    except Exception as e:
+        print(colored(f"An error occurred while calculating grades: {e}", "red"))
+        enter_to_continue()
+        return student_data                                                                               # Returning the original data as a fallback
+
+# Absolute grading of a file read in chunks
+# Each chunk is graded and appended to the output file, only the grade counts and running statistics are kept
+# so memory use depends on the chunk size and not on the size of the file
+# The median comes from a QuantileSketch with the given error bound, pass quantile_error=None to skip it
+@traced
+def stream_absolute_grades(filename, grade_percentages, output_filename, chunksize=DEFAULT_CHUNKSIZE, quantile_error=0.01):
+
+    grade_counts = None
+    score_stats = RunningStats()
+    score_sketch = QuantileSketch(quantile_error) if quantile_error else None
+
+    for chunk_number, chunk in enumerate(read_file_chunks(filename, chunksize)):
+        codes, categories = absolute_grade_codes(chunk['Score'], grade_percentages)
+
+        # Grade counts of this chunk, minlength keeps unused grades in the count
+        chunk_counts = np.bincount(codes, minlength=len(categories))
+        grade_counts = chunk_counts if grade_counts is None else grade_counts + chunk_counts
+
+        # Running statistics for the summary
+        score_stats.update(chunk['Score'])
+        if score_sketch is not None:
+            score_sketch.update(chunk['Score'])
+
+        # Write the graded chunk, the header only goes with the first chunk
+        graded_chunk = chunk.assign(Grade=pd.Categorical.from_codes(codes, categories=categories))
+        # Compressed CSV appends a new compressed member per chunk, which reads back as one file
+        graded_chunk.to_csv(output_filename, columns=['Name', 'Score', 'Grade'], index=False,
+                            mode='w' if chunk_number == 0 else 'a', header=chunk_number == 0,
+                            compression=EXPORT_FORMATS[export_format_from_filename(output_filename)][1])
+
+    if grade_counts is None:
+        raise ValueError(f"The file '{filename}' has no rows to grade.")
+
+    # Summary statistics of all chunks, the standard deviation matches pandas (sample standard deviation)
+    statistics = score_stats.as_dict(ddof=1)
+    if score_sketch is not None:
+        statistics["median"] = score_sketch.median()
+
+    return pd.Series(grade_counts, index=categories, name='count'), statistics
+
+# Print the grade distribution and statistics of a streamed grading run
+def print_stream_summary(grade_counts, statistics, title="Absolute Grading Results"):
+
+    print_coloured_line(title, "magenta")
+
+    total_students = grade_counts.sum()
+    print("Grade Distribution:")
+    for grade, count in grade_counts[grade_counts > 0].items():
+        percentage = (count / total_students) * 100
+        print(f"Grade {grade}: {count} students ({percentage:.2f}%)")
+
+    print("\nStatistics:")
+    for stat, value in statistics.items():
+        print(f"{stat.capitalize()}: {value:.2f}")
+
+# Number of top ranked students that end each relative grade band
+# Each grade gets round(percentage / 100 * total) students, students left over from rounding get the last grade
+def relative_band_limits(grade_percentages, total_students):
+
+    band_limits = []
+    cumulative_students = 0                                                                     # Track cumulative students assigned a grade
+
+    for percentage in grade_percentages.values():
+        cumulative_students += round(percentage / 100 * total_students)                         # Calculate number of students for the grade
+        band_limits.append(min(cumulative_students, total_students))
+
+    return band_limits
+
+# Mask of the top_count best ranked students without sorting
+# Students are ranked by score, highest first, and equal scores are ranked by row position, earlier rows first
+# so a band boundary that falls inside a group of equal scores always splits it the same way
+# cutoff is the top_count-th highest score, found beforehand with np.partition
+def top_ranked_mask(rank_scores, top_count, cutoff):
+
+    if top_count <= 0:
+        return np.zeros(len(rank_scores), dtype=bool)
+    if top_count >= len(rank_scores):
+        return np.ones(len(rank_scores), dtype=bool)
+
+    mask = rank_scores > cutoff
+    tied_needed = top_count - np.count_nonzero(mask)                                            # Places left for students on the cutoff score
+    mask[np.flatnonzero(rank_scores == cutoff)[:tied_needed]] = True
+
+    return mask
+
+# Grade categories of a relative scale and the category code of each band
+# A grade of "F" is replaced by the last grade entered, so only grades from the scale are given out
+def relative_grade_labels(grade_percentages):
+
+    grades = list(grade_percentages.keys())
+    labels = [grades[-1] if grade == "F" else grade for grade in grades]
+    categories = list(dict.fromkeys(labels))
+
+    return categories, [categories.index(label) for label in labels]
+
+# Map every score to a relative grade code in O(n) per band without a full sort
+# The band cutoff scores are selected with a single np.partition call and grades are written in the original row order
+# Missing scores rank below every other score, like they did when the students were sorted
+def relative_grade_codes(scores, grade_percentages):
+
+    categories, label_codes = relative_grade_labels(grade_percentages)
+
+    rank_scores = np.asarray(scores, dtype=np.float64).copy()
+    rank_scores[np.isnan(rank_scores)] = -np.inf
+    total_students = len(rank_scores)
+
+    band_limits = relative_band_limits(grade_percentages, total_students)
+
+    # Every cutoff position in one partition, position total - k holds the k-th highest score
+    cutoff_positions = sorted({total_students - limit for limit in band_limits if 0 < limit < total_students})
+    partitioned = np.partition(rank_scores, cutoff_positions) if cutoff_positions else rank_scores
+
+    # Students left over from rounding get the last grade
+    codes = np.full(total_students, label_codes[-1], dtype=np.int8)
+
+    # Lowest band first so each better band overwrites the students it contains
+    for band in range(len(band_limits) - 1, -1, -1):
+        limit = band_limits[band]
+        cutoff = partitioned[total_students - limit] if 0 < limit < total_students else None
+        codes[top_ranked_mask(rank_scores, limit, cutoff)] = label_codes[band]
+
+    return codes, categories
+
+# Relative grades as a categorical column in the original row order
+@traced
+def relative_grades(scores, grade_percentages):
+
+    codes, categories = relative_grade_codes(scores, grade_percentages)
+    grades = pd.Categorical.from_codes(codes, categories=categories)
+
+    if isinstance(scores, pd.Series):
+        return pd.Series(grades, index=scores.index, name='Grade')
+
+    return grades
+
+# OUT-OF-CORE RELATIVE GRADING
+# Relative grading of files too large for memory, the counterpart of stream_absolute_grades
+#   1. the file is read in chunks and the scores are written to a float64 file, which is memory-mapped from then on
+#   2. the band cutoffs and the median are found with histogram passes over the mapped scores: the scores are turned
+#      into 64-bit integer keys in the same order, the first pass counts the highest 16 bits of every key and each
+#      further pass the next 16 bits of the keys that share their higher bits with a cutoff, which gives the exact
+#      k-th highest score without sorting in four passes
+#   3. one more pass grades the mapped scores chunk by chunk into a memory-mapped uint8 file of grade codes,
+#      students on a cutoff score are counted across chunks so ties split by row position exactly like relative_grade_codes
+#   4. the file is read again in chunks and written with its grades
+# Memory use depends on the chunk size, the mapped files take 9 bytes per student on disk in OUT_OF_CORE_DIR
+# (the directory of the output file when None) and are removed afterwards
+
+OUT_OF_CORE_DIR = None
+KEY_BITS = 64
+KEY_DIGIT_BITS = 16                                                 # Bits of a key counted in each histogram pass
+
+# Scores as unsigned integer keys in the same order
+# Missing scores take the key of -inf like in relative_grade_codes, and -0.0 the key of 0.0 so equal scores have equal keys
+def score_keys(scores):
+
+    scores = np.asarray(scores, dtype=np.float64)
+    scores = np.where(np.isnan(scores), -np.inf, scores + 0.0)
+    bits = scores.view(np.uint64)
+
+    # Negative scores have their bits flipped, positive scores get the sign bit so they come after every negative score
+    return np.where(bits >> 63 == 1, ~bits, bits | np.uint64(1 << 63))
+
+# Score of a key made by score_keys
+def key_score(key):
+
+    key = np.uint64(key)
+    bits = key & np.uint64((1 << 63) - 1) if key >> 63 == 1 else ~key
+
+    return float(np.array(bits, dtype=np.uint64).view(np.float64))
+
+# Highest bin where counting down from the top reaches rank, with the number of keys in the bins above it
+def ranked_bin(bin_counts, rank):
+
+    reached = np.cumsum(bin_counts[::-1])                                # Keys in the top 1, 2, ... bins
+    top_bins = int(np.searchsorted(reached, rank, side='left'))
+    above = int(reached[top_bins - 1]) if top_bins else 0
+
+    return len(bin_counts) - 1 - top_bins, above
+
+# Key of the k-th highest score for every rank k (counted from 1) and the number of scores above it
+# One pass over the mapped scores for every KEY_DIGIT_BITS bits of the keys, from the highest bits down
+# Each pass counts the next bits of the keys whose higher bits match the prefix found so far for a rank
+# Returns {rank: (key, students above the key)}
+def select_ranked_keys(scores, ranks, chunksize):
+
+    digits = 1 << KEY_DIGIT_BITS
+    ranked = {rank: (0, 0) for rank in ranks}                           # Prefix of the key and students above it
+
+    for shift in range(KEY_BITS - KEY_DIGIT_BITS, -1, -KEY_DIGIT_BITS):
+        prefixes = np.unique(np.array([prefix for prefix, _ in ranked.values()], dtype=np.uint64))
+        if not len(prefixes):
+            break
+
+        # Counts of the next digit of the keys under each prefix, one row per prefix
+        counts = np.zeros(len(prefixes) * digits, dtype=np.int64)
+        for start in range(0, len(scores), chunksize):
+            keys = score_keys(scores[start:start + chunksize])
+            key_prefixes = keys >> np.uint64(shift) >> np.uint64(KEY_DIGIT_BITS)      # Two shifts, a shift by 64 is undefined
+            slots = np.minimum(np.searchsorted(prefixes, key_prefixes), len(prefixes) - 1)
+            selected = prefixes[slots] == key_prefixes
+            key_digits = (keys[selected] >> np.uint64(shift)) & np.uint64(digits - 1)
+            counts += np.bincount(slots[selected] * digits + key_digits.astype(np.int64), minlength=len(prefixes) * digits)
+        counts = counts.reshape(len(prefixes), digits)
+
+        for rank, (prefix, above) in ranked.items():
+            digit, above_digit = ranked_bin(counts[np.searchsorted(prefixes, np.uint64(prefix))], rank - above)
+            ranked[rank] = ((prefix << KEY_DIGIT_BITS) | digit, above + above_digit)
+
+    return ranked
+
+# Mask of the students of a chunk among the top limit students, ranked like top_ranked_mask
+# ties_seen students on the cutoff score came in earlier chunks, returns the mask and the new ties_seen
+def top_ranked_chunk(keys, limit, total, ranked, ties_seen):
+
+    if limit <= 0:
+        return np.zeros(len(keys), dtype=bool), ties_seen
+    if limit >= total:
+        return np.ones(len(keys), dtype=bool), ties_seen
+
+    cutoff, above = ranked[limit]
+    tied = keys == cutoff
+    tie_positions = ties_seen + np.cumsum(tied) - 1                     # Place of each tied student among all tied so far
+
+    return (keys > cutoff) | (tied & (tie_positions < limit - above)), ties_seen + int(np.count_nonzero(tied))
+
+# Relative grading of a file read in chunks, with the scores memory-mapped instead of held in memory
+# Writes the graded file like stream_absolute_grades and returns the grade counts and statistics, with the exact median
+@traced
+def stream_relative_grades(filename, grade_percentages, output_filename, chunksize=DEFAULT_CHUNKSIZE):
+
+    categories, label_codes = relative_grade_labels(grade_percentages)
+    work_dir = tempfile.mkdtemp(prefix='ds221_', dir=OUT_OF_CORE_DIR or os.path.dirname(os.path.abspath(output_filename)))
+
+    try:
+        # Scores to a float64 file, with the running statistics for the summary
+        score_filename = os.path.join(work_dir, 'scores.f64')
+        score_stats = RunningStats()
+        with open(score_filename, 'wb') as score_file:
+            for chunk in read_file_chunks(filename, chunksize):
+                chunk_scores = chunk['Score'].to_numpy(dtype=np.float64)
+                chunk_scores.tofile(score_file)
+                score_stats.update(chunk_scores)
+
+        total_students = os.path.getsize(score_filename) // 8
+        if total_students == 0:
+            raise ValueError(f"The file '{filename}' has no rows to grade.")
+        scores = np.memmap(score_filename, dtype=np.float64, mode='r')
+
+        # Cutoff of every band and the middle two scores, missing scores rank last so they never reach the median
+        band_limits = relative_band_limits(grade_percentages, total_students)
+        scored = score_stats.count
+        median_ranks = [scored - (scored - 1) // 2, scored - scored // 2] if scored else []
+        ranked = select_ranked_keys(scores, {limit for limit in band_limits if 0 < limit < total_students} | set(median_ranks), chunksize)
+
+        # Grade codes in row order, lowest band first so each better band overwrites the students it contains
+        codes = np.memmap(os.path.join(work_dir, 'grades.u8'), dtype=np.uint8, mode='w+', shape=total_students)
+        ties_seen = [0] * len(band_limits)
+        grade_counts = np.zeros(len(categories), dtype=np.int64)
+
+        for start in range(0, total_students, chunksize):
+            keys = score_keys(scores[start:start + chunksize])
+            chunk_codes = np.full(len(keys), label_codes[-1], dtype=np.uint8)
+
+            for band in range(len(band_limits) - 1, -1, -1):
+                mask, ties_seen[band] = top_ranked_chunk(keys, band_limits[band], total_students, ranked, ties_seen[band])
+                chunk_codes[mask] = label_codes[band]
+
+            codes[start:start + len(keys)] = chunk_codes
+            grade_counts += np.bincount(chunk_codes, minlength=len(categories))
+
+        # Write the file again with its grades, the header only goes with the first chunk
+        start = 0
+        for chunk_number, chunk in enumerate(read_file_chunks(filename, chunksize)):
+            chunk_codes = np.asarray(codes[start:start + len(chunk)], dtype=np.int8)
+            start += len(chunk)
+
+            graded_chunk = chunk.assign(Grade=pd.Categorical.from_codes(chunk_codes, categories=categories))
+            graded_chunk.to_csv(output_filename, columns=['Name', 'Score', 'Grade'], index=False,
+                                mode='w' if chunk_number == 0 else 'a', header=chunk_number == 0,
+                                compression=EXPORT_FORMATS[export_format_from_filename(output_filename)][1])
+
+        statistics = score_stats.as_dict(ddof=1)
+        if median_ranks:
+            statistics["median"] = (key_score(ranked[median_ranks[0]][0]) + key_score(ranked[median_ranks[1]][0])) / 2
+
+        # The mapped files are closed before their directory is removed
+        del scores, codes
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return pd.Series(grade_counts, index=categories, name='count'), statistics
+
+# Relative grading of a column of scores with its descriptive statistics, in the form the grade memo keeps
+def relative_grading(scores, grade_percentages):
+
+    codes, categories = relative_grade_codes(scores, grade_percentages)
+    score_stats = RunningStats().update(scores)
+
+    return {
+        'codes': codes,
+        'categories': categories,
+        'statistics': {
+            'mean': float(score_stats.mean),
+            'variance': float(score_stats.variance()),
+            'std_dev': float(score_stats.std()),
+            'skewness': float(score_stats.skewness())
+        }
+    }
+
+# Relative grading
+@traced
+def calculate_relative_grades(student_data, grade_percentages):
+    try:
+        student_data = student_frame(student_data)
+
+        # Ensure required columns are present
+        if 'Name' not in student_data.columns or 'Score' not in student_data.columns:
+            print(colored("Error: The dataset must contain 'Name' and 'Score' columns.", "red"))
+            enter_to_continue()
+            return
+        
+        print_coloured_line("Relative Grading Results", "cyan")
+
+        # Assign grades in the original row order, the band cutoffs are found by selection instead of sorting every student
+        # A remembered grading of the same scores and percentages is reused with its statistics
+        memo_key, grading = memoized_grading(student_data['Score'], 'relative', grade_percentages,
+                                             lambda: relative_grading(student_data['Score'], grade_percentages))
+        student_data['Grade'] = memo_grades(grading, student_data.index)
+
+        # Calculate grade distribution
+        grade_counts = student_data['Grade'].value_counts()
+        grade_counts = grade_counts[grade_counts > 0]                                                      # Categorical counts include unused grades
+        print("Grade Distribution:")
+        for grade, count in grade_counts.items():
+            print(f"Grade {grade}: {count} students")
+
+        # Descriptive statistics, calculated in a single pass over the scores with the grades
+        mean_score = grading['statistics']['mean']
+        variance_score = grading['statistics']['variance']
+        standard_deviation_score = grading['statistics']['std_dev']
+        skewness_score = grading['statistics']['skewness']
+
+        print(f"\nDescriptive Statistics for Scores:")
+        print(f"Mean: {mean_score:.2f}")
+        print(f"Variance: {variance_score:.2f}")
+        print(f"Standard Deviation: {standard_deviation_score:.2f}")
+        print(f"Skewness: {skewness_score:.2f}")
+
+        if BOOTSTRAP_RESAMPLES:
+            print_bootstrap(bootstrap_intervals(student_data['Score'], student_data['Grade']))
+
+        # Display the students' grades
+        print_student_grades(student_data)
+
+        # Plot grade distribution and scores
+        with figure_memo(memo_key):
+            plot_normal_curve(student_data)
+            plot_grade_distribution(student_data)
+            plot_score_distribution(student_data)
+            plot_boxplot(student_data)
+
+        enter_to_continue()
+
+        # Return updated data frame with assigned grades
+        return student_data
+
+    except Exception as e:
+        print(colored(f"An error occurred while calculating relative grades: {e}", "red"))
+        enter_to_continue()
+        return None
+    
+# Students whose grade changed between two gradings
+# Returns a table with one row per moved student and the columns Name, From and To
+@traced
+def grade_movements(names, before_grades, after_grades):
+
+    before = np.asarray(before_grades, dtype=object)
+    after = np.asarray(after_grades, dtype=object)
+    moved = before != after                                                                     # Boolean mask of moved students
+
+    return pd.DataFrame({
+        'Name': np.asarray(names)[moved],
+        'From': before[moved],
+        'To': after[moved]
+    })
+
+# Count the grade movements as a from/to cross-tab
+def grade_movement_table(movements):
+    return pd.crosstab(movements['From'], movements['To'])
+
+# Z-score grades of a column of scores and the statistics after the adjustment, in the form the grade memo keeps
+# One pass collects every statistic needed here, the standard deviation is the sample one like pandas
+# Grades are assigned by how much the z-score deviates from the mean, using the z-score policy and the same kernel as absolute grading
+def z_score_grading(scores):
+
+    score_stats = RunningStats().update(scores)
+    mean_score = score_stats.mean
+    std_dev = score_stats.std(ddof=1)
+
+    codes, categories = absolute_grade_codes((scores - mean_score) / std_dev, z_score_policy())
+
+    return {
+        'codes': codes,
+        'categories': categories,
+        'statistics': {
+            "mean": float(mean_score),
+            "std_dev": float(std_dev),
+            "median": float(scores.median()),
+            "min": float(score_stats.min),
+            "max": float(score_stats.max)
+        }
+    }
+
+# Calculate z-scores and applu updated grades
+@traced
+def apply_z_score_grading(student_data):
+    student_data = student_frame(student_data)
+
+    # Ensure the 'Score' column exists in the dataset, no grades and no movements otherwise
+    if 'Score' not in student_data.columns:
+        print("Error: No 'Score' column in the dataset.")
+        return None, None
+
+    # Grades and statistics of a remembered z-score grading of the same scores are reused
+    memo_key, grading = memoized_grading(student_data['Score'], 'z-score', None, lambda: z_score_grading(student_data['Score']))
+    new_statistics = grading['statistics']
+    mean_score = new_statistics['mean']
+    std_dev = new_statistics['std_dev']
+
+    # Calculate z-scores for each student
+    student_data['z_score'] = (student_data['Score'] - mean_score) / std_dev
+
+    # Letter grades based on z-scores
+    student_data['Relative Grade'] = memo_grades(grading, student_data.index)
+
+    # Find the students who moved grade in one comparison instead of walking every row
+    movements = grade_movements(student_data['Name'], student_data['Grade'], student_data['Relative Grade'])
+
+    # Print a from/to summary of the grade movements
+    if not movements.empty:
+        print(f"Grade Changes ({len(movements)} of {len(student_data)} students were moved):")
+        print(grade_movement_table(movements))
+        print_grade_movements(movements)
+
+    # Print new statistics
+    print("\nNew Statistics after Z-Score Adjustment:")
+    for stat, value in new_statistics.items():
+        print(f"{stat.capitalize()}: {value:.2f}")
+
+    if BOOTSTRAP_RESAMPLES:
+        print_bootstrap(bootstrap_intervals(student_data['Score'], student_data['Relative Grade'], ddof=1),
+                        ['mean', 'std_dev', 'median'])
+
+    # Grade column after applying Z-score grading
+    student_data['Grade'] = student_data['Relative Grade']
 
     # Plot the updated distributions (Z-score graded)
-    plot_grade_distribution(student_data)   
-    plot_score_distribution(student_data)
-    plot_boxplot(student_data)
+    # Saved plots get their own prefix so they do not replace the relative grading plots
+    global PLOT_PREFIX
+    relative_prefix = PLOT_PREFIX
+    PLOT_PREFIX = f"{relative_prefix}z_score_"
+
+    with figure_memo(memo_key):
+        plot_grade_distribution(student_data)
+        plot_score_distribution(student_data)
+        plot_boxplot(student_data)
+
+        # Show the Z-Score grading plot
+        plot_z_score_distribution(student_data)
+    PLOT_PREFIX = relative_prefix
+
+    # Return updated grades using z-score grading and the students who moved
+    return student_data, movements
+
+# BOOTSTRAP
+# Confidence intervals for the statistics and grade shares printed after grading, from resampling the students with replacement
+# Every resample is reduced to how often it drew each distinct (score, grade) pair, the statistics and grade counts of all
+# resamples in a block then come from one matrix product with the pairs. Blocks are drawn in one go in one of two ways:
+#   counts   when there are few distinct pairs (whole or rounded scores), multinomial counts of the pairs are drawn directly,
+#            which gives the same resamples as drawing students but costs the number of pairs instead of the number of students
+#   indices  otherwise a (resamples x students) matrix of row indices is drawn and counted
+# Blocks are spread over a process pool and each block has its own seed spawned from BOOTSTRAP_SEED,
+# so the intervals are the same with any number of workers
+# Minimum and maximum are left out, a bootstrap cannot find values beyond the ones in the data
+# Set BOOTSTRAP_RESAMPLES to 0 to leave the intervals out
+
+BOOTSTRAP_RESAMPLES = 0
+BOOTSTRAP_LEVEL = 95.0                                              # Confidence level in percent
+BOOTSTRAP_SEED = 221
+BOOTSTRAP_WORKERS = None                                            # Processes drawing the blocks, None uses every CPU
+BOOTSTRAP_BLOCK_VALUES = 8_000_000                                  # Values drawn per block, bounds the memory of a block
+BOOTSTRAP_COUNTS_RATIO = 5                                          # Pairs drawn as counts when students / pairs is at least this
+BOOTSTRAP_STATISTICS = ['mean', 'variance', 'std_dev', 'skewness', 'median']
+BOOTSTRAP_TABLE = None                                              # Pair table of the resampling a pool worker draws
+
+# Distinct (score, grade) pairs of a cohort in score order, with missing scores last, and what a resample needs of them
+# Scores are centred on their mean before taking powers, so the moments of a resample do not lose precision
+def bootstrap_table(scores, codes, categories, ddof=0):
+
+    scores = np.asarray(scores, dtype=np.float64)
+    codes = np.asarray(codes, dtype=np.int64)
+    valid = ~np.isnan(scores)
+    sort_scores = np.where(valid, scores, np.inf)
+
+    order = np.lexsort((codes, sort_scores))
+    sorted_scores, sorted_codes = sort_scores[order], codes[order]
+    starts = np.flatnonzero(np.r_[True, (sorted_scores[1:] != sorted_scores[:-1]) | (sorted_codes[1:] != sorted_codes[:-1])])
+
+    # Pair of every student, in the original row order
+    pair_starts = np.zeros(len(scores), dtype=np.int64)
+    pair_starts[starts] = 1
+    inverse = np.empty(len(scores), dtype=index_dtype(len(scores)))
+    inverse[order] = np.cumsum(pair_starts) - 1
+
+    pair_scores = sorted_scores[starts]
+    pair_valid = valid[order][starts]
+    center = scores[valid].mean() if valid.any() else 0.0
+    centred = np.where(pair_valid, pair_scores - center, 0.0)
+
+    # One column per summed quantity: scores counted, their first three powers and one column per grade
+    features = np.column_stack([
+        pair_valid.astype(np.float64), centred, centred ** 2, centred ** 3,
+        np.eye(len(categories))[sorted_codes[starts]]
+    ])
+
+    return {
+        'inverse': inverse,
+        'pair_counts': np.diff(np.r_[starts, len(scores)]),
+        'pair_scores': pair_scores,
+        'valid_pairs': int(pair_valid.sum()),
+        'features': features,
+        'center': center,
+        'ddof': ddof,
+        'categories': list(categories)
+    }
+
+# Statistics and grade counts of every row of a (resamples x pairs) count matrix
+# Returns a (resamples x statistics + grades) array, statistics in the order of BOOTSTRAP_STATISTICS
+def resample_statistics(table, counts):
+
+    sums = counts @ table['features']
+    scored = sums[:, 0]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = sums[:, 1] / scored
+        m2 = sums[:, 2] / scored - mean ** 2
+        m3 = sums[:, 3] / scored - 3 * mean * sums[:, 2] / scored + 2 * mean ** 3
+        variance = m2 * scored / (scored - table['ddof'])
+        skewness = m3 / m2 ** 1.5
+
+    # Median from the running count of the pairs in score order, the middle two scores are averaged like pandas
+    # Every row is offset past the end of the row before, so one binary search finds the middle of all the rows
+    valid_pairs = table['valid_pairs']
+    median = np.full(len(counts), np.nan)
+    if valid_pairs:
+        offsets = np.arange(len(counts))[:, None] * (scored.max() + 1)
+        running = (np.cumsum(counts[:, :valid_pairs], axis=1) + offsets).ravel()
+        row_starts = np.arange(len(counts)) * valid_pairs
+        lower = np.searchsorted(running, (scored - 1) // 2 + offsets[:, 0], side='right') - row_starts
+        upper = np.searchsorted(running, scored // 2 + offsets[:, 0], side='right') - row_starts
+        lower, upper = np.minimum(lower, valid_pairs - 1), np.minimum(upper, valid_pairs - 1)
+        median = np.where(scored > 0, (table['pair_scores'][lower] + table['pair_scores'][upper]) / 2, np.nan)
+
+    return np.column_stack([table['center'] + mean, variance, np.sqrt(variance), skewness, median, sums[:, 4:]])
+
+# Smallest integer type that can index this many values
+def index_dtype(size):
+    return np.int32 if size < 2 ** 31 else np.int64
+
+# Draw one block of resamples and return their statistics
+def bootstrap_block(seed, resamples, table=None):
+
+    table = table if table is not None else BOOTSTRAP_TABLE
+    rng = np.random.default_rng(seed)
+    pairs, students = len(table['pair_counts']), len(table['inverse'])
+
+    if students >= BOOTSTRAP_COUNTS_RATIO * pairs:
+        counts = rng.multinomial(students, table['pair_counts'] / students, size=resamples)
+    else:
+        # Row indices of every resample at once, counted per pair with one bincount over the whole block
+        indices = rng.integers(0, students, size=(resamples, students), dtype=index_dtype(students))
+        pair_indices = table['inverse'][indices] + (np.arange(resamples, dtype=index_dtype(resamples * pairs)) * pairs)[:, None]
+        counts = np.bincount(pair_indices.ravel(), minlength=resamples * pairs).reshape(resamples, pairs)
+
+    return resample_statistics(table, counts.astype(np.float64))
+
+# Runs in a bootstrap pool worker, keeps the pair table so only seeds are sent with each block
+def start_bootstrap_worker(table):
+
+    global BOOTSTRAP_TABLE
+    BOOTSTRAP_TABLE = table
+
+# Bootstrap confidence intervals of the scores and grades of a cohort
+# ddof=1 gives the sample variance and standard deviation, like the statistics printed after z-score grading
+# Returns the estimate and interval of every statistic and grade share (in percent) with the number of resamples
+@traced
+def bootstrap_intervals(scores, grades, resamples=None, level=None, ddof=0, workers=None, seed=None):
+
+    resamples = resamples or BOOTSTRAP_RESAMPLES
+    level = level or BOOTSTRAP_LEVEL
+    grades = pd.Categorical(grades)
+
+    table = bootstrap_table(scores, grades.codes, grades.categories, ddof)
+    students, pairs = len(table['inverse']), len(table['pair_counts'])
+    method = 'counts' if students >= BOOTSTRAP_COUNTS_RATIO * pairs else 'indices'
+
+    # Equal blocks sized to the memory bound, each with its own seed
+    block_size = max(1, min(resamples, BOOTSTRAP_BLOCK_VALUES // max(pairs if method == 'counts' else students, 1)))
+    block_sizes = [min(block_size, resamples - start) for start in range(0, resamples, block_size)]
+    seeds = np.random.SeedSequence(BOOTSTRAP_SEED if seed is None else seed).spawn(len(block_sizes))
+
+    workers = min(workers or BOOTSTRAP_WORKERS or os.cpu_count() or 1, len(block_sizes))
+    if workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=start_bootstrap_worker,
+                                                    initargs=(table,)) as pool:
+            blocks = list(pool.map(bootstrap_block, seeds, block_sizes))
+    else:
+        blocks = [bootstrap_block(block_seed, size, table) for block_seed, size in zip(seeds, block_sizes)]
+
+    results = np.vstack(blocks)
+    estimates = resample_statistics(table, table['pair_counts'][None, :].astype(np.float64))[0]
+
+    # Grade counts become shares of the students
+    results[:, len(BOOTSTRAP_STATISTICS):] *= 100 / students
+    estimates[len(BOOTSTRAP_STATISTICS):] *= 100 / students
+
+    tail = (100 - level) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)                    # Statistics a cohort is too small for stay NaN
+        low, high = np.nanpercentile(results, [tail, 100 - tail], axis=0)
+
+    names = BOOTSTRAP_STATISTICS + [str(grade) for grade in table['categories']]
+    intervals = [{'estimate': float(e), 'low': float(l), 'high': float(h)} for e, l, h in zip(estimates, low, high)]
+
+    return {
+        'resamples': resamples,
+        'level': level,
+        'method': method,
+        'statistics': dict(zip(names[:len(BOOTSTRAP_STATISTICS)], intervals[:len(BOOTSTRAP_STATISTICS)])),
+        'shares': dict(zip(names[len(BOOTSTRAP_STATISTICS):], intervals[len(BOOTSTRAP_STATISTICS):]))
+    }
+
+# Print the intervals of the given statistics and of the grade shares
+def print_bootstrap(result, statistics=BOOTSTRAP_STATISTICS):
+
+    print(f"\n{result['level']:g}% Confidence Intervals ({result['resamples']} bootstrap resamples):")
+    for name in statistics:
+        interval = result['statistics'][name]
+        print(f"{name.replace('_', ' ').capitalize()}: {interval['estimate']:.2f} [{interval['low']:.2f}, {interval['high']:.2f}]")
+
+    for grade, interval in result['shares'].items():
+        print(f"Grade {grade} share: {interval['estimate']:.2f}% [{interval['low']:.2f}%, {interval['high']:.2f}%]")
+
+# CURVE OPTIMIZER
+# Searches absolute thresholds whose grade distribution comes closest to a target distribution
+# The target gives a share per grade, highest grade first, and the last grade gets every score below the thresholds
+# It can also be the normal curve of the z-score policy
+# Scores are sorted once into a SortedScoreIndex, after that the number of students reaching a threshold is a binary search,
+# so trying a threshold costs O(log n) and never regrades the students, and the search itself does not depend on n
+
+OPTIMIZER_MIN_GAP = 1.0                                             # Smallest distance between two thresholds
+OPTIMIZER_STEP = 0.5                                                # Thresholds are multiples of this
+OPTIMIZER_MAX_CANDIDATES = 2001                                     # Most thresholds tried per grade
+
+# Scores in ascending order, missing scores are left out but counted for the lowest grade
+class SortedScoreIndex:
+
+    def __init__(self, scores):
+        scores = np.asarray(scores, dtype=np.float64)
+        self.sorted_scores = np.sort(scores[~np.isnan(scores)])
+        self.total = len(scores)
+
+    # Students with a score of at least threshold
+    def count_at_least(self, threshold):
+        return len(self.sorted_scores) - int(np.searchsorted(self.sorted_scores, threshold, side='left'))
+
+    # Students per grade for descending thresholds, the last count is the grade below every threshold
+    def grade_counts(self, thresholds):
+        reached = [0] + [self.count_at_least(threshold) for threshold in thresholds] + [self.total]
+        return np.diff(reached)
+
+    # Highest threshold that count students reach
+    def threshold_for_count(self, count):
+
+        scored = len(self.sorted_scores)
+        if count <= 0:
+            return np.inf
+        if count >= scored:
+            return self.sorted_scores[0] if scored else -np.inf
+
+        return self.sorted_scores[scored - count]
+
+# Share of each grade of a z-score policy if the scores followed a normal distribution, in percent
+def normal_curve_shares(policy=None):
+
+    policy = policy or z_score_policy()
+    reached = [0.0] + [1 - 0.5 * (1 + math.erf(cutoff / math.sqrt(2))) for cutoff in policy.grades.values()] + [1.0]
+
+    return dict(zip(list(policy.grades) + [policy.default], np.diff(reached) * 100))
+
+# Thresholds closest to the target shares, subject to a minimum gap between thresholds and a descending order
+# Candidate thresholds are the multiples of step between low and high, each counted with one binary search,
+# and the thresholds with the smallest squared distance from the target counts are found exactly by dynamic programming:
+# a grade's count only depends on its own threshold and the one above, so the best thresholds are built one grade at a time
+# Returns the thresholds, the shares they give and a policy ready for calculate_absolute_grades
+def optimize_thresholds(index, target_shares, min_gap=OPTIMIZER_MIN_GAP, step=OPTIMIZER_STEP, low=0.0, high=100.0):
+
+    grades = list(target_shares)
+    if len(grades) < 2:
+        raise ValueError("A target distribution needs at least two grades.")
+
+    targets = np.array([target_shares[grade] for grade in grades], dtype=np.float64) / 100 * index.total
+    total_thresholds = len(grades) - 1
+
+    candidates = np.arange(np.ceil(low / step), np.floor(high / step) + 1) * step
+    if len(candidates) > OPTIMIZER_MAX_CANDIDATES:
+        raise ValueError(f"A step of {step:g} gives too many thresholds to try, use a larger step.")
+
+    # Students reaching every candidate, and how many candidates apart two thresholds must be
+    reached = len(index.sorted_scores) - np.searchsorted(index.sorted_scores, candidates, side='left')
+    min_distance = max(int(np.ceil(min_gap / step - 1e-9)), 1)
+    if (total_thresholds - 1) * min_distance >= len(candidates):
+        raise ValueError("The minimum gap leaves no room for every threshold.")
+
+    # cost[j] is the smallest error of the grades so far when the latest threshold is candidates[j]
+    cost = (reached - targets[0]) ** 2
+    choices = []
+    for grade in range(1, total_thresholds):
+        # The threshold above must be at least min_distance candidates higher
+        errors = cost[None, :] + (reached[:, None] - reached[None, :] - targets[grade]) ** 2
+        positions = np.arange(len(candidates))
+        errors[positions[None, :] < positions[:, None] + min_distance] = np.inf
+
+        choices.append(np.argmin(errors, axis=1))
+        cost = errors[positions, choices[-1]]
+
+    # The last grade gets every student below the lowest threshold
+    cost = cost + (index.total - reached - targets[-1]) ** 2
+    position = int(np.argmin(cost))
+    if not np.isfinite(cost[position]):
+        raise ValueError("The minimum gap leaves no room for every threshold.")
+
+    # Walk back from the lowest threshold to the highest
+    positions = [position]
+    for choice in reversed(choices):
+        positions.append(int(choice[positions[-1]]))
+    thresholds = [float(candidates[position]) for position in reversed(positions)]
+
+    counts = index.grade_counts(thresholds)
+    achieved = counts / max(index.total, 1) * 100
+    threshold_map = dict(zip(grades[:-1], thresholds))
+
+    return {
+        'thresholds': threshold_map,
+        'target': dict(target_shares),
+        'achieved': dict(zip(grades, achieved)),
+        'difference': float(np.abs(achieved - np.array([target_shares[grade] for grade in grades])).sum() / 2),
+        'policy': GradingPolicy('optimized', 'score', threshold_map, grades[-1])
+    }
+
+# Print the thresholds found by optimize_thresholds next to the target
+def print_threshold_search(result):
+
+    print(f"{'Grade':<8}{'Minimum':>10}{'Target %':>10}{'Result %':>10}")
+    for grade, target in result['target'].items():
+        minimum = result['thresholds'].get(grade)
+        minimum_text = f"{minimum:g}" if minimum is not None else "-"
+        print(f"{grade:<8}{minimum_text:>10}{target:>10.2f}{result['achieved'][grade]:>10.2f}")
+
+    print(f"\nDistance from the target: {result['difference']:.2f} percentage points")
+    print("Thresholds: " + ",".join(f"{grade}={threshold:g}" for grade, threshold in result['thresholds'].items()))
+
+# Read a target distribution, "normal" follows the normal curve of the z-score policy
+# Raises ValueError if the shares do not add up to 100
+def parse_target_shares(text, policy=None):
+
+    if text.strip().lower() == 'normal':
+        return normal_curve_shares(policy)
+
+    target_shares = parse_grade_mapping(text)
+    error = validate_grade_percentages('relative', target_shares)
+    if error:
+        raise ValueError(error)
+
+    return target_shares
+
+# Let the user try target distributions until the thresholds look right, returns the chosen policy
+# or None when the user goes back to typing the thresholds
+def tune_thresholds(student_data):
+
+    index = SortedScoreIndex(student_frame(student_data)['Score'])
+
+    while True:
+        clear_terminal()
+        print_coloured_line("Threshold Search", "magenta")
+        print("Enter the share of each grade, e.g. A=20,B=30,C=30,D=15,F=5")
+        print("or 'normal' to follow the normal curve of z-score grading")
+        print("Enter '0' to go back")
+
+        target = input("\nTarget: ").strip()
+        if target == '0':
+            return None
+
+        try:
+            result = optimize_thresholds(index, parse_target_shares(target))
+        except ValueError as e:
+            print(colored(f"Invalid target: {e}", "red"))
+            enter_to_continue()
+            continue
+
+        print()
+        print_threshold_search(result)
+
+        if input("\nUse these thresholds? (y/n): ").strip().lower() == 'y':
+            return result['policy']
+
+# Entry point of --target, prints the best thresholds for every input file
+def run_threshold_search(args):
+
+    filenames = expand_input_paths(args.inputs)
+    if not filenames:
+        print(colored("No input files were provided.", "red"))
+        return 2
+
+    try:
+        policy = load_policy(args.policy) if args.policy else None
+        if policy is not None and policy.scale != 'z-score':
+            raise ValueError(f"Policy '{policy.name}' grades scores, the normal curve needs a z-score policy.")
+        target_shares = parse_target_shares(args.target, policy)
+    except (OSError, ValueError, ImportError) as e:
+        print(colored(f"Invalid target: {e}", "red"))
+        return 2
+
+    failed = 0
+    for filename in filenames:
+        print_coloured_line(f"Thresholds for {filename}", "yellow")
+
+        try:
+            index = SortedScoreIndex(load_score_file(filename)['Score'])
+            print_threshold_search(optimize_thresholds(index, target_shares, args.min_gap, args.step))
+        except (OSError, ValueError, KeyError) as e:
+            print(colored(f"Could not search thresholds for {filename}: {e}", "red"))
+            failed += 1
+
+    return 1 if failed else 0
+
+
+def main():
+
+    clear_terminal()
+
+    # Outer Loop for file selection and reading
+    while True:
+        # Bool to check if a file with valid data has been read
+        file_selected = False
+
+        while not file_selected:
+            print_coloured_line("Input Module" , "green")
+            print("Choose an option:\n")
+            print("1. Create a new student scores file")
+            print("2. Provide an existing file")
+            choice = input("\nType here : ").strip()
+
+            if choice == '1':
+                student_data = create_student_scores()                          # Create a new file
+                if student_data is not None:                                    # If any students were entered
+                    file_selected = True
+
+            elif choice == '2':
+                clear_terminal()
+                print_coloured_line("Student Scores Input" , "green")
+
+                # Loop until a valid file is selected
+                while True:
+                    clear_terminal()
+                    print_coloured_line("Student Scores Input", "green")
+
+                    print("Enter the filename (with extension, e.g., file.csv or file.xlsx)")
+                    print("If file is not in the same directory , please specify the directory as well")
+                    print("Enter '0' to go back")
+                    filename = input("\nType here : ").strip()
+
+                    if filename == '0':
+                        file_selected = False
+                        clear_terminal()
+                        break
+
+                    student_data = read_file(filename)
+                    if student_data is not None:
+                        file_selected = True
+                        break
+
+                    if os.path.exists(filename):
+                        read_file(filename)
+                        file_selected = True
+                        clear_terminal()
+                        break
+                    else:
+                        clear_terminal()
+                        print_coloured_line("Student Scores Input", "green")
+                        print(colored(f"Error: The file '{filename}' does not exist. Please provide a valid file.", "red"))
+                        enter_to_continue()
+
+            else:
+                print(colored("\nInvalid choice." , "red"))
+                enter_to_continue()
+                clear_terminal()
+
+
+        # Input for relative or absolute grading
+        grading_method_seleted = False
+
+        # Loop for selecting a grading method
+        while not grading_method_seleted:
+            clear_terminal()
+            print_coloured_line("Grading method" , "yellow")
+
+            print("Select grading type:")
+            print(colored("\n1. Relative Grading" , "cyan"))
+            print(colored("2. Absolute Grading" , "magenta"))
+            print(colored("3. Grading Policy (plus/minus, pass/fail or a policy file)\n" , "blue"))
+
+            grading_choice = input("Enter the number of your choice: ").strip()
+
+            if grading_choice == '1':
+                clear_terminal()
+                print_coloured_line("Relative Grading selected" , "cyan")
+                print("\nYou chose relative grading.")
+                enter_to_continue()
+                grading_method_seleted = True
+
+            elif grading_choice == '2':
+                clear_terminal()
+                print_coloured_line("Absolute Grading selected" , "magenta")
+                print("\nYou chose absolute grading.")
+                enter_to_continue()
+                grading_method_seleted = True
+
+            elif grading_choice == '3':
+                clear_terminal()
+                print_coloured_line("Grading Policy selected" , "blue")
+                print("\nYou chose grading with a policy.")
+                enter_to_continue()
+                grading_method_seleted = True
+
+            else:
+                print(colored("\nInvalid choice." , "red"))
+                enter_to_continue()
+
+        # Input for the grading scale
+        grading_scale_selected = False
+
+        grade_category = list(BUILTIN_POLICIES['letters']['grades']) + [BUILTIN_POLICIES['letters']['default']]  # Store grades
+        grade_percentages = {}                                  # Stores grades theresholds
+        total_percentage = 0                                    # Total percentage of grades entered in relative grading
+
+        while not grading_scale_selected:
+
+            # Relative
+            if grading_choice == '1':
+            
+                    for grade in grade_category:
+                        while True:
+                            clear_terminal()
+                            print_coloured_line("Grading Scale" , "cyan")
+                            print(f"Enter percentage for grade {grade}", "cyan")
+
+                            user_input = input(f"Enter percentage for grade {grade}: ").strip()
+
+                            # Validate input
+                            try:
+                                percentage = float(user_input)
+
+                                if 0 <= percentage <= 100:                                              # Ensure percentage is valid
+                                    total_percentage += percentage
+
+                                    # Check if total exceeds 100 while entering
+                                    if total_percentage > 100:
+                                        print(colored(f"The total percentage exceeds 100%.", "red"))
+                                        enter_to_continue()
+                                        break                                                           # Break out to restart the whole process from A if percentage exceeds 100
+
+                                    grade_percentages[grade] = percentage
+                                    break                                                               # Exit the loop once valid input is entered
+                                else:
+                                    print(colored("Please enter a percentage between 0 and 100.", "red"))
+                                    enter_to_continue()
+
+                            except ValueError:                                                           # Handle invalid input above 100
+                                print(colored("Invalid input. Please enter a numeric value between 0 and 100.", "red"))
+                                enter_to_continue()
+
+                        # If the total exceeded during the input for this grade, restart from A
+                        if total_percentage > 100:
+                            break
+
+                    # Final check after all grades have been entered
+                    if total_percentage == 100:
+                        grading_scale_selected = True
+                        break  # Exit the process if everything is valid
+
+                    else:
+                        print(colored("The total percentage is not exactly 100%. Restarting from grade A!", "red"))
+                        total_percentage = 0
+                        enter_to_continue()
+
+            # Absolute
+            elif grading_choice == '2':
+                clear_terminal()
+                print_coloured_line("Grading Scale", "magenta")
+                if input("Type 'auto' to search thresholds for a target distribution, or press Enter to type them: ").strip().lower() == 'auto':
+                    grade_percentages = tune_thresholds(student_data)
+                    if grade_percentages is not None:
+                        grading_scale_selected = True
+                        continue
+                    grade_percentages = {}                                                              # Search left, the thresholds are typed instead
+
+                previous_threshold = 100
+                for grade in grade_category[:-1]:                                                       # Exclude 'F' as F is calculated as D - 1
+                    while True:
+                        clear_terminal()
+                        print_coloured_line("Grading Scale", "magenta")
+                        user_input = input(f"Enter minimum percentage thresehold for grade {grade}: ").strip()
+
+                        # Validate input
+                        try:
+                            threshold = float(user_input)
+                            if 0 <= threshold <= previous_threshold:                                    # Ensure thresholds are valid and descending
+                                grade_percentages[grade] = threshold
+                                previous_threshold = threshold
+                                break
+
+                            else:
+                                print(colored(f"Please enter a value between 0 and {previous_threshold}.", "red"))
+                                enter_to_continue()
+
+                        except ValueError:
+                            print(colored("Invalid input. Please enter a numeric value.", "red"))
+                            enter_to_continue()
+
+                grade_percentages['F'] = grade_percentages['D'] - 1
+                grading_scale_selected = True
+
+            # Policy
+            elif grading_choice == '3':
+                clear_terminal()
+                print_coloured_line("Grading Policy", "blue")
+                print(f"Built-in policies: {', '.join(name for name, policy in BUILTIN_POLICIES.items() if policy['scale'] == 'score')}")
+                policy_name = input("Enter a policy name or a .json/.yaml policy file: ").strip()
+
+                try:
+                    policy = load_policy(policy_name)
+                    if policy.scale != 'score':
+                        raise ValueError(f"Policy '{policy.name}' grades z-scores, pick a policy that grades scores.")
+
+                    grade_percentages = policy
+                    grading_scale_selected = True
+
+                except (OSError, ValueError, ImportError) as e:
+                    print(colored(f"Invalid policy: {e}", "red"))
+                    enter_to_continue()
+
+        clear_terminal()
+        print_coloured_line("Grading scale" , "yellow")
+
+        # Show the percentages entered
+        if isinstance(grade_percentages, GradingPolicy):
+            print(f"Policy {grade_percentages.name}\n")
+            for grade, threshold in grade_percentages.grades.items():
+                print(f"Grade {grade}: {threshold}%")
+            print(f"Grade {grade_percentages.default}: below {min(grade_percentages.grades.values())}%")
+
+        else:
+            print("Percentages entered\n")
+
+            for grade, percentage in grade_percentages.items():
+                print(f"Grade {grade}: {percentage}%")
+        print('\n')
+
+        enter_to_continue()
+
+
+    # STATISTICAL ANALYSIS 
+        clear_terminal()
+
+        with trace_stage('grading', method={'1': 'relative', '2': 'absolute', '3': 'policy'}[grading_choice], students=len(student_data)):
+            if grading_choice == '1':
+
+                student_data = calculate_relative_grades(student_data, grade_percentages)
+                # A copy of is made after relative grading to keep the original data in case user wants to store according to their percentages
+                original_data = student_data.copy()
+                adjusted_data = apply_z_score_grading(student_data)[0]
+
+
+
+            elif grading_choice in ('2', '3'):
+
+                student_data = calculate_absolute_grades(student_data , grade_percentages)
+
+
+    # Save graded data to CSV
+
+        clear_terminal()
+        print_coloured_line("Save File Creation" , "green")
+        print("Grade Calculation Completed")
+
+        save = input("Would you like to save the grades in a CSV? (y/n): ").strip()
+
+        while True:
+            if save == 'y':
+                clear_terminal()
+                print_coloured_line("Save File Creation", "green")
+
+                if grading_choice == '1':
+                    while True:
+                        clear_terminal()
+                        print_coloured_line("Save File Creation", "green")
+
+                        print("1. Save grades with your parameters")
+                        print("2. Save grades fitted to a normal distribution")
+                        print("3. Save both gradings in one file\n")
+
+                        save_choice = input(
+                            "Would you like to save the grades with your parameters or the grades fitted to a normal distribution? ").strip()
+
+                        if save_choice == '1':
+                            print("\nSaving grades to CSV file with your parameters...\n")
+                            save_grades_to_csv(original_data, "graded_students_relative.csv")
+                            enter_to_continue()
+                            break
+                        
+                        elif save_choice == '2':
+                            print("\nSaving grades to CSV file (fitted to normal distribution)...\n")
+                            save_grades_to_csv(adjusted_data, "graded_students_z_score.csv")
+                            enter_to_continue()
+                            break
+
+                        elif save_choice == '3':
+                            print("\nSaving both gradings to one CSV file...\n")
+                            try:
+                                export_grade_variants(original_data, {
+                                    'Relative': original_data['Grade'],
+                                    'Z-Score': adjusted_data['Grade']
+                                }, "graded_students_all.csv")
+                            except Exception as e:
+                                print(colored(f"Error saving file: {e}", "red"))
+                            enter_to_continue()
+                            break
+                        
+                        else:
+                            clear_terminal()
+                            print_coloured_line("Save File Creation", "green")
+                            print(colored("\nInvalid Option. Please try again.", "red"))
+                            enter_to_continue()
+                    
+                    break
+
+                elif grading_choice in ('2', '3'):
+                    print("\nSaving grades to CSV file...\n")
+                    save_grades_to_csv(student_data)
+                    enter_to_continue()
+                    break
+                
+                else:
+                    print("\nInvalid grading choice. Please try again.")
+                    break
+                
+            elif save == 'n':
+                print("\nGrades were not saved.")
+                break
+            
+            else:
+                print(colored("Invalid input. Please enter 'y' or 'n'.", "red"))
+                save = input("Would you like to save the grades in a CSV? (y/n): ").strip()
+
+        clear_terminal()
+        print_coloured_line("Restart or Exit", "yellow")
+        restart_choice = input("\nWould you like to process another file? (y/n): ").strip().lower()
+
+        if restart_choice != 'y':
+            print(colored("Exiting the program. Goodbye!", "green"))
+            break                                                                                               # Exit the loop and program
+
+        else:
+            clear_terminal()
+            print_coloured_line("Restarting" , "green")
+            time.sleep(1)
+            clear_terminal()
+                
+
+# BATCH GRADING
+# Runs the same grading functions as main() from the command line with no prompts
+# Example:
+#   python DS-221_Project.py course1.csv course2.xlsx --method absolute --thresholds A=80,B=70,C=60,D=50
+#   python DS-221_Project.py --config grading.json
+#   python DS-221_Project.py "courses/*.csv" --method relative --percentages A=20,B=30,C=30,D=15,F=5 --workers 8
+
+BATCH_METHODS = ['relative', 'absolute', 'z-score']
+
+# Auto picks z-score grading for each file whose scores look normal and relative grading otherwise
+BATCH_METHOD_CHOICES = BATCH_METHODS + ['auto']
+
+# Format of the graded files written by batch grading, one of EXPORT_FORMATS
+OUTPUT_FORMAT = 'csv'
+
+# Output file suffix for each grading method, matching the names used by main()
+BATCH_OUTPUT_SUFFIX = {
+    'relative': 'graded_relative',
+    'absolute': 'graded',
+    'z-score': 'graded_z_score',
+    'auto': 'graded_auto'                                               # Only until the file is read and a method is picked
+}
+
+# Turn "A=20,B=30,C=30" into {'A': 20.0, 'B': 30.0, 'C': 30.0} keeping the order given
+def parse_grade_mapping(text):
+
+    grade_percentages = {}
+
+    for item in text.split(','):
+        if item.strip() == '':
+            continue
+
+        if '=' not in item:
+            raise ValueError(f"Invalid grade entry '{item.strip()}', expected GRADE=VALUE")
+
+        grade, value = item.split('=', 1)
+        grade_percentages[grade.strip()] = float(value)
+
+    return grade_percentages
+
+# Check a grading scale with the same rules main() applies to typed input
+# Returns an error message or None if the scale is valid
+def validate_grade_percentages(method, grade_percentages):
+
+    if not grade_percentages:
+        return "No grading scale was provided."
+
+    for grade, percentage in grade_percentages.items():
+        if not 0 <= percentage <= 100:
+            return f"Value for grade {grade} must be between 0 and 100."
+
+    # Relative grading needs the percentages to cover every student exactly once
+    if method in ('relative', 'z-score', 'auto'):
+        if sum(grade_percentages.values()) != 100:
+            return "The total percentage is not exactly 100%."
+
+    # Absolute thresholds must be entered from the highest grade to the lowest
+    elif method == 'absolute':
+        thresholds = list(grade_percentages.values())
+        if any(lower > higher for higher, lower in zip(thresholds, thresholds[1:])):
+            return "Absolute thresholds must be in descending order."
+
+    return None
+
+# Read the command line arguments for batch grading
+def parse_batch_arguments(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description="Grade student score files without the interactive menu."
+    )
+    parser.add_argument('inputs', nargs='*', help="CSV or Excel files, directories or glob patterns to grade")
+    parser.add_argument('--config', help="JSON file with inputs, method and grade_percentages")
+    parser.add_argument('--serve', action='store_true', help="Run the grading HTTP service instead of grading files")
+    parser.add_argument('--host', default='127.0.0.1', help="Address the grading service listens on")
+    parser.add_argument('--port', type=int, default=8221, help="Port the grading service listens on")
+    parser.add_argument('--aggregate', action='store_true',
+                        help="Summarise graded files per cohort instead of grading, directories are searched recursively")
+    parser.add_argument('--group-by', default='course',
+                        help=f"Cohort columns to summarise by, any of {','.join(COHORT_KEYS)} (default: course)")
+    parser.add_argument('--cohort-pattern', help="Regular expression with term, course and section groups matched against file paths "
+                             "without the extension and graded suffix")
+    parser.add_argument('--baseline', help="Cohort the others are compared with, e.g. 2024F/CS101 (default: all cohorts)")
+    parser.add_argument('--target',
+                        help="Print the absolute thresholds closest to this grade distribution (e.g. A=20,B=30,C=30,D=15,F=5) "
+                             "or to 'normal', the normal curve of the z-score policy, instead of grading")
+    parser.add_argument('--min-gap', type=float, default=OPTIMIZER_MIN_GAP,
+                        help=f"Smallest gap between thresholds found with --target (default: {OPTIMIZER_MIN_GAP:g})")
+    parser.add_argument('--step', type=float, default=OPTIMIZER_STEP,
+                        help=f"Thresholds found with --target are multiples of this (default: {OPTIMIZER_STEP:g})")
+    parser.add_argument('--method', choices=BATCH_METHOD_CHOICES,
+                        help="Grading method to apply, auto checks each file for normality and picks z-score or relative grading")
+    parser.add_argument('--percentages', help="Relative grade percentages, e.g. A=20,B=30,C=30,D=15,F=5")
+    parser.add_argument('--thresholds', help="Absolute minimum scores, e.g. A=80,B=70,C=60,D=50")
+    parser.add_argument('--policy',
+                        help=f"Grading policy, one of {', '.join(BUILTIN_POLICIES)} or a .json/.yaml file. "
+                             "Score policies grade absolutely, z-score policies replace the z-score cutoffs")
+    parser.add_argument('--output-dir', help="Directory for graded files (default: next to each input)")
+    parser.add_argument('--report', choices=REPORT_MODES,
+                        help="Per-student listing: every student, none, the top scores or one page (default: full)")
+    parser.add_argument('--top', type=int, help=f"Students listed in top and page mode (default: {REPORT_TOP_N})")
+    parser.add_argument('--page', type=int, help="Page to list in page mode, starting at 1")
+    parser.add_argument('--report-file', help="Append the per-student listings to this file instead of the terminal")
+    parser.add_argument('--cache-dir', help=f"Directory of the parsed score cache (default: {SCORE_CACHE_DIR})")
+    parser.add_argument('--no-cache', action='store_true', help="Always parse the input files")
+    parser.add_argument('--memo-dir', help=f"Directory of remembered gradings and plots (default: {GRADE_MEMO_DIR})")
+    parser.add_argument('--no-memo', action='store_true', help="Always grade and draw the plots again")
+    parser.add_argument('--output-format', choices=list(EXPORT_FORMATS),
+                        help="Format of the graded files (default: csv)")
+    parser.add_argument('--chunksize', type=int,
+                        help="Stream each file in chunks of this many rows (absolute grading, or relative grading "
+                             "with the scores memory-mapped on disk)")
+    parser.add_argument('--workers', type=int,
+                        help="Grade this many courses in parallel worker processes")
+    parser.add_argument('--summary', help="CSV file for the combined summary of all courses")
+    parser.add_argument('--plots-dir', help="Save every plot to this directory (plots are skipped otherwise)")
+    parser.add_argument('--plot-format', choices=['png', 'svg'], help="File format of saved plots (default: png)")
+    parser.add_argument('--plot-workers', type=int,
+                        help="Render plot files in this many background processes while grading continues")
+    parser.add_argument('--bootstrap', type=int, metavar='RESAMPLES',
+                        help="Print bootstrap confidence intervals of the statistics and grade shares from this many resamples")
+    parser.add_argument('--confidence', type=float,
+                        help=f"Confidence level of the bootstrap intervals in percent (default: {BOOTSTRAP_LEVEL:g})")
+    parser.add_argument('--trace', help="Time every stage and write a Chrome trace to this file (or set DS221_TRACE)")
+
+    args = parser.parse_args(argv)
+
+    # Ranges argparse cannot check from the type alone
+    if args.bootstrap is not None and args.bootstrap <= 0:
+        parser.error("--bootstrap needs at least 1 resample")
+    if args.confidence is not None and not 0 < args.confidence < 100:
+        parser.error("--confidence must be between 0 and 100 percent")
+    for option, value in (('--top', args.top), ('--page', args.page)):
+        if value is not None and value < 1:
+            parser.error(f"{option} must be at least 1")
+
+    return args
+
+# Merge the config file with the command line, command line values win
+def build_batch_config(args):
+
+    config = {}
+
+    if args.config:
+        with open(args.config) as config_file:
+            config = json.load(config_file)
+        if not isinstance(config, dict):
+            raise ValueError(f"'{args.config}' must hold a JSON object of settings.")
+        if not isinstance(config.get('grade_percentages', {}), dict):
+            raise ValueError("'grade_percentages' in the config file must map each grade to a number, e.g. {\"A\": 20, \"B\": 30}.")
+
+    if args.inputs:
+        config['inputs'] = args.inputs
+    if args.method:
+        config['method'] = args.method
+    if args.output_dir:
+        config['output_dir'] = args.output_dir
+    if args.chunksize:
+        config['chunksize'] = args.chunksize
+    if args.output_format:
+        config['output_format'] = args.output_format
+    if args.workers:
+        config['workers'] = args.workers
+    if args.summary:
+        config['summary'] = args.summary
+    if args.plots_dir:
+        config['plots_dir'] = args.plots_dir
+    if args.plot_format:
+        config['plot_format'] = args.plot_format
+    if args.plot_workers:
+        config['plot_workers'] = args.plot_workers
+
+    if args.percentages:
+        config['grade_percentages'] = parse_grade_mapping(args.percentages)
+    elif args.thresholds:
+        config['grade_percentages'] = parse_grade_mapping(args.thresholds)
+    if args.policy:
+        config['policy'] = args.policy
+
+    config.setdefault('inputs', [])
+    config.setdefault('output_dir', None)
+    config.setdefault('chunksize', None)
+    config.setdefault('output_format', 'csv')
+    config.setdefault('workers', None)
+    config.setdefault('summary', None)
+    config.setdefault('plots_dir', None)
+    config.setdefault('plot_format', 'png')
+    config.setdefault('plot_workers', None)
+    config.setdefault('policy', None)
+
+    # A score policy is the scale of absolute grading, a z-score policy only changes z-score grading
+    policy = load_policy(config['policy']) if config['policy'] else None
+    if policy is not None and policy.scale == 'score':
+        config.setdefault('method', 'absolute')
+        if config['method'] != 'absolute':
+            raise ValueError(f"Policy '{policy.name}' grades scores, use it with absolute grading.")
+    elif policy is not None:
+        config.setdefault('method', 'z-score')
+        if config['method'] not in ('z-score', 'auto'):
+            raise ValueError(f"Policy '{policy.name}' grades z-scores, use it with z-score or auto grading.")
+
+    if isinstance(config['inputs'], str):
+        config['inputs'] = [config['inputs']]
+
+    if config.get('method') not in BATCH_METHOD_CHOICES:
+        raise ValueError(f"A grading method is required, choose one of: {', '.join(BATCH_METHOD_CHOICES)}")
+
+    # Relative grading ranks the whole cohort, streamed files are ranked from memory-mapped scores
+    # Z-score grading needs every relative grade in memory to find the students who moved
+    if config['chunksize'] and config['method'] not in ('absolute', 'relative'):
+        raise ValueError("Streaming with --chunksize is only supported for absolute and relative grading.")
+
+    if config['output_format'] not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown output format, choose one of: {', '.join(EXPORT_FORMATS)}")
+
+    # Streamed chunks are appended to the output, which only CSV supports
+    if config['chunksize'] and not config['output_format'].startswith('csv'):
+        raise ValueError("Streaming with --chunksize writes CSV output only.")
+
+    if policy is not None and policy.scale == 'score':
+        config['grade_percentages'] = policy
+    else:
+        config['grade_percentages'] = complete_grade_scale(config['method'], config.get('grade_percentages', {}))
+
+    return config
+
+# Turn a grading scale from a config file or request into the scale the grading functions expect
+# Raises ValueError if the scale breaks the rules main() applies to typed input
+def complete_grade_scale(method, grade_percentages):
+
+    try:
+        grade_percentages = {grade: float(value) for grade, value in grade_percentages.items()}
+    except (TypeError, ValueError):
+        raise ValueError("Every grade of 'grade_percentages' needs a number, e.g. {\"A\": 20, \"B\": 30}.")
+
+    # F is calculated as D - 1 in absolute grading, exactly like main()
+    if method == 'absolute' and grade_percentages and 'F' not in grade_percentages:
+        grade_percentages['F'] = list(grade_percentages.values())[-1] - 1
+
+    error = validate_grade_percentages(method, {
+        grade: value for grade, value in grade_percentages.items()
+        if not (method == 'absolute' and grade == 'F')
+    })
+    if error:
+        raise ValueError(error)
+
+    return grade_percentages
+
+# Name of the graded output file for an input file, stem replaces the input file name without its extension
+def batch_output_filename(filename, method, output_dir=None, output_format='csv', stem=None):
+
+    directory, base = os.path.split(filename)
+    stem = stem or os.path.splitext(base)[0]
+    output_name = f"{stem}_{BATCH_OUTPUT_SUFFIX[method]}{EXPORT_FORMATS[output_format][0]}"
+
+    return os.path.join(output_dir if output_dir else directory, output_name)
+
+# Whether a file is the output of an earlier batch run, such as "course_graded_relative.csv"
+def is_batch_output(filename):
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return stem.endswith(tuple(f"_{suffix}" for suffix in BATCH_OUTPUT_SUFFIX.values()))
+
+# Output stem of every input file, the file name without its extension unless two inputs would write the same output
+# Those get the directories that tell them apart in front ("2024F/CS101.csv" becomes "2024F_CS101"),
+# and their extension after when they are in the same directory
+def batch_output_stems(filenames, output_dir=None):
+
+    groups = collections.defaultdict(list)
+    for filename in filenames:
+        stem = os.path.splitext(os.path.basename(filename))[0]
+        groups[(os.path.abspath(output_dir or os.path.dirname(filename)), stem)].append(filename)
+
+    stems = {}
+    for (_, stem), group in groups.items():
+        if len(group) == 1:
+            stems[group[0]] = stem
+            continue
+
+        directories = [os.path.dirname(os.path.abspath(filename)) for filename in group]
+        common_dir = os.path.commonpath(directories)
+        for filename, directory in zip(group, directories):
+            relative_dir = os.path.relpath(directory, common_dir)
+            stems[filename] = '_'.join(([] if relative_dir == '.' else relative_dir.split(os.sep)) + [stem])
+
+        group_stems = [stems[filename] for filename in group]
+        for filename in group:
+            if group_stems.count(stems[filename]) > 1:
+                stems[filename] += '_' + os.path.splitext(filename)[1].lstrip('.')
+
+    return stems
+
+# One row of the batch summary for a graded course
+def course_summary(filename, output_filename, grade_counts, statistics, method=None):
+
+    summary = {
+        "course": os.path.splitext(os.path.basename(filename))[0],
+        "input": filename,
+        "output": output_filename,
+        "method": method,
+        "status": "ok",
+        "error": "",
+        "students": int(grade_counts.sum()),
+        "mean": statistics["mean"],
+        "std_dev": statistics["std_dev"],
+        "min": statistics["min"],
+        "max": statistics["max"]
+    }
+
+    for grade, count in grade_counts.items():
+        summary[f"grade_{grade}"] = int(count)
+
+    return summary
+
+# Grade one file with the chosen method and save the result
+# Returns the course summary or None if the file could not be graded
+# output_stem names the output and plot files instead of the input file name (see batch_output_stems)
+@traced
+def grade_file(filename, method, grade_percentages, output_dir=None, chunksize=None, output_stem=None):
+
+    global PLOT_PREFIX
+
+    output_filename = batch_output_filename(filename, method, output_dir, OUTPUT_FORMAT, output_stem)
+    PLOT_PREFIX = (output_stem or os.path.splitext(os.path.basename(filename))[0]) + "_"   # Keep the plots of each course apart
+
+    # Large files are streamed through absolute or out-of-core relative grading without loading them into memory
+    if chunksize:
+        stream_grades = stream_absolute_grades if method == 'absolute' else stream_relative_grades
+        try:
+            grade_counts, statistics = stream_grades(filename, grade_percentages, output_filename, chunksize)
+        except Exception as e:
+            print(colored(f"An error occurred while grading {filename}: {e}", "red"))
+            return None
+
+        print_stream_summary(grade_counts, statistics, "Absolute Grading Results" if method == 'absolute' else "Relative Grading Results")
+        print(colored(f"Graded student data saved to {output_filename}.", "green"))
+        return course_summary(filename, output_filename, grade_counts, statistics, method)
+
+    student_data = read_file(filename)
+    if student_data is None:
+        return None
+
+    if method == 'auto' and 'Score' in student_data.columns:
+        method = choose_grading_method(student_data['Score'])
+        output_filename = batch_output_filename(filename, method, output_dir, OUTPUT_FORMAT, output_stem)
+
+    if method == 'absolute':
+        graded_data = calculate_absolute_grades(student_data, grade_percentages)
+        if graded_data is None or 'Grade' not in graded_data.columns:
+            return None
+
+    else:
+        # Z-score grading adjusts the grades produced by relative grading, as in main()
+        graded_data = calculate_relative_grades(student_data, grade_percentages)
+        if graded_data is None:
+            return None
+
+        if method == 'z-score':
+            graded_data = apply_z_score_grading(graded_data)[0]
+            if graded_data is None:
+                return None
+
+    try:
+        export_grades(graded_data, output_filename)
+    except Exception as e:
+        print(colored(f"Error saving file: {e}", "red"))
+        return None
+
+    grade_counts = graded_data['Grade'].value_counts(sort=False)
+    statistics = RunningStats().update(graded_data['Score']).as_dict(ddof=1)
+
+    return course_summary(filename, output_filename, grade_counts, statistics, method)
+
+
+# MULTI-COURSE PIPELINE
+# Grades many course files at once, each course in its own worker process
+# A failure in one course is reported in the summary and does not stop the other courses
+
+SCORE_FILE_PATTERNS = ['*.csv', '*.xls', '*.xlsx']
+
+# Module settings a worker process needs to grade a course the same way as the parent
+RUNTIME_SETTINGS = ['PLOT_MODE', 'PLOT_DIR', 'PLOT_FORMAT', 'SCORE_CACHE_DIR', 'OUTPUT_FORMAT',
+                    'REPORT_MODE', 'REPORT_TOP_N', 'REPORT_PAGE', 'REPORT_FILE', 'Z_SCORE_POLICY',
+                    'GRADE_MEMO_DIR', 'GRADE_MEMO_SIZE', 'BOOTSTRAP_RESAMPLES', 'BOOTSTRAP_LEVEL',
+                    'TRACE_FILE', 'TRACE_MEMORY']
+
+def runtime_settings():
+    return {name: globals()[name] for name in RUNTIME_SETTINGS}
+
+# Worker processes always run headless
+def apply_runtime_settings(settings):
+
+    globals().update(settings)
+    globals()['HEADLESS'] = True
+    globals()['BOOTSTRAP_WORKERS'] = 1                                  # Courses are already graded in parallel
+
+# Turn directories and glob patterns into a sorted list of score files
+# Graded outputs of earlier batch runs found in directories or by patterns are left out unless skip_graded is False,
+# files named one by one are always kept
+def expand_input_paths(inputs, patterns=SCORE_FILE_PATTERNS, skip_graded=True):
+
+    filenames = []
+
+    for path in inputs:
+        if os.path.isdir(path):
+            for pattern in patterns:
+                filenames += [filename for filename in sorted(glob.glob(os.path.join(path, pattern), recursive=True))
+                              if not (skip_graded and is_batch_output(filename))]
+
+        elif glob.has_magic(path):
+            filenames += [filename for filename in sorted(glob.glob(path)) if not (skip_graded and is_batch_output(filename))]
+
+        else:
+            filenames.append(path)
+
+    return list(dict.fromkeys(filenames))                                           # Drop duplicates, keep the order
+
+# Grade one course inside a worker process
+# Everything the course prints is kept out of the shared terminal, and any error becomes a failed summary row
+# settings are the parent's runtime settings, worker processes started with spawn do not inherit them
+# Returns the summary row and the trace events of the course (empty when tracing is off)
+def grade_course(filename, method, grade_percentages, output_dir=None, chunksize=None, settings=None, output_stem=None):
+
+    apply_runtime_settings(settings or {"PLOT_MODE": "none"})
+    TRACE_EVENTS.clear()                                                    # A worker grades many courses, each sends only its own
+
+    course_log = io.StringIO()
+
+    try:
+        with contextlib.redirect_stdout(course_log), trace_stage('grade_course', course=filename):
+            summary = grade_file(filename, method, grade_percentages, output_dir, chunksize, output_stem)
+        error = "" if summary is not None else last_log_line(course_log.getvalue())
+
+    except Exception as e:
+        summary = None
+        error = f"{type(e).__name__}: {e}"
+
+    if summary is None:
+        summary = failed_course_summary(filename, error or "The file could not be graded.")
+
+    return summary, list(TRACE_EVENTS)
+
+# Summary row for a course that could not be graded
+def failed_course_summary(filename, error):
+    return {
+        "course": os.path.splitext(os.path.basename(filename))[0],
+        "input": filename,
+        "output": "",
+        "status": "failed",
+        "error": error
+    }
+
+# Last printed line of a course log, used as the error message of a failed course
+def last_log_line(log_text):
+
+    lines = [line.strip() for line in log_text.splitlines() if line.strip()]
+    if not lines:
+        return ""
+
+    # Drop the colour codes termcolor adds
+    return re.sub(r'\x1b\[[0-9;]*m', '', lines[-1])
+
+# Grade courses in a process pool, returns the summaries of the finished courses and the courses left unfinished
+# because a worker process died (killed for running out of memory, crashed), which breaks the pool for every waiting course
+# With isolate=True every course gets a pool of its own, workers at a time, so a course that kills its worker fails alone
+def run_course_pool(filenames, course_arguments, workers=None, isolate=False):
+
+    summaries, broken = {}, []
+    batch_size = (workers or os.cpu_count() or 1) if isolate else max(len(filenames), 1)
+
+    for start in range(0, len(filenames), batch_size):
+        batch = filenames[start:start + batch_size]
+        executors = ([concurrent.futures.ProcessPoolExecutor(max_workers=1) for _ in batch] if isolate
+                     else [concurrent.futures.ProcessPoolExecutor(max_workers=workers)])
+
+        try:
+            futures = {
+                executors[position % len(executors)].submit(grade_course, filename, *course_arguments[filename]): filename
+                for position, filename in enumerate(batch)
+            }
+
+            for future in concurrent.futures.as_completed(futures):
+                filename = futures[future]
+
+                # A worker that raises only fails its own course
+                try:
+                    summaries[filename], trace_events = future.result()
+                    TRACE_EVENTS.extend(trace_events)
+                except concurrent.futures.process.BrokenProcessPool:
+                    broken.append(filename)
+                    continue
+                except Exception as e:
+                    summaries[filename] = failed_course_summary(filename, f"Worker failed: {e}")
+
+                status = summaries[filename]["status"]
+                print(colored(f"{status:>6}  {filename}", "green" if status == "ok" else "red"))
+
+        finally:
+            for executor in executors:
+                executor.shutdown()
+
+    return summaries, broken
+
+# Grade every file in a process pool, returns the course summaries in input order
+# Courses caught in a pool broken by a dying worker are graded again in a new pool,
+# each in a pool of its own when none of them finished, so one course that kills its worker only fails itself
+# workers=None uses one worker per CPU core
+@traced
+def run_pipeline(filenames, method, grade_percentages, output_dir=None, chunksize=None, workers=None):
+
+    summaries = {}
+    settings = runtime_settings()
+    output_stems = batch_output_stems(filenames, output_dir)
+    course_arguments = {
+        filename: (method, grade_percentages, output_dir, chunksize, settings, output_stems[filename]) for filename in filenames
+    }
+
+    pending, isolate = list(filenames), False
+    while pending:
+        finished, broken = run_course_pool(pending, course_arguments, workers, isolate)
+        summaries.update(finished)
+
+        if isolate:
+            for filename in broken:
+                summaries[filename] = failed_course_summary(filename, "The worker process grading it died.")
+                print(colored(f"failed  {filename}", "red"))
+            break
+
+        if broken:
+            print(colored(f"A worker process died, grading {len(broken)} courses again.", "yellow"))
+        isolate = not finished
+        pending = broken
+
+    return [summaries[filename] for filename in filenames]
+
+# Write the combined summary of all courses
+def save_batch_summary(summaries, filename):
+
+    summary_data = pd.DataFrame(summaries)
+
+    # Failed courses leave the counts empty, nullable integers keep the other counts whole numbers
+    count_columns = [column for column in summary_data.columns if column == 'students' or column.startswith('grade_')]
+    summary_data[count_columns] = summary_data[count_columns].astype('Int64')
+
+    summary_data.to_csv(filename, index=False)
+    print(colored(f"Batch summary saved to {filename}.", "green"))
+
+# Entry point for batch grading, returns the process exit code
+def run_batch(argv=None):
+
+    global HEADLESS, PLOT_MODE, PLOT_DIR, PLOT_FORMAT, SCORE_CACHE_DIR, GRADE_MEMO_DIR, GRADE_MEMO_SIZE
+    global REPORT_MODE, REPORT_TOP_N, REPORT_PAGE, REPORT_FILE, OUTPUT_FORMAT, TRACE_FILE, Z_SCORE_POLICY
+    global BOOTSTRAP_RESAMPLES, BOOTSTRAP_LEVEL
+    HEADLESS = True
+
+    args = parse_batch_arguments(argv)
+    TRACE_FILE = args.trace or TRACE_FILE
+
+    if args.serve:
+        try:
+            asyncio.run(run_service(args.host, args.port, args.workers))
+        except KeyboardInterrupt:
+            print(colored("Grading service stopped.", "green"))
+        return 0
+
+    if args.aggregate:
+        return run_aggregation(args)
+
+    if args.target:
+        return run_threshold_search(args)
+
+    try:
+        config = build_batch_config(args)
+    except (OSError, ValueError, ImportError) as e:
+        print(colored(f"Invalid batch configuration: {e}", "red"))
+        return 2
+
+    # A z-score policy replaces the cutoffs of z-score grading
+    if config['policy'] and load_policy(config['policy']).scale == 'z-score':
+        Z_SCORE_POLICY = config['policy']
+
+    filenames = expand_input_paths(config['inputs'])
+    if not filenames:
+        print(colored("No input files were provided.", "red"))
+        return 2
+
+    if config['output_dir']:
+        os.makedirs(config['output_dir'], exist_ok=True)
+
+    OUTPUT_FORMAT = config['output_format']
+    REPORT_MODE = args.report or REPORT_MODE
+    REPORT_TOP_N = args.top if args.top is not None else REPORT_TOP_N
+    REPORT_PAGE = args.page if args.page is not None else REPORT_PAGE
+    REPORT_FILE = args.report_file or REPORT_FILE
+    BOOTSTRAP_RESAMPLES = args.bootstrap if args.bootstrap is not None else BOOTSTRAP_RESAMPLES
+    BOOTSTRAP_LEVEL = args.confidence if args.confidence is not None else BOOTSTRAP_LEVEL
+
+    if args.no_cache:
+        SCORE_CACHE_DIR = None
+    elif args.cache_dir:
+        SCORE_CACHE_DIR = args.cache_dir
+
+    if args.no_memo:
+        GRADE_MEMO_DIR, GRADE_MEMO_SIZE = None, 0
+    elif args.memo_dir:
+        GRADE_MEMO_DIR = args.memo_dir
+
+    # Plots are only drawn when they have somewhere to go, skipping them never imports matplotlib
+    PLOT_MODE = "file" if config['plots_dir'] else "none"
+    PLOT_DIR, PLOT_FORMAT = config['plots_dir'] or PLOT_DIR, config['plot_format']
+
+    parallel_courses = config['workers'] and config['workers'] > 1
+    if PLOT_MODE == "file" and config['plot_workers'] and not parallel_courses:
+        start_plot_pool(config['plot_workers'])
+
+    # Several workers grade the courses in parallel, otherwise each course is graded here with its full output
+    if parallel_courses:
+        summaries = run_pipeline(filenames, config['method'], config['grade_percentages'],
+                                 config['output_dir'], config['chunksize'], config['workers'])
+    else:
+        summaries = []
+        output_stems = batch_output_stems(filenames, config['output_dir'])
+        for filename in filenames:
+            print_coloured_line(f"Grading {filename}", "yellow")
+
+            summary = grade_file(filename, config['method'], config['grade_percentages'],
+                                 config['output_dir'], config['chunksize'], output_stems[filename])
+            summaries.append(summary if summary is not None else failed_course_summary(filename, "The file could not be graded."))
+
+    if PLOT_POOL is not None and wait_for_plots():
+        print(colored("Some plots could not be rendered.", "red"))
+
+    failed = [summary for summary in summaries if summary["status"] != "ok"]
+
+    print_coloured_line("Batch Grading Finished", "green")
+    print(f"Graded {len(summaries) - len(failed)} of {len(summaries)} files.")
+
+    for summary in failed:
+        print(colored(f"Failed: {summary['input']} ({summary['error']})", "red"))
+
+    # Combined summary when asked for or when more than one course was graded
+    summary_filename = config['summary'] or (
+        os.path.join(config['output_dir'] or '.', 'grading_summary.csv') if len(summaries) > 1 else None
+    )
+    if summary_filename:
+        save_batch_summary(summaries, summary_filename)
+
+    return 1 if failed else 0
+
+
+# INCREMENTAL GRADING
+# Keeps a graded cohort up to date when single students are added, corrected or removed
+# Students are kept in rank order (highest score first, equal scores by row position) with exact sums of the scores
+# and their squares, so a change only regrades the students that can actually move:
+#   relative  the students around each band limit, as band sizes follow the number of students
+#   z-score   the students between the old and new cutoff scores, as the mean and standard deviation shift
+#   absolute  only the student that changed
+# The sums are fractions, so a removed score leaves no rounding error behind and the mean of whole-number scores
+# is exact, as a mean off by a rounding error would put a student on the other side of a cutoff
+# Every change returns the same Name/From/To movement table as apply_z_score_grading
+# New students have no From grade and removed students have no To grade
+# IncrementalGrader is a library class for callers that keep a cohort in memory, the CLI and service grade whole files
+
+# Exact sum of an array of floats as a fraction
+# Every float is an integer mantissa times a power of two, mantissas with the same power of two are added as integers
+def exact_sum(values):
+
+    mantissas, exponents = np.frexp(np.asarray(values, dtype=np.float64))
+    mantissas = np.ldexp(mantissas, 53).astype(np.int64)
+
+    total = fractions.Fraction(0)
+    for exponent in np.unique(exponents):
+        group = mantissas[exponents == exponent]
+        # Mantissas are added in 26-bit halves so the sums fit in 64 bits for up to a billion scores
+        group_sum = (int((group >> 26).sum()) << 26) + int((group & (2 ** 26 - 1)).sum())
+        total += fractions.Fraction(group_sum) * fractions.Fraction(2) ** (int(exponent) - 53)
+
+    return total
+
+# Exact sum of the squares of an array of floats as a fraction
+# Every square is split into its rounded value and rounding error (Dekker's product), both of them floats,
+# which is exact as long as the squares neither overflow nor underflow (scores between about 1e-140 and 1e150)
+def exact_square_sum(values):
+
+    values = np.asarray(values, dtype=np.float64)
+    squares = values * values
+    split = values * 134217729.0                                    # 2 ** 27 + 1 splits a float into two 26-bit halves
+    high = split - (split - values)
+    low = values - high
+    errors = ((high * high - squares) + 2 * high * low) + low * low
+
+    return exact_sum(squares) + exact_sum(errors)
+
+# Sorted list stored as short sorted blocks, so adding or removing an item only shifts one block
+# Finding an item or the item at a rank reads the block sizes, about BLOCK_SIZE items per block
+class RankedList:
+
+    BLOCK_SIZE = 1000
+
+    def __init__(self, items=()):
+        items = sorted(items)
+        self.blocks = [items[start:start + self.BLOCK_SIZE] for start in range(0, len(items), self.BLOCK_SIZE)]
+        self.maxes = [block[-1] for block in self.blocks]               # Last item of every block
+        self.sizes = [len(block) for block in self.blocks]
+        self.count = len(items)
+
+    def __len__(self):
+        return self.count
+
+    # Block the item belongs in, the last block for items after all others
+    def block_of(self, item):
+        return min(bisect.bisect_left(self.maxes, item), len(self.blocks) - 1)
+
+    # Number of items before the item
+    def rank(self, item):
+
+        if not self.blocks:
+            return 0
+
+        index = self.block_of(item)
+        return sum(self.sizes[:index]) + bisect.bisect_left(self.blocks[index], item)
+
+    def add(self, item):
+
+        self.count += 1
+        if not self.blocks:
+            self.blocks, self.maxes, self.sizes = [[item]], [item], [1]
+            return
+
+        index = self.block_of(item)
+        block = self.blocks[index]
+        bisect.insort(block, item)
+        self.maxes[index] = block[-1]
+        self.sizes[index] += 1
+
+        # A block twice the size is split in two
+        if len(block) >= 2 * self.BLOCK_SIZE:
+            halves = [block[:self.BLOCK_SIZE], block[self.BLOCK_SIZE:]]
+            self.blocks[index:index + 1] = halves
+            self.maxes[index:index + 1] = [half[-1] for half in halves]
+            self.sizes[index:index + 1] = [len(half) for half in halves]
+
+    def remove(self, item):
+
+        index = self.block_of(item)
+        block = self.blocks[index]
+        del block[bisect.bisect_left(block, item)]
+        self.count -= 1
+
+        if block:
+            self.maxes[index] = block[-1]
+            self.sizes[index] -= 1
+        else:
+            del self.blocks[index], self.maxes[index], self.sizes[index]
+
+    # Items at the given ranks, in ascending rank order
+    def at(self, ranks):
+
+        ends = list(itertools.accumulate(self.sizes))
+        items = []
+        for rank in ranks:
+            index = bisect.bisect_right(ends, rank)
+            items.append(self.blocks[index][rank - ends[index] + self.sizes[index]])
+
+        return items
+
+class IncrementalGrader:
+
+    def __init__(self, names, scores, method, grade_percentages):
+
+        names = list(names)
+        scores = np.asarray(scores, dtype=np.float64)
+
+        if method not in BATCH_METHODS:
+            raise ValueError(f"Unknown grading method '{method}'.")
+        if len(set(names)) != len(names):
+            raise ValueError("Student names must be unique.")
+
+        self.method = method
+        self.grade_percentages = grade_percentages
+        self.scores = dict(zip(names, scores.tolist()))
+        self.row_positions = dict(zip(names, range(len(names))))                  # Breaks ties between equal scores
+        self.next_row_position = len(names)
+
+        known = scores[~np.isnan(scores)]
+        self.score_count = len(known)
+        self.score_sum = exact_sum(known)
+        self.square_sum = exact_square_sum(known)
+
+        # Rank order of (key, row position, name), the key is the negated score so ascending keys are descending
+        # scores, missing scores rank last
+        rank_keys = self.rank_key(scores)
+        order = np.lexsort((np.arange(len(names)), rank_keys))
+        self.ranked = RankedList(zip(rank_keys[order].tolist(), order.tolist(), np.asarray(names, dtype=object)[order].tolist()))
+
+        # Grade labels of relative grading, "F" is replaced by the last grade like relative_grade_codes does
+        grades = list(grade_percentages.keys())
+        self.relative_labels = np.asarray([grades[-1] if grade == "F" else grade for grade in grades] + [grades[-1]], dtype=object)
+
+        ranks = np.empty(len(names), dtype=np.int64)
+        ranks[order] = np.arange(len(names))
+        self.grades = dict(zip(names, self.grades_of(ranks, scores)))
+
+    @staticmethod
+    def rank_key(scores):
+        keys = -np.asarray(scores, dtype=np.float64)
+        keys[np.isnan(keys)] = np.inf
+        return keys
+
+    # Mean and sample variance of the known scores, rounded once from the exact sums
+    def mean_and_variance(self):
+
+        if self.score_count == 0:
+            return np.nan, np.nan
+
+        mean = self.score_sum / self.score_count
+        if self.score_count == 1:
+            return float(mean), np.nan
+
+        return float(mean), float((self.square_sum - self.score_sum * mean) / (self.score_count - 1))
+
+    # Grades of the students at the given ranks, scores are the same students' scores
+    def grades_of(self, ranks, scores):
+
+        if self.method == 'relative':
+            band_limits = relative_band_limits(self.grade_percentages, len(self.ranked))
+            return self.relative_labels[np.searchsorted(band_limits, ranks, side='right')]
+
+        if self.method == 'z-score':
+            mean, variance = self.mean_and_variance()
+            with np.errstate(divide='ignore', invalid='ignore'):                     # Equal scores have no spread
+                z_scores = (np.asarray(scores, dtype=np.float64) - mean) / np.sqrt(variance)
+            codes, categories = absolute_grade_codes(z_scores, z_score_policy())
+        else:
+            codes, categories = absolute_grade_codes(scores, self.grade_percentages)
+
+        return np.asarray(categories, dtype=object)[codes]
+
+    # Entry of a student in the rank order
+    def ranked_entry(self, name, score, row_position):
+        return (float(self.rank_key([score])[0]), row_position, name)
+
+    # Score cutoffs of z-score grading with the current mean and standard deviation
+    def z_score_cutoffs(self):
+        mean, variance = self.mean_and_variance()
+        return [mean + cutoff * np.sqrt(variance) for cutoff in z_score_policy().grades.values()]
+
+    # Ranks of the students whose score lies between two cutoffs, both included
+    # The range is widened by a few rounding errors, as a z-score and a cutoff score are rounded differently
+    def ranks_between(self, low_score, high_score):
+        margin = 1e-9 * max(abs(low_score), abs(high_score), 1.0)
+        start = self.ranked.rank((-(high_score + margin),))
+        end = self.ranked.rank((-(low_score - margin), np.inf))
+        return range(start, end)
+
+    # Add a new student
+    def insert(self, name, score):
+
+        if name in self.scores:
+            raise ValueError(f"'{name}' is already graded, use update() to correct a score.")
+
+        self.next_row_position += 1
+        return self.apply_change(added=(name, float(score), self.next_row_position - 1))
+
+    # Correct a student's score, the student keeps their row position
+    def update(self, name, score):
+
+        if name not in self.scores:
+            raise KeyError(name)
+
+        return self.apply_change(removed=name, added=(name, float(score), self.row_positions[name]))
+
+    # Remove a student
+    def delete(self, name):
+
+        if name not in self.scores:
+            raise KeyError(name)
+
+        return self.apply_change(removed=name)
+
+    # Add or take out a score from the exact sums
+    def count_score(self, score, sign):
+
+        if np.isnan(score):
+            return
+
+        exact = fractions.Fraction(score)
+        self.score_count += sign
+        self.score_sum += sign * exact
+        self.square_sum += sign * exact * exact
+
+    def apply_change(self, removed=None, added=None):
+
+        old_total = len(self.ranked)
+        old_band_limits = relative_band_limits(self.grade_percentages, old_total) if self.method == 'relative' else []
+        old_cutoffs = self.z_score_cutoffs() if self.method == 'z-score' else []
+        old_grades = {}
+
+        if removed is not None:
+            score = self.scores.pop(removed)
+            self.ranked.remove(self.ranked_entry(removed, score, self.row_positions[removed]))
+            self.count_score(score, -1)
+            old_grades[removed] = self.grades.pop(removed)
+            if added is None:
+                del self.row_positions[removed]
+
+        if added is not None:
+            name, score, row_position = added
+            self.ranked.add(self.ranked_entry(name, score, row_position))
+            self.count_score(score, 1)
+            self.scores[name] = score                                       # A corrected student keeps their place in row order
+            self.row_positions[name] = row_position
+
+        total = len(self.ranked)
+        candidate_ranks = set()
+
+        if self.method == 'relative':
+            # Every other student moves at most one rank, so only ranks next to a band limit can change band
+            for old_limit, new_limit in zip(old_band_limits, relative_band_limits(self.grade_percentages, total)):
+                candidate_ranks.update(range(max(min(old_limit, new_limit) - 2, 0), min(max(old_limit, new_limit) + 1, total)))
+
+        elif self.method == 'z-score':
+            new_cutoffs = self.z_score_cutoffs()
+            if np.all(np.isfinite(old_cutoffs + new_cutoffs)):
+                for old_cutoff, new_cutoff in zip(old_cutoffs, new_cutoffs):
+                    candidate_ranks.update(self.ranks_between(min(old_cutoff, new_cutoff), max(old_cutoff, new_cutoff)))
+            else:
+                candidate_ranks.update(range(total))                              # Too few students for a spread, regrade all
+
+        if added is not None:
+            candidate_ranks.add(self.ranked.rank(self.ranked_entry(*added)))
+
+        # Regrade only the candidates and keep the ones whose grade changed
+        ranks = sorted(candidate_ranks)
+        names = [name for _, _, name in self.ranked.at(ranks)]
+        new_grades = self.grades_of(np.asarray(ranks, dtype=np.int64), [self.scores[name] for name in names])
+
+        movements = []
+        for name, grade in zip(names, new_grades):
+            previous = old_grades.pop(name, self.grades.get(name))
+            if previous != grade:
+                movements.append({'Name': name, 'From': previous, 'To': grade})
+            self.grades[name] = grade
 
-    # Show the Z-Score grading plot
-    sns.histplot(student_data['Score'], kde=True)
-    plt.title("Adjusted Distribution After Z-Score Grading")
-    plt.xlabel('Score')
-    plt.ylabel('Frequency')
-    plt.show()
+        # A removed student that was not added back
+        for name, grade in old_grades.items():
+            movements.append({'Name': name, 'From': grade, 'To': None})
 
-    # Return updated grades using z-score grading
-    return student_data
+        return pd.DataFrame(movements, columns=['Name', 'From', 'To'])
 
+    # Current grades in row order, the same table the grading functions return
+    def grade_table(self):
 
+        names = sorted(self.scores, key=self.row_positions.get)
+        return pd.DataFrame({
+            'Name': names,
+            'Score': [self.scores[name] for name in names],
+            'Grade': [self.grades[name] for name in names]
+        })
 
-def main():
+    # Statistics of the current cohort
+    # Mean and spread come from the exact sums and min and max from the rank order, skewness and kurtosis
+    # are computed from the stored scores when asked for
+    def statistics(self):
 
-    clear_terminal()
+        statistics = RunningStats().update(np.fromiter(self.scores.values(), dtype=np.float64, count=len(self.scores))).as_dict(ddof=1)
+        mean, variance = self.mean_and_variance()
+        statistics.update({"mean": mean, "variance": variance, "std_dev": np.sqrt(variance)})
 
-    # Outer Loop for file selection and reading
-    while True:
-        # Bool to check if a file with valid data has been read
-        file_selected = False
+        known = self.ranked.rank((np.inf,))
+        statistics["min"] = -self.ranked.at([known - 1])[0][0] if known else np.nan
+        statistics["max"] = -self.ranked.at([0])[0][0] if known else np.nan
 
-        while not file_selected:
-            print_coloured_line("Input Module" , "green")
-            print("Choose an option:\n")
-            print("1. Create a new student scores file")
-            print("2. Provide an existing file")
-            choice = input("\nType here : ").strip()
+        return statistics
 
-            if choice == '1':
-                filename = create_student_scores()                              # Create a new file
-                if filename:                                                    # If a file is created
-                    student_data = read_file(filename)                          # Read the file
-                    if student_data is not None:                                # If the file is read successfully
-                        file_selected = True
 
-            elif choice == '2':
-                clear_terminal()
-                print_coloured_line("Student Scores Input" , "green")
+# COHORT AGGREGATION
+# Loads many graded files into one columnar table and summarises it per term, course, section and grading method
+# The method of a file comes from its batch output suffix ("_graded_relative" and so on) and the cohort from the rest
+# of its path, by default "[<term>/]<course>[_<section>]" such as "2024F/CS101_S1_graded.csv", or
+# "<term>_<course>[_<section>]" like the stems batch_output_stems gives ("2024F_CS101_graded_relative.csv")
+# A term starts with a four-digit year, parts the pattern does not find are left empty
+# Files without a batch output suffix or of another shape, like the graded_students files of the menu, are rejected
+# Every summary is computed for all cohorts at once from integer group codes, not file by file
 
-                # Loop until a valid file is selected
-                while True:
-                    clear_terminal()
-                    print_coloured_line("Student Scores Input", "green")
+COHORT_KEYS = ['term', 'course', 'section', 'method']
+COHORT_PATTERN = r'(?:^|[/\\])(?:(?P<term>\d{4}[A-Za-z0-9-]*)[/\\_])?(?P<course>[^/\\_]+)(?:_(?P<section>[^/\\_]+))?$'
 
-                    print("Enter the filename (with extension, e.g., file.csv or file.xlsx)")
-                    print("If file is not in the same directory , please specify the directory as well")
-                    print("Enter '0' to go back")
-                    filename = input("\nType here : ").strip()
+# Grading method of every batch output suffix, longest first so "graded_relative" is not taken for "graded"
+GRADED_SUFFIX_METHODS = sorted(((suffix, method) for method, suffix in BATCH_OUTPUT_SUFFIX.items() if method != 'auto'),
+                               key=lambda item: -len(item[0]))
 
-                    if filename == '0':
-                        file_selected = False
-                        clear_terminal()
-                        break
+# Graded outputs in any export format, directories are searched recursively
+GRADED_FILE_PATTERNS = [f"**/*graded*{extension}" for extension, _, _ in EXPORT_FORMATS.values()]
 
-                    student_data = read_file(filename)
-                    if student_data is not None:
-                        file_selected = True
-                        break
+# Columns read from each graded file
+GRADED_COLUMNS = ['Score', 'Grade']
 
-                    if os.path.exists(filename):
-                        read_file(filename)
-                        file_selected = True
-                        clear_terminal()
-                        break
-                    else:
-                        clear_terminal()
-                        print_coloured_line("Student Scores Input", "green")
-                        print(colored(f"Error: The file '{filename}' does not exist. Please provide a valid file.", "red"))
-                        enter_to_continue()
+# Score bins of the cohort histograms
+COHORT_HISTOGRAM_EDGES = np.linspace(0, 100, 11)
 
-            else:
-                print(colored("\nInvalid choice." , "red"))
-                enter_to_continue()
-                clear_terminal()
+# Term, course, section and grading method of a graded file
+# The pattern is matched against the path without its extension and batch output suffix
+def cohort_keys(filename, pattern=COHORT_PATTERN):
 
+    path = os.path.splitext(filename)[0]
+    for suffix, method in GRADED_SUFFIX_METHODS:
+        if path.endswith(f"_{suffix}"):
+            path = path[:-len(suffix) - 1]
+            break
+    else:
+        raise ValueError(f"'{filename}' is not a batch grading output such as CS101_S1_graded_relative.csv.")
 
-        # Input for relative or absolute grading
-        grading_method_seleted = False
+    match = re.search(pattern, path)
+    if not match:
+        raise ValueError(f"'{filename}' does not name a cohort, expected a path like 2024F/CS101_S1_graded.csv.")
 
-        # Loop for selecting a grading method
-        while not grading_method_seleted:
-            clear_terminal()
-            print_coloured_line("Grading method" , "yellow")
+    groups = match.groupdict()
+    keys = {key: groups.get(key) or '' for key in COHORT_KEYS}
+    keys['method'] = method
 
-            print("Select grading type:")
-            print(colored("\n1. Relative Grading" , "cyan"))
-            print(colored("2. Absolute Grading\n" , "magenta"))
+    if not keys['course']:
+        keys['course'] = os.path.basename(path)
 
-            grading_choice = input("Enter the number of your choice: ").strip()
+    return keys
 
-            if grading_choice == '1':
-                clear_terminal()
-                print_coloured_line("Relative Grading selected" , "cyan")
-                print("\nYou chose relative grading.")
-                enter_to_continue()
-                grading_method_seleted = True
+# Read only the Score and Grade columns of a graded file
+# Feather files are memory-mapped, Parquet files read just the two columns
+def load_graded_file(filename):
 
-            elif grading_choice == '2':
-                clear_terminal()
-                print_coloured_line("Absolute Grading selected" , "magenta")
-                print("\nYou chose absolute grading.")
-                enter_to_continue()
-                grading_method_seleted = True
+    file_format = export_format_from_filename(filename)
 
-            else:
-                print(colored("\nInvalid choice." , "red"))
-                enter_to_continue()
+    if file_format == 'feather':
+        import pyarrow.feather
+        return pyarrow.feather.read_table(filename, columns=GRADED_COLUMNS, memory_map=True).to_pandas()
 
-        # Input for the grading scale
-        grading_scale_selected = False
+    if file_format == 'parquet':
+        return pd.read_parquet(filename, columns=GRADED_COLUMNS)
 
-        grade_category = ['A', 'B', 'C', 'D', 'F']              # Store grades
-        grade_percentages = {}                                  # Stores grades theresholds
-        total_percentage = 0                                    # Total percentage of grades entered in relative grading
+    return pd.read_csv(filename, usecols=GRADED_COLUMNS, dtype={'Score': 'float32', 'Grade': 'category'})
 
-        while not grading_scale_selected:
+# One table of every graded student with categorical term, course and section columns
+def load_cohorts(filenames, pattern=COHORT_PATTERN):
 
-            # Relative
-            if grading_choice == '1':
-            
-                    for grade in grade_category:
-                        while True:
-                            clear_terminal()
-                            print_coloured_line("Grading Scale" , "cyan")
-                            print(f"Enter percentage for grade {grade}", "cyan")
+    if not filenames:
+        raise ValueError("No graded files were given.")
 
-                            user_input = input(f"Enter percentage for grade {grade}: ").strip()
+    frames = [load_graded_file(filename) for filename in filenames]
+    file_keys = [cohort_keys(filename, pattern) for filename in filenames]
 
-                            # Validate input
-                            try:
-                                percentage = float(user_input)
+    # Row -> file, then file -> cohort, so the key columns are built from codes without repeating strings
+    file_codes = np.repeat(np.arange(len(frames)), [len(frame) for frame in frames])
 
-                                if 0 <= percentage <= 100:                                              # Ensure percentage is valid
-                                    total_percentage += percentage
+    cohorts = {}
+    for key in COHORT_KEYS:
+        categories, codes = np.unique([keys[key] for keys in file_keys], return_inverse=True)
+        cohorts[key] = pd.Categorical.from_codes(codes[file_codes], categories)
 
-                                    # Check if total exceeds 100 while entering
-                                    if total_percentage > 100:
-                                        print(colored(f"The total percentage exceeds 100%.", "red"))
-                                        enter_to_continue()
-                                        break                                                           # Break out to restart the whole process from A if percentage exceeds 100
+    cohorts['Score'] = np.concatenate([frame['Score'].to_numpy(dtype=np.float32) for frame in frames])
+    cohorts['Grade'] = pd.api.types.union_categoricals(
+        [categorical_grades(frame['Grade']) for frame in frames], sort_categories=True
+    )
 
-                                    grade_percentages[grade] = percentage
-                                    break                                                               # Exit the loop once valid input is entered
-                                else:
-                                    print(colored("Please enter a percentage between 0 and 100.", "red"))
-                                    enter_to_continue()
+    return pd.DataFrame(cohorts)
 
-                            except ValueError:                                                           # Handle invalid input above 100
-                                print(colored("Invalid input. Please enter a numeric value between 0 and 100.", "red"))
-                                enter_to_continue()
+# Group code of every row and the cohort of every code, no columns means a single cohort of everyone
+def cohort_groups(cohorts, by):
 
-                        # If the total exceeded during the input for this grade, restart from A
-                        if total_percentage > 100:
-                            break
+    if not by:
+        return np.zeros(len(cohorts), dtype=np.intp), pd.Index(['all'], name='cohort')
 
-                    # Final check after all grades have been entered
-                    if total_percentage == 100:
-                        grading_scale_selected = True
-                        break  # Exit the process if everything is valid
+    grouped = cohorts.groupby(list(by), observed=True, sort=True)
 
-                    else:
-                        print(colored("The total percentage is not exactly 100%. Restarting from grade A!", "red"))
-                        total_percentage = 0
-                        enter_to_continue()
+    return grouped.ngroup().to_numpy(), grouped.size().index
 
-            # Absolute
-            elif grading_choice == '2':
-                previous_threshold = 100
-                for grade in grade_category[:-1]:                                                       # Exclude 'F' as F is calculated as D - 1
-                    while True:
-                        clear_terminal()
-                        print_coloured_line("Grading Scale", "magenta")
-                        user_input = input(f"Enter minimum percentage thresehold for grade {grade}: ").strip()
+# Count, moments and five-number summary of the scores of every cohort
+# Moments follow RunningStats: sample variance, skewness and excess kurtosis like scipy's defaults
+def cohort_statistics(cohorts, by):
 
-                        # Validate input
-                        try:
-                            threshold = float(user_input)
-                            if 0 <= threshold <= previous_threshold:                                    # Ensure thresholds are valid and descending
-                                grade_percentages[grade] = threshold
-                                previous_threshold = threshold
-                                break
+    codes, groups = cohort_groups(cohorts, by)
+    scores = cohorts['Score'].to_numpy(dtype=np.float64)
+    known = ~np.isnan(scores)
+    codes, scores = codes[known], scores[known]
+    total_groups = len(groups)
 
-                            else:
-                                print(colored(f"Please enter a value between 0 and {previous_threshold}.", "red"))
-                                enter_to_continue()
+    count = np.bincount(codes, minlength=total_groups)
+    deviations = np.empty_like(scores)
 
-                        except ValueError:
-                            print(colored("Invalid input. Please enter a numeric value.", "red"))
-                            enter_to_continue()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.bincount(codes, scores, total_groups) / count
+        np.subtract(scores, mean[codes], out=deviations)
+        squared = deviations * deviations
+        m2 = np.bincount(codes, squared, total_groups)
+        m3 = np.bincount(codes, squared * deviations, total_groups)
+        m4 = np.bincount(codes, squared * squared, total_groups)
 
-                grade_percentages['F'] = grade_percentages['D'] - 1
-                grading_scale_selected = True
+        variance = np.where(count > 1, m2 / (count - 1), np.nan)
+        skewness = np.where(m2 > 0, np.sqrt(count) * m3 / m2 ** 1.5, np.nan)
+        kurtosis = np.where(m2 > 0, count * m4 / m2 ** 2 - 3, np.nan)
 
-        clear_terminal()
-        print_coloured_line("Grading scale" , "yellow")
+    # One sort by cohort then score gives the minimum, median and maximum of every cohort
+    ranked = scores[np.lexsort((scores, codes))]
+    starts = np.cumsum(count) - count
+    present = count > 0
 
-        # Show the percentages entered
-        print("Percentages entered\n")
+    def ranked_at(positions):
+        values = np.full(total_groups, np.nan)
+        values[present] = ranked[positions[present]]
+        return values
 
-        for grade, percentage in grade_percentages.items():
-            print(f"Grade {grade}: {percentage}%")
-        print('\n')
+    return pd.DataFrame({
+        'students': count,
+        'mean': mean,
+        'variance': variance,
+        'std_dev': np.sqrt(variance),
+        'skewness': skewness,
+        'kurtosis': kurtosis,
+        'min': ranked_at(starts),
+        'median': (ranked_at(starts + (count - 1) // 2) + ranked_at(starts + count // 2)) / 2,
+        'max': ranked_at(starts + count - 1)
+    }, index=groups)
 
-        enter_to_continue()
+# Students per grade in every cohort, or the share of each grade in percent
+def cohort_grade_distribution(cohorts, by, shares=False):
 
+    codes, groups = cohort_groups(cohorts, by)
+    grades = cohorts['Grade'].cat
+    grade_codes = grades.codes.to_numpy()
+    known = grade_codes >= 0
+    total_grades = len(grades.categories)
 
-    # STATISTICAL ANALYSIS 
-        clear_terminal()
+    counts = np.bincount(codes[known] * total_grades + grade_codes[known], minlength=len(groups) * total_grades)
+    distribution = pd.DataFrame(counts.reshape(len(groups), total_grades), index=groups, columns=list(grades.categories))
 
-        if grading_choice == '1':
+    if shares:
+        distribution = distribution.div(distribution.sum(axis=1), axis=0) * 100
 
-            student_data = calculate_relative_grades(student_data, grade_percentages)
-            # A copy of is made after relative grading to keep the original data in case user wants to store according to their percentages
-            original_data = student_data.copy()
-            adjusted_data = apply_z_score_grading(student_data)
+    return distribution
 
+# Score histogram of every cohort, scores outside the edges are counted in the first or last bin
+def cohort_histograms(cohorts, by, bin_edges=COHORT_HISTOGRAM_EDGES):
 
+    codes, groups = cohort_groups(cohorts, by)
+    scores = cohorts['Score'].to_numpy()
+    known = ~np.isnan(scores)
+    total_bins = len(bin_edges) - 1
 
-        elif grading_choice == '2':
+    bins = np.clip(np.searchsorted(bin_edges, scores[known], side='right') - 1, 0, total_bins - 1)
+    counts = np.bincount(codes[known] * total_bins + bins, minlength=len(groups) * total_bins)
+    columns = [f"{low:g}-{high:g}" for low, high in zip(bin_edges[:-1], bin_edges[1:])]
+
+    return pd.DataFrame(counts.reshape(len(groups), total_bins), index=groups, columns=columns)
+
+# Every cohort against a baseline cohort, or against all cohorts together when no baseline is given
+# The baseline is written like the cohort, with its parts joined by "/" when grouping by several columns
+# Shows the mean difference, its effect size (Cohen's d) and the change in every grade share in percentage points
+def compare_cohorts(cohorts, by, baseline=None):
 
-            student_data = calculate_absolute_grades(student_data , grade_percentages)
+    statistics = cohort_statistics(cohorts, by)
+    shares = cohort_grade_distribution(cohorts, by, shares=True)
+
+    if baseline is None:
+        reference = cohort_statistics(cohorts, []).iloc[0]
+        reference_shares = cohort_grade_distribution(cohorts, [], shares=True).iloc[0]
+    else:
+        key = tuple(baseline.split('/')) if len(by) > 1 else baseline
+        if key not in statistics.index:
+            raise KeyError(f"Baseline cohort '{baseline}' was not found.")
+        reference = statistics.loc[key]
+        reference_shares = shares.loc[key]
 
+    pooled_variance = (((statistics['students'] - 1) * statistics['variance'] + (reference['students'] - 1) * reference['variance'])
+                       / (statistics['students'] + reference['students'] - 2))
 
-    # Save graded data to CSV
+    comparison = pd.DataFrame({
+        'students': statistics['students'],
+        'mean': statistics['mean'],
+        'mean_difference': statistics['mean'] - reference['mean'],
+        'effect_size': (statistics['mean'] - reference['mean']) / np.sqrt(pooled_variance),
+        'std_dev_ratio': statistics['std_dev'] / reference['std_dev']
+    })
 
-        clear_terminal()
-        print_coloured_line("Save File Creation" , "green")
-        print("Grade Calculation Completed")
+    share_differences = shares - reference_shares
+    share_differences.columns = [f"share_{grade}_difference" for grade in share_differences.columns]
 
-        save = input("Would you like to save the grades in a CSV? (y/n): ").strip()
+    return comparison.join(share_differences)
+
+# Entry point of --aggregate, prints the cohort tables and saves them to the output directory when one is given
+def run_aggregation(args):
+
+    filenames = expand_input_paths(args.inputs, GRADED_FILE_PATTERNS, skip_graded=False)
+    if not filenames:
+        print(colored("No graded files were found.", "red"))
+        return 2
+
+    by = [key.strip() for key in args.group_by.split(',') if key.strip()]
+    unknown = [key for key in by if key not in COHORT_KEYS]
+    if unknown:
+        print(colored(f"Unknown cohort columns: {', '.join(unknown)}. Use any of {', '.join(COHORT_KEYS)}.", "red"))
+        return 2
+
+    pattern = args.cohort_pattern or COHORT_PATTERN
 
+    try:
+        # Files that do not name a cohort are left out, the others are graded outputs of a course
+        cohort_files = {}
+        for filename in filenames:
+            try:
+                cohort_files[filename] = cohort_keys(filename, pattern)
+            except ValueError as e:
+                print(colored(f"Skipped: {e}", "yellow"))
+        filenames = list(cohort_files)
+        if not filenames:
+            print(colored("No graded files of a cohort were found.", "red"))
+            return 2
+
+        # A course graded with several methods would count its students once per method
+        if 'method' not in by:
+            methods = collections.defaultdict(set)
+            for keys in cohort_files.values():
+                methods[tuple(keys[key] for key in COHORT_KEYS if key != 'method')].add(keys['method'])
+            mixed = ['/'.join(part for part in cohort if part) for cohort, cohort_methods in methods.items() if len(cohort_methods) > 1]
+            if mixed:
+                print(colored(f"{', '.join(mixed)} were graded with several methods, add method to --group-by "
+                              f"or aggregate the outputs of one method.", "red"))
+                return 2
+
+        cohorts = load_cohorts(filenames, pattern)
+        tables = {
+            'statistics': cohort_statistics(cohorts, by),
+            'grades': cohort_grade_distribution(cohorts, by),
+            'histograms': cohort_histograms(cohorts, by),
+            'comparison': compare_cohorts(cohorts, by, args.baseline)
+        }
+    except (OSError, ValueError, KeyError, ImportError, re.error) as e:
+        print(colored(f"Could not aggregate the graded files: {e}", "red"))
+        return 1
+
+    print_coloured_line(f"Cohorts of {len(filenames)} files, {len(cohorts)} students", "green")
+
+    for name, table in tables.items():
+        print_coloured_line(f"Cohort {name}", "yellow")
+        print(table.round(2).to_string())
+        print()
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for name, table in tables.items():
+            table.to_csv(os.path.join(args.output_dir, f"cohort_{name}.csv"))
+        print(colored(f"Cohort tables saved to {args.output_dir}.", "green"))
+
+    return 0
+
+
+# GRADING SERVICE
+# A small HTTP API so other systems (e.g. the LMS) can grade scores without running the menu
+# Uses only asyncio from the standard library, grading runs in a process pool so the event loop keeps serving
+#
+#   GET  /health   -> {"status": "ok"}
+#   POST /grade    -> grades, grade counts and statistics
+#
+# /grade accepts either
+#   JSON:  {"method": "relative", "grade_percentages": {"A": 20, ...}, "scores": [...], "names": [...]}
+#   CSV:   a Name,Score file as the body (Content-Type: text/csv) with the config in the query string,
+#          e.g. /grade?method=absolute&grade_percentages=A=80,B=70,C=60,D=50
+
+SERVICE_MAX_BODY = 256 * 1024 * 1024                                # Largest upload accepted, in bytes
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+                500: 'Internal Server Error'}
+
+# Grade arrays of names and scores without printing or plotting
+# Returns the grades in input order with the grade counts and score statistics
+@traced
+def grade_scores(names, scores, method, grade_percentages):
+
+    scores = np.asarray(scores, dtype=np.float64)
+    score_stats = RunningStats().update(scores)
+
+    if method == 'absolute':
+        grades = absolute_grades(scores, grade_percentages)
+        movements = None
+
+    else:
+        grades = relative_grades(scores, grade_percentages)
+        movements = None
+
+        # Z-score grading moves students away from their relative grades, as in apply_z_score_grading
+        if method == 'z-score':
+            z_scores = (scores - score_stats.mean) / score_stats.std(ddof=1)
+            relative = grades
+            grades = absolute_grades(z_scores, z_score_policy())
+            movements = grade_movements(names, relative, grades)
+
+    grade_counts = pd.Series(grades).value_counts(sort=False)
+
+    result = {
+        "method": method,
+        "names": list(names),
+        "grades": np.asarray(grades, dtype=object).tolist(),
+        "grade_counts": {str(grade): int(count) for grade, count in grade_counts.items()},
+        "statistics": score_stats.as_dict(ddof=1)
+    }
+    if movements is not None:
+        result["moved"] = movements.to_dict(orient='records')
+
+    return result
+
+# Replace NaN and NumPy numbers so the result is plain JSON
+def json_ready(value):
+
+    if isinstance(value, dict):
+        return {key: json_ready(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_ready(item) for item in value]
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+
+    return value
+
+# Parse and grade one /grade request, runs in a worker process
+# Returns the HTTP status and the JSON response body
+def handle_grade_request(body, content_type, query):
+
+    try:
+        if content_type.startswith('text/csv'):
+            upload = pd.read_csv(io.BytesIO(body))
+            if 'Name' not in upload.columns or 'Score' not in upload.columns:
+                raise ValueError("The CSV must contain 'Name' and 'Score' columns.")
+
+            method = query.get('method')
+            grade_percentages = parse_grade_mapping(query.get('grade_percentages', ''))
+            names = upload['Name'].astype(str).tolist()
+            scores = upload['Score'].to_numpy(dtype=np.float64)
+
+        else:
+            payload = json.loads(body)
+            if not isinstance(payload, dict) or 'scores' not in payload:
+                raise ValueError("The JSON body must be an object with a 'scores' array.")
+
+            method = payload.get('method')
+            grade_percentages = payload.get('grade_percentages', {})
+            if not isinstance(grade_percentages, dict):
+                raise ValueError("'grade_percentages' must be an object of grades, e.g. {\"A\": 20, \"B\": 30}.")
+            scores = np.asarray(payload['scores'], dtype=np.float64)
+            names = payload.get('names') or [f"Student {i + 1}" for i in range(len(scores))]
+
+            if len(names) != len(scores):
+                raise ValueError("'names' and 'scores' must have the same length.")
+
+        if method not in BATCH_METHODS:
+            raise ValueError(f"'method' must be one of: {', '.join(BATCH_METHODS)}")
+
+        result = grade_scores(names, scores, method, complete_grade_scale(method, grade_percentages))
+        return 200, json.dumps(json_ready(result)).encode()
+
+    except (ValueError, TypeError, pd.errors.ParserError) as e:
+        return 400, json.dumps({"error": str(e)}).encode()
+
+# Send one HTTP response
+async def send_response(writer, status, body, keep_alive):
+
+    headers = (f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+               f"Content-Type: application/json\r\n"
+               f"Content-Length: {len(body)}\r\n"
+               f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+
+    writer.write(headers.encode() + body)
+    await writer.drain()
+
+# Serve the requests of one connection, connections are kept alive between requests like HTTP/1.1 expects
+async def serve_connection(reader, writer, pool):
+
+    loop = asyncio.get_running_loop()
+
+    try:
         while True:
-            if save == 'y':
-                clear_terminal()
-                print_coloured_line("Save File Creation", "green")
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                break
 
-                if grading_choice == '1':
-                    while True:
-                        clear_terminal()
-                        print_coloured_line("Save File Creation", "green")
+            request_line, *header_lines = head.decode('latin-1').split("\r\n")
+            try:
+                http_method, target, version = request_line.split(" ")
+            except ValueError:
+                await send_response(writer, 400, b'{"error": "Malformed request line."}', False)
+                break
 
-                        print("1. Save grades with your parameters")
-                        print("2. Save grades fitted to a normal distribution\n")
+            headers = {}
+            for line in header_lines:
+                if ":" in line:
+                    key, value = line.split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
 
-                        save_choice = input(
-                            "Would you like to save the grades with your parameters or the grades fitted to a normal distribution? ").strip()
+            keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+            content_length = headers.get('content-length', '') or '0'
+            if not (content_length.isascii() and content_length.isdigit()):
+                await send_response(writer, 400, b'{"error": "Invalid Content-Length."}', False)
+                break
 
-                        if save_choice == '1':
-                            print("\nSaving grades to CSV file with your parameters...\n")
-                            save_grades_to_csv(original_data, "graded_students_relative.csv")
-                            enter_to_continue()
-                            break
-                        
-                        elif save_choice == '2':
-                            print("\nSaving grades to CSV file (fitted to normal distribution)...\n")
-                            save_grades_to_csv(adjusted_data, "graded_students_z_score.csv")
-                            enter_to_continue()
-                            break
-                        
-                        else:
-                            clear_terminal()
-                            print_coloured_line("Save File Creation", "green")
-                            print(colored("\nInvalid Option. Please try again.", "red"))
-                            enter_to_continue()
-                    
-                    break
+            content_length = int(content_length)
+            if content_length > SERVICE_MAX_BODY:
+                await send_response(writer, 413, b'{"error": "Upload too large."}', False)
+                break
 
-                elif grading_choice == '2':
-                    print("\nSaving grades to CSV file...\n")
-                    save_grades_to_csv(student_data)
-                    enter_to_continue()
-                    break
-                
-                else:
-                    print("\nInvalid grading choice. Please try again.")
-                    break
-                
-            elif save == 'n':
-                print("\nGrades were not saved.")
+            try:
+                body = await reader.readexactly(content_length) if content_length else b""
+            except asyncio.IncompleteReadError:
+                await send_response(writer, 400, b'{"error": "Body shorter than Content-Length."}', False)
                 break
-            
+            path, _, query_string = target.partition("?")
+            query = dict(urllib.parse.parse_qsl(query_string))
+
+            if path == "/health":
+                status, response = (200, b'{"status": "ok"}') if http_method == "GET" else (405, b'{"error": "Use GET."}')
+
+            elif path == "/grade":
+                if http_method != "POST":
+                    status, response = 405, b'{"error": "Use POST."}'
+                else:
+                    # Parsing and grading happen in the pool, the event loop only moves bytes
+                    try:
+                        status, response = await loop.run_in_executor(
+                            pool, handle_grade_request, body, headers.get('content-type', 'application/json'), query)
+                    except Exception as e:
+                        status, response = 500, json.dumps({"error": f"Grading failed: {e}"}).encode()
+
             else:
-                print(colored("Invalid input. Please enter 'y' or 'n'.", "red"))
-                save = input("Would you like to save the grades in a CSV? (y/n): ").strip()
+                status, response = 404, b'{"error": "Not found."}'
 
-        clear_terminal()
-        print_coloured_line("Restart or Exit", "yellow")
-        restart_choice = input("\nWould you like to process another file? (y/n): ").strip().lower()
+            await send_response(writer, status, response, keep_alive)
+            if not keep_alive:
+                break
 
-        if restart_choice != 'y':
-            print(colored("Exiting the program. Goodbye!", "green"))
-            break                                                                                               # Exit the loop and program
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
 
-        else:
-            clear_terminal()
-            print_coloured_line("Restarting" , "green")
-            time.sleep(1)
-            clear_terminal()
-                
+    finally:
+        writer.close()
+        with contextlib.suppress(ConnectionError):
+            await writer.wait_closed()
+
+# Run the grading service until interrupted
+async def run_service(host, port, workers=None):
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        server = await asyncio.start_server(
+            lambda reader, writer: serve_connection(reader, writer, pool), host, port, limit=1024 * 1024)
 
+        # Stop cleanly on Ctrl+C or SIGTERM so the worker processes are shut down with the service
+        loop = asyncio.get_running_loop()
+        stopping = loop.create_future()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, lambda: stopping.done() or stopping.set_result(None))
+            except NotImplementedError:                                     # Signal handlers are not available on Windows
+                pass
+
+        print(colored(f"Grading service listening on http://{host}:{port}", "green"))
+        async with server:
+            await stopping
+
+        print(colored("Grading service stopped.", "green"))
 
 
 if __name__ == "__main__":
-    main()
+    # Any command line arguments switch to batch grading, otherwise show the interactive menu
+    try:
+        if len(sys.argv) > 1:
+            sys.exit(run_batch(sys.argv[1:]))
+        else:
+            main()
+    finally:
+        save_trace()
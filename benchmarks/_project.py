@@ -0,0 +1,24 @@
+# Loads DS-221_Project.py as a module for the benchmark scripts
+# The file name contains a hyphen, so it cannot be imported with a normal import statement
+
+import importlib.util
+import os
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_FILE = os.path.join(PROJECT_DIR, 'DS-221_Project.py')
+MODULE_NAME = 'ds221_project'
+
+
+# Import the project file once and register it so worker processes can find its functions
+def load_project():
+
+    if MODULE_NAME in sys.modules:
+        return sys.modules[MODULE_NAME]
+
+    spec = importlib.util.spec_from_file_location(MODULE_NAME, PROJECT_FILE)
+    project = importlib.util.module_from_spec(spec)
+    sys.modules[MODULE_NAME] = project
+    spec.loader.exec_module(project)
+
+    return project
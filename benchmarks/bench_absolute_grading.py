@@ -0,0 +1,61 @@
+# Compares the old per-row lambda absolute grading with the vectorized absolute_grade_codes kernel
+# Usage: python benchmarks/bench_absolute_grading.py [--sizes 1000 100000 10000000] [--repeat 3]
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from _project import load_project
+
+project = load_project()
+
+# Thresholds as main() builds them, F is D - 1
+GRADE_PERCENTAGES = {'A': 80.0, 'B': 70.0, 'C': 60.0, 'D': 50.0, 'F': 49.0}
+
+
+# The grading code calculate_absolute_grades used before the vectorized kernel
+def legacy_absolute_grades(scores, grade_percentages):
+    sorted_grades = sorted(grade_percentages.items(), key=lambda x: x[1], reverse=True)
+    return scores.apply(
+        lambda score: next((grade for grade, threshold in sorted_grades if score >= threshold), 'F')
+    )
+
+
+# Best wall time of a few runs
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 10_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    print(f"{'rows':>12} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>9}")
+    for size in args.sizes:
+        # Rounded scores so plenty of students land exactly on a threshold
+        scores = pd.Series(np.clip(rng.normal(65, 15, size), 0, 100).round(1))
+
+        # The legacy path is very slow on big inputs, one run is enough there
+        legacy_repeat = 1 if size >= 1_000_000 else args.repeat
+        legacy_time, legacy = best_time(lambda: legacy_absolute_grades(scores, GRADE_PERCENTAGES), legacy_repeat)
+        vector_time, vectorized = best_time(lambda: project.absolute_grades(scores, GRADE_PERCENTAGES), args.repeat)
+
+        if not (legacy.to_numpy() == vectorized.astype(object).to_numpy()).all():
+            raise SystemExit(f"Vectorized grades differ from the legacy grades at {size} rows")
+
+        print(f"{size:>12} {legacy_time:>12.4f} {vector_time:>15.4f} {legacy_time / vector_time:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
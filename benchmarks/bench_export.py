@@ -0,0 +1,95 @@
+# Write throughput of every export format, compared with the old slice-then-to_csv save
+# Formats whose optional package is missing are skipped
+# Usage: python benchmarks/bench_export.py [--rows 1000000] [--repeat 3]
+
+import argparse
+import importlib.util
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from _project import load_project
+
+project = load_project()
+
+
+# The save path used before the export layer: copy the columns, then write CSV
+def legacy_save(student_data, filename):
+    student_data[['Name', 'Score', 'Grade']].to_csv(filename, index=False)
+
+
+# Best wall time of a few runs
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    project.REPORT_MODE = "summary"
+    rng = np.random.default_rng(0)
+
+    student_data = pd.DataFrame({
+        'Name': [f"Student {i + 1}" for i in range(args.rows)],
+        'Score': np.clip(rng.normal(70, 12, args.rows), 0, 100)
+    })
+    student_data['Grade'] = project.relative_grades(student_data['Score'], {'A': 20, 'B': 30, 'C': 30, 'D': 15, 'F': 5})
+    z_grades = project.absolute_grades((student_data['Score'] - student_data['Score'].mean()) / student_data['Score'].std(),
+                                       project.z_score_policy())
+    absolute = project.absolute_grades(student_data['Score'], {'A': 80, 'B': 70, 'C': 60, 'D': 50, 'F': 49})
+
+    print(f"{args.rows} rows")
+    print(f"{'format':>22} {'seconds':>9} {'rows/s':>12} {'MB/s':>8} {'size MB':>8}")
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        def report(label, filename, function):
+            elapsed = best_time(function, args.repeat)
+            size_mb = os.path.getsize(filename) / 1e6
+            print(f"{label:>22} {elapsed:>9.3f} {args.rows / elapsed:>12.0f} {size_mb / elapsed:>8.1f} {size_mb:>8.1f}")
+
+        legacy_filename = os.path.join(directory, 'legacy.csv')
+        report('legacy csv', legacy_filename, lambda: legacy_save(student_data, legacy_filename))
+
+        for file_format, (extension, _, required_package) in project.EXPORT_FORMATS.items():
+            if required_package and importlib.util.find_spec(required_package) is None:
+                print(f"{file_format:>22} skipped, needs {required_package}")
+                continue
+
+            filename = os.path.join(directory, f"grades{extension}")
+            report(file_format, filename, lambda: project.write_export_frame({
+                'Name': student_data['Name'],
+                'Score': student_data['Score'],
+                'Grade': student_data['Grade']
+            }, filename, file_format))
+
+        # Three gradings in one file against three separate files
+        separate_filename = os.path.join(directory, 'separate.csv')
+        report('3 separate csv', separate_filename, lambda: [
+            legacy_save(student_data.assign(Grade=grades), separate_filename)
+            for grades in (student_data['Grade'], z_grades, absolute)
+        ])
+
+        variants_filename = os.path.join(directory, 'variants.csv')
+        report('3 variants, one csv', variants_filename, lambda: project.write_export_frame({
+            'Name': student_data['Name'],
+            'Score': student_data['Score'],
+            'Grade (Relative)': student_data['Grade'],
+            'Grade (Z-Score)': z_grades,
+            'Grade (Absolute)': absolute
+        }, variants_filename, 'csv'))
+
+
+if __name__ == '__main__':
+    main()
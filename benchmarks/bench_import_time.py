@@ -0,0 +1,84 @@
+# Measures how long DS-221_Project.py takes to import, using python -X importtime
+# Fails (exit code 1) when the median import time goes over the budget in import_time_budget.json
+# or when a module that should only load on demand (matplotlib, seaborn, scipy) is imported at startup
+# Usage: python benchmarks/bench_import_time.py [--runs 5] [--update]
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BUDGET_FILE = os.path.join(BENCHMARK_DIR, 'import_time_budget.json')
+
+# Imports the project the same way the other benchmarks do, without starting the menu
+IMPORT_PROJECT = f"import sys; sys.path.insert(0, {BENCHMARK_DIR!r}); import _project; _project.load_project()"
+
+
+# One import of the project in a fresh interpreter
+# Returns the total import time in milliseconds and the set of top-level packages imported
+def measure_import():
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', IMPORT_PROJECT],
+                            capture_output=True, text=True, check=True)
+
+    total_us = 0
+    packages = set()
+
+    # Lines look like "import time:       self [us] |  cumulative | imported package"
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        self_time, _, package = line[len('import time:'):].split('|')
+        total_us += int(self_time)
+        packages.add(package.strip().split('.')[0])
+
+    return total_us / 1000, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--update', action='store_true', help="Record the measured time in the budget file")
+    args = parser.parse_args()
+
+    with open(BUDGET_FILE) as budget_file:
+        budget = json.load(budget_file)
+
+    times = []
+    packages = set()
+    for _ in range(args.runs):
+        elapsed_ms, run_packages = measure_import()
+        times.append(elapsed_ms)
+        packages |= run_packages
+
+    median_ms = statistics.median(times)
+    print(f"Import time: median {median_ms:.1f} ms, min {min(times):.1f} ms, max {max(times):.1f} ms over {args.runs} runs")
+    print(f"Budget: {budget['budget_ms']} ms (recorded {budget['recorded_ms']} ms)")
+
+    if args.update:
+        budget['recorded_ms'] = round(median_ms)
+        with open(BUDGET_FILE, 'w') as budget_file:
+            json.dump(budget, budget_file, indent=4)
+            budget_file.write('\n')
+        print("Recorded the new import time.")
+
+    failures = []
+
+    eager_modules = sorted(set(budget['forbidden_modules']) & packages)
+    if eager_modules:
+        failures.append(f"Imported at startup: {', '.join(eager_modules)}")
+
+    if median_ms > budget['budget_ms']:
+        failures.append(f"Import time {median_ms:.1f} ms is over the {budget['budget_ms']} ms budget")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# Measures how the multi-course pipeline scales with the number of worker processes
+# Usage: python benchmarks/bench_pipeline.py [--courses 32] [--students 200000] [--workers 1 2 4 8]
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from _project import load_project
+
+project = load_project()
+
+GRADE_PERCENTAGES = {'A': 20.0, 'B': 30.0, 'C': 30.0, 'D': 15.0, 'F': 5.0}
+
+
+# Write synthetic course files with normally distributed scores
+def write_courses(directory, courses, students):
+    rng = np.random.default_rng(0)
+    for course in range(courses):
+        pd.DataFrame({
+            'Name': [f"Student {i + 1}" for i in range(students)],
+            'Score': np.clip(rng.normal(70, 12, students), 0, 100)
+        }).to_csv(os.path.join(directory, f"course_{course:03d}.csv"), index=False)
+
+
+def main():
+    cores = os.cpu_count() or 1
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--courses', type=int, default=32)
+    parser.add_argument('--students', type=int, default=200_000)
+    parser.add_argument('--method', choices=project.BATCH_METHODS, default='relative')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1))))
+    args = parser.parse_args()
+
+    project.HEADLESS = True
+
+    with tempfile.TemporaryDirectory() as directory:
+        input_dir = os.path.join(directory, 'courses')
+        output_dir = os.path.join(directory, 'graded')
+        os.makedirs(input_dir)
+        os.makedirs(output_dir)
+
+        write_courses(input_dir, args.courses, args.students)
+        filenames = project.expand_input_paths([input_dir])
+
+        print(f"{args.courses} courses x {args.students} students, {cores} cores available")
+        print(f"{'workers':>8} {'seconds':>10} {'speedup':>9} {'courses/s':>10}")
+
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            summaries = project.run_pipeline(filenames, args.method, GRADE_PERCENTAGES, output_dir, workers=workers)
+            elapsed = time.perf_counter() - start
+
+            if any(summary['status'] != 'ok' for summary in summaries):
+                raise SystemExit("Some courses failed to grade")
+
+            baseline = baseline or elapsed
+            print(f"{workers:>8} {elapsed:>10.3f} {baseline / elapsed:>8.2f}x {len(filenames) / elapsed:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+# Times every grading and I/O stage on synthetic cohorts and stores the results as JSON
+# Each run records the commit it measured, so results of two commits can be compared with --compare
+# Usage: python benchmarks/bench_suite.py [--sizes 100 1000 ...] [--distributions normal ties] [--repeat 3]
+#                                         [--output results.json] [--compare baseline.json] [--tolerance 1.25]
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from _project import PROJECT_DIR, load_project
+from cohorts import DISTRIBUTIONS, write_cohort
+
+project = load_project()
+
+DEFAULT_SIZES = [100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+RESULTS_DIR = os.path.join(PROJECT_DIR, 'benchmarks', 'results')
+
+GRADE_PERCENTAGES = {'A': 20.0, 'B': 30.0, 'C': 30.0, 'D': 15.0, 'F': 5.0}
+GRADE_THRESHOLDS = {'A': 80.0, 'B': 70.0, 'C': 60.0, 'D': 50.0, 'F': 49.0}
+
+
+# Commit the numbers belong to, marked dirty when the tree has uncommitted changes
+def commit_info():
+
+    def git(*arguments):
+        return subprocess.run(['git', *arguments], cwd=PROJECT_DIR, capture_output=True, text=True).stdout.strip()
+
+    try:
+        return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+    except OSError:
+        return {'commit': None, 'dirty': None}
+
+
+# Wall times of a stage, setup runs before every repeat and is not timed
+# Whatever the stage prints is kept out of the benchmark output
+def time_stage(stage, repeat, setup=None):
+
+    times = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            stage(argument)
+            times.append(time.perf_counter() - start)
+
+    return times
+
+
+# Every stage on one cohort file, returns {stage: [seconds, ...]}
+def run_cohort(filename, work_dir, repeat):
+
+    results = {}
+
+    project.SCORE_CACHE_DIR = None
+    results['read_file'] = time_stage(lambda _: project.read_file(filename), repeat)
+
+    project.SCORE_CACHE_DIR = os.path.join(work_dir, 'cache')
+    with contextlib.redirect_stdout(io.StringIO()):
+        student_data = project.read_file(filename)                   # Warms the cache
+    results['read_file_cached'] = time_stage(lambda _: project.read_file(filename), repeat)
+    student_data = student_data[['Name', 'Score']].copy()
+
+    project.PLOT_MODE = "none"
+    fresh = student_data.copy
+    results['relative_grading'] = time_stage(lambda data: project.calculate_relative_grades(data, GRADE_PERCENTAGES), repeat, fresh)
+    results['absolute_grading'] = time_stage(lambda data: project.calculate_absolute_grades(data, GRADE_THRESHOLDS), repeat, fresh)
+
+    # The same grading again, answered from the grade memo in memory
+    project.GRADE_MEMO_SIZE = 8
+    with contextlib.redirect_stdout(io.StringIO()):
+        project.calculate_relative_grades(student_data.copy(), GRADE_PERCENTAGES)
+    results['relative_grading_hit'] = time_stage(lambda data: project.calculate_relative_grades(data, GRADE_PERCENTAGES), repeat, fresh)
+    project.GRADE_MEMO_SIZE = 0
+    project.GRADE_MEMO.clear()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        relative_data = project.calculate_relative_grades(student_data.copy(), GRADE_PERCENTAGES)
+    results['z_score_grading'] = time_stage(lambda data: project.apply_z_score_grading(data), repeat, relative_data.copy)
+
+    scores = student_data['Score'].to_numpy()
+    results['running_stats'] = time_stage(lambda _: project.RunningStats().update(scores), repeat)
+    results['score_summary'] = time_stage(lambda _: project.score_summary(scores), repeat, project.SUMMARY_CACHE.clear)
+
+    output_filename = os.path.join(work_dir, 'graded.csv')
+    results['save_grades_to_csv'] = time_stage(lambda _: project.save_grades_to_csv(relative_data, output_filename), repeat)
+
+    # Plots are saved to files, the summary cache is cleared so each repeat summarises the scores again
+    project.PLOT_MODE, project.PLOT_DIR = "file", os.path.join(work_dir, 'plots')
+
+    def render_plots(_):
+        project.plot_normal_curve(relative_data)
+        project.plot_grade_distribution(relative_data)
+        project.plot_score_distribution(relative_data)
+        project.plot_boxplot(relative_data)
+        project.plot_z_score_distribution(relative_data)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        render_plots(None)                                          # Imports matplotlib outside the timing
+    results['plot_rendering'] = time_stage(render_plots, repeat, project.SUMMARY_CACHE.clear)
+    project.PLOT_MODE = "none"
+
+    return results
+
+
+# Stages that got slower than the baseline by more than the tolerance
+def compare_results(results, baseline, tolerance):
+
+    baseline_times = {
+        (entry['distribution'], entry['rows'], entry['stage']): entry['seconds_median'] for entry in baseline['results']
+    }
+
+    print(f"\nCompared with {baseline['commit'][:10] if baseline.get('commit') else 'baseline'}:")
+    print(f"{'distribution':<10} {'rows':>10} {'stage':<20} {'before':>10} {'after':>10} {'ratio':>7}")
+
+    regressions = []
+    for entry in results:
+        key = (entry['distribution'], entry['rows'], entry['stage'])
+        if key not in baseline_times:
+            continue
+
+        ratio = entry['seconds_median'] / baseline_times[key]
+        flag = "  slower" if ratio > tolerance else ""
+        print(f"{key[0]:<10} {key[1]:>10} {key[2]:<20} {baseline_times[key]:>10.4f} {entry['seconds_median']:>10.4f} {ratio:>6.2f}x{flag}")
+
+        if ratio > tolerance:
+            regressions.append(key)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--distributions', nargs='+', choices=DISTRIBUTIONS, default=DISTRIBUTIONS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="JSON file for the results (default: benchmarks/results/suite_<commit>.json)")
+    parser.add_argument('--compare', help="Results of an earlier run to compare with")
+    parser.add_argument('--tolerance', type=float, default=1.25, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    project.HEADLESS = True
+    project.REPORT_MODE = "summary"
+    project.GRADE_MEMO_DIR, project.GRADE_MEMO_SIZE = None, 0             # Every repeat grades again
+
+    run = {
+        **commit_info(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'repeat': args.repeat,
+        'results': []
+    }
+
+    print(f"{'distribution':<10} {'rows':>10} {'stage':<20} {'median s':>10} {'min s':>10} {'rows/s':>12}")
+
+    for distribution in args.distributions:
+        for rows in args.sizes:
+            work_dir = tempfile.mkdtemp(prefix='bench_suite_')
+            try:
+                filename = os.path.join(work_dir, f"{distribution}_{rows}.csv")
+                write_cohort(filename, distribution, rows)
+
+                for stage, times in run_cohort(filename, work_dir, args.repeat).items():
+                    median = statistics.median(times)
+                    run['results'].append({
+                        'distribution': distribution,
+                        'rows': rows,
+                        'stage': stage,
+                        'seconds_median': median,
+                        'seconds_min': min(times),
+                        'seconds': times
+                    })
+                    print(f"{distribution:<10} {rows:>10} {stage:<20} {median:>10.4f} {min(times):>10.4f} {rows / median:>12.0f}")
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"suite_{(run['commit'] or 'unknown')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(run, file, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+        regressions = compare_results(run['results'], baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} stages are more than {args.tolerance:.2f}x slower than the baseline.")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
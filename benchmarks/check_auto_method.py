@@ -0,0 +1,61 @@
+# How often --method auto picks z-score grading for normal whole-number scores and for skewed scores, at cohort sizes
+# on both sides of NORMALITY_TEST_LIMIT and DIAGNOSTICS_SAMPLE
+# Fails when normal scores get z-score grading less often than --min-share at any size,
+# or skewed scores of a large cohort get it more often than 1 - --min-share
+# Usage: python benchmarks/check_auto_method.py [--sizes 20 100 101 2000 5001 ...] [--trials 40] [--min-share 0.75]
+
+import argparse
+import contextlib
+import io
+
+import numpy as np
+
+from _project import load_project
+from cohorts import generate_scores
+
+project = load_project()
+
+DEFAULT_SIZES = [20, 50, 100, 101, 200, 500, 1_000, 2_000, 4_000, 4_999, 5_001, 20_000, 200_000]
+SKEWED_MIN_SIZE = 500                                               # Smaller skewed cohorts may pass for normal
+
+
+# Share of trials graded with z-score grading
+def z_score_share(distribution, size, trials, rng):
+
+    chosen = 0
+    for _ in range(trials):
+        scores = np.round(generate_scores(distribution, size, rng))
+        with contextlib.redirect_stdout(io.StringIO()):
+            chosen += project.choose_grading_method(scores) == 'z-score'
+
+    return chosen / trials
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--trials', type=int, default=40)
+    parser.add_argument('--min-share', type=float, default=0.75)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    failures = []
+
+    print(f"{'students':>10} {'normal':>8} {'skewed':>8}   share graded by z-score")
+    for size in args.sizes:
+        normal = z_score_share('normal', size, args.trials, rng)
+        skewed = z_score_share('skewed', size, args.trials, rng)
+        print(f"{size:>10} {normal:>8.0%} {skewed:>8.0%}")
+
+        if normal < args.min_share:
+            failures.append(f"normal scores of {size} students")
+        if size >= SKEWED_MIN_SIZE and skewed > 1 - args.min_share:
+            failures.append(f"skewed scores of {size} students")
+
+    if failures:
+        raise SystemExit("Wrong method too often for " + ", ".join(failures))
+
+
+if __name__ == '__main__':
+    main()
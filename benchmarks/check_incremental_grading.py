@@ -0,0 +1,82 @@
+# Random inserts, corrections and removals through IncrementalGrader, checked against grading the whole cohort again
+# Whole-number scores are used so plenty of students land exactly on a z-score or band cutoff
+# Usage: python benchmarks/check_incremental_grading.py [--trials 300] [--changes 30] [--seed 0]
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from _project import load_project
+
+project = load_project()
+
+GRADE_PERCENTAGES = {
+    'relative': {'A': 20, 'B': 30, 'C': 30, 'D': 15, 'F': 5},
+    'absolute': {'A': 80, 'B': 70, 'C': 60, 'D': 50, 'F': 49},
+    'z-score': {'A': 20, 'B': 30, 'C': 30, 'D': 15, 'F': 5}
+}
+
+
+# Grades of the whole cohort from the grading functions
+def full_grades(scores, method):
+
+    if method == 'relative':
+        return project.relative_grades(scores, GRADE_PERCENTAGES[method]).astype(object)
+    if method == 'absolute':
+        return project.absolute_grades(scores, GRADE_PERCENTAGES[method]).astype(object)
+
+    grading = project.z_score_grading(scores)
+    return pd.Series(np.asarray(grading['categories'], dtype=object)[grading['codes']])
+
+
+# One random change, returns a description of it
+def random_change(grader, rng, next_name):
+
+    names = list(grader.scores)
+    action = rng.choice(['insert', 'update', 'delete'] if len(names) > 3 else ['insert', 'update'])
+    score = float(rng.integers(40, 100))
+
+    if action == 'insert':
+        grader.insert(next_name, score)
+        return f"insert {next_name} {score:g}"
+
+    name = names[rng.integers(len(names))]
+    if action == 'update':
+        grader.update(name, score)
+        return f"update {name} {score:g}"
+
+    grader.delete(name)
+    return f"delete {name}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--trials', type=int, default=300)
+    parser.add_argument('--changes', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    for method in GRADE_PERCENTAGES:
+        for trial in range(args.trials):
+            students = int(rng.integers(2, 40))
+            names = [f"Student {i + 1}" for i in range(students)]
+            grader = project.IncrementalGrader(names, rng.integers(40, 100, students).astype(float),
+                                               method, GRADE_PERCENTAGES[method])
+
+            changes = []
+            for change in range(args.changes):
+                changes.append(random_change(grader, rng, f"New {change + 1}"))
+
+                table = grader.grade_table()
+                expected = full_grades(table['Score'], method)
+                if not (table['Grade'].to_numpy() == expected.to_numpy()).all():
+                    raise SystemExit(f"{method} trial {trial}: grades differ from a full regrade after {'; '.join(changes)}")
+
+        print(f"{method:>9}: {args.trials} trials of {args.changes} changes match a full regrade")
+
+
+if __name__ == '__main__':
+    main()
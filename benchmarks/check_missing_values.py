@@ -0,0 +1,67 @@
+# Grades a file with a blank score and a blank name through every grading path, in memory and in batch mode
+# Missing values must be listed as nan in the reports and never stop a grading
+# Usage: python benchmarks/check_missing_values.py
+
+import contextlib
+import io
+import os
+import tempfile
+
+import pandas as pd
+
+from _project import load_project
+
+project = load_project()
+
+GRADE_PERCENTAGES = {'A': 20.0, 'B': 30.0, 'C': 30.0, 'D': 15.0, 'F': 5.0}
+GRADE_THRESHOLDS = {'A': 80.0, 'B': 70.0, 'C': 60.0, 'D': 50.0, 'F': 49.0}
+
+SCORE_FILE = """Name,Score
+Student 1,92.5
+Student 2,
+,71
+Student 4,64
+Student 5,55.5
+Student 6,83
+"""
+
+
+def main():
+
+    project.HEADLESS = True
+    project.PLOT_MODE = "none"
+    project.REPORT_MODE = "full"
+    project.SCORE_CACHE_DIR = None
+    project.GRADE_MEMO_DIR, project.GRADE_MEMO_SIZE = None, 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'blank_score.csv')
+        with open(filename, 'w') as score_file:
+            score_file.write(SCORE_FILE)
+
+        report = io.StringIO()
+        with contextlib.redirect_stdout(report):
+            student_data = project.read_file(filename)
+            relative_data = project.calculate_relative_grades(student_data.copy(), GRADE_PERCENTAGES)
+            absolute_data = project.calculate_absolute_grades(student_data.copy(), GRADE_THRESHOLDS)
+            z_score_data = project.apply_z_score_grading(relative_data.copy())[0] if relative_data is not None else None
+
+        for method, result in [('relative', relative_data), ('absolute', absolute_data), ('z-score', z_score_data)]:
+            if result is None:
+                raise SystemExit(f"{method} grading failed on a file with a blank score:\n{report.getvalue()}")
+
+        if "Student 2: nan -> Grade" not in report.getvalue() or "nan: 71" not in report.getvalue():
+            raise SystemExit(f"Missing values are not listed as nan:\n{report.getvalue()}")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            exit_codes = [project.run_batch([filename, '--method', method, '--percentages', 'A=20,B=30,C=30,D=15,F=5',
+                                             '--output-dir', os.path.join(directory, 'graded'), '--no-cache', '--no-memo'])
+                          for method in ('relative', 'z-score')]
+        if any(exit_codes):
+            raise SystemExit(f"Batch grading failed on a file with a blank score (exit codes {exit_codes})")
+
+    print("A blank score and a blank name are graded and listed as nan by every grading path")
+
+
+if __name__ == '__main__':
+    main()
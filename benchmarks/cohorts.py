@@ -0,0 +1,40 @@
+# Synthetic cohorts for the benchmarks
+# "normal" follows student_data_normal.csv (mean 75, standard deviation 10), the others stress different paths:
+#   skewed   most students near the top with a long tail of low scores
+#   bimodal  two groups of students, one passing comfortably and one struggling
+#   ties     whole scores rounded to multiples of 5, so many students share a score
+
+import numpy as np
+import pandas as pd
+
+DISTRIBUTIONS = ['normal', 'skewed', 'bimodal', 'ties']
+
+
+def generate_scores(distribution, rows, rng):
+
+    if distribution == 'normal':
+        scores = rng.normal(75, 10, rows)
+    elif distribution == 'skewed':
+        scores = 100 - rng.gamma(2.0, 7.0, rows)
+    elif distribution == 'bimodal':
+        upper = rng.random(rows) < 0.6
+        scores = np.where(upper, rng.normal(80, 6, rows), rng.normal(50, 8, rows))
+    elif distribution == 'ties':
+        scores = np.round(rng.normal(70, 12, rows) / 5) * 5
+    else:
+        raise ValueError(f"Unknown distribution '{distribution}', use one of: {', '.join(DISTRIBUTIONS)}")
+
+    return np.clip(scores, 0, 100)
+
+
+# Name and Score table of a cohort, the same seed always gives the same cohort
+def generate_cohort(distribution, rows, seed=0):
+
+    rng = np.random.default_rng(seed)
+    names = 'Student ' + pd.Series(np.arange(1, rows + 1)).astype(str)
+
+    return pd.DataFrame({'Name': names, 'Score': generate_scores(distribution, rows, rng)})
+
+
+def write_cohort(filename, distribution, rows, seed=0):
+    generate_cohort(distribution, rows, seed).to_csv(filename, index=False)
@@ -0,0 +1,129 @@
+# Load test for the grading service: requests per second and latency percentiles
+# Starts a local service on a free port unless --url points at one that is already running
+# Usage: python benchmarks/load_test_service.py [--clients 16] [--requests 50] [--students 1000] [--url http://127.0.0.1:8221]
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.parse
+
+import numpy as np
+
+from _project import PROJECT_FILE
+
+
+# A JSON grading request for a synthetic cohort
+def make_request_body(students, method):
+    rng = np.random.default_rng(0)
+    return json.dumps({
+        'method': method,
+        'grade_percentages': {'A': 20, 'B': 30, 'C': 30, 'D': 15, 'F': 5},
+        'scores': np.clip(rng.normal(70, 12, students), 0, 100).round(2).tolist()
+    }).encode()
+
+
+# One client sending requests back to back over a kept-alive connection, returns the latency of each request
+async def run_client(host, port, request, count):
+    reader, writer = await asyncio.open_connection(host, port)
+    latencies = []
+
+    try:
+        for _ in range(count):
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+
+            head = await reader.readuntil(b"\r\n\r\n")
+            status = int(head.split(b" ", 2)[1])
+            length = int(next(line.split(b":", 1)[1] for line in head.split(b"\r\n")
+                              if line.lower().startswith(b"content-length")))
+            await reader.readexactly(length)
+            if status != 200:
+                raise RuntimeError(f"Service answered {status}")
+
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+    return latencies
+
+
+async def run_load(host, port, request, clients, requests_per_client):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_client(host, port, request, requests_per_client) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    return elapsed, np.concatenate([np.asarray(latencies) for latencies in results])
+
+
+# Wait until the service answers, or give up
+def wait_for_service(host, port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit("The grading service did not start")
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', help="Service to test, a local one is started when left out")
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=50, help="Requests sent by each client")
+    parser.add_argument('--students', type=int, default=1000, help="Scores in each request")
+    parser.add_argument('--method', default='relative')
+    parser.add_argument('--workers', type=int, help="Worker processes of the local service")
+    args = parser.parse_args()
+
+    service = None
+    if args.url:
+        url = urllib.parse.urlparse(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = '127.0.0.1', free_port()
+        command = [sys.executable, PROJECT_FILE, '--serve', '--host', host, '--port', str(port)]
+        if args.workers:
+            command += ['--workers', str(args.workers)]
+        service = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+
+    try:
+        wait_for_service(host, port)
+
+        body = make_request_body(args.students, args.method)
+        request = (f"POST /grade HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                   f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+
+        # Warm up the worker processes before measuring
+        asyncio.run(run_load(host, port, request, min(args.clients, os.cpu_count() or 1), 2))
+        elapsed, latencies = asyncio.run(run_load(host, port, request, args.clients, args.requests))
+
+        total = len(latencies)
+        print(f"{total} requests of {args.students} scores from {args.clients} clients in {elapsed:.2f} s")
+        print(f"Throughput: {total / elapsed:.1f} requests/s")
+        print(f"Latency: p50 {np.percentile(latencies, 50) * 1000:.1f} ms, "
+              f"p90 {np.percentile(latencies, 90) * 1000:.1f} ms, "
+              f"p99 {np.percentile(latencies, 99) * 1000:.1f} ms, "
+              f"max {latencies.max() * 1000:.1f} ms")
+
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
+
+
+if __name__ == '__main__':
+    main()